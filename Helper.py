@@ -2,21 +2,392 @@ import os
 import pathlib
 import re
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import threading
 import time
 import json
+import gzip
 import logging
+import shutil
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import numpy as np
 import pandas as pd
 from pandas import DataFrame
+import match_store
+import match_log
+import storage
+import timeline_store
+import tracing
+
+try:
+    import orjson # Optional, decodes the match json several times faster than the json module
+    json_loads = orjson.loads
+except ImportError:
+    orjson = None
+    json_loads = json.loads
 
 latest_patch = '14.14.1'
 
-def handle_rate_limit(resp):
+# Base url of the Riot API, {region} is replaced by the routing region. Set RIOT_API_BASE to point every request at another
+# server, e.g. RIOT_API_BASE=http://127.0.0.1:8080 for benchmarks/mock_riot.py
+riot_api_base = os.environ.get('RIOT_API_BASE', 'https://{region}.api.riotgames.com')
+
+
+
+class RateLimiter:
+    """
+
+    Thread-safe limiter that enforces several (requests, seconds) windows at once, e.g. Riot's 20 req/1s and 100 req/2min
+    development key limits. Every call to acquire() blocks until a request can be sent without exceeding ANY of the windows,
+    so callers wait proactively instead of finding out through a 429.
+
+    Each window keeps a log of the send times inside it (a strict sliding window). A plain token bucket refilling at
+    limit/period would allow a full burst on top of a full refill within the same 2 minutes, which Riot's windows reject.
+
+    @Parameters:
+        limits (list[tuple]): A list of (max_requests, period_in_seconds) pairs that must all hold.
+        margin (float): Extra seconds waited past each window boundary to absorb clock drift between us and Riot.
+
+    """
+
+    def __init__(self, limits = ((20, 1), (100, 120)), margin = 0.05):
+        self.limits = list(limits)
+        self.margin = margin
+        self._sent = [deque() for _ in self.limits]
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+        # Running totals, see stats()
+        self.requests = 0
+        self.waited = 0.0
+        self.throttled = 0
+        self.throttled_seconds = 0.0
+
+
+    def acquire(self) -> float:
+        """
+
+        Blocks until a request may be sent under every window, then reserves a slot for it.
+
+        @Returns:
+            float: The number of seconds spent waiting.
+
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                wait = self._blocked_until - now
+
+                for (limit, period), sent in zip(self.limits, self._sent):
+                    while sent and sent[0] <= now - period:
+                        sent.popleft()
+                    if len(sent) >= limit:
+                        wait = max(wait, sent[0] + period - now + self.margin)
+
+                if wait <= 0:
+                    for sent in self._sent:
+                        sent.append(now)
+                    self.requests += 1
+                    self.waited += waited
+                    return waited
+
+            time.sleep(wait)
+            waited += wait
+
+
+    def block(self, seconds: float) -> None:
+        """
+
+        Stops every caller from sending for the given number of seconds, used when Riot answers with a 429 anyway
+        (e.g. the key is shared with another process).
+
+        @Parameters:
+            seconds (float): How long to hold off all requests.
+
+        """
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+            self.throttled += 1
+            self.throttled_seconds += seconds
+
+
+    def stats(self) -> dict:
+        """
+
+        @Returns:
+            dict: The number of requests let through, the seconds callers waited in acquire(), the number of 429s reported
+            through block() and the seconds they blocked for, since the limiter was created.
+
+        """
+        with self._lock:
+            return {'requests': self.requests, 'waited': self.waited, 'throttled': self.throttled,
+                    'throttled_seconds': self.throttled_seconds}
+
+
+
+def parse_rate_limits(limits: str) -> list[tuple]:
+    """
+
+    Parses rate limits written like Riot's X-App-Rate-Limit header, e.g. "20:1,100:120" for 20 requests per second and
+    100 requests per 2 minutes.
+
+    @Parameters:
+        limits (str): Comma separated requests:seconds pairs.
+
+    @Returns:
+        list[tuple]: The (max_requests, period_in_seconds) pairs, as taken by RateLimiter.
+
+    """
+    pairs = [limit.split(':') for limit in limits.split(',') if limit.strip()]
+    return [(int(count), float(period)) for count, period in pairs]
+
+
+
+# Shared by every call to the Riot API in this process. Development keys get 20:1,100:120, set RIOT_RATE_LIMITS for other keys
+rate_limiter = RateLimiter(parse_rate_limits(os.environ.get('RIOT_RATE_LIMITS', '20:1,100:120')))
+
+
+
+class HTTPClient:
+    """
+
+    Shared HTTP client for every call to the Riot API, Data Dragon and CommunityDragon. Requests go through one
+    requests.Session, so connections are kept alive and reused instead of paying a new TCP+TLS handshake per request.
+    Each host gets its own connection pool. Failed connections are retried inside the adapter, they never reach the
+    server. Read timeouts and 5xx responses are retried by get() with exponential backoff, calling before_attempt ahead
+    of every attempt, so a rate limiter sees every request that is actually sent. 429s are not retried here, see
+    riot_get() and RateLimiter.
+
+    @Parameters:
+        pool_sizes (dict): Number of keep-alive connections to hold per host, hosts not listed get default_pool_size.
+        default_pool_size (int): Pool size for any other host.
+        retries (int): The number of times a failed connection, read timeout or 5xx response is retried.
+        backoff (float): Backoff factor between retries, waits backoff * 2^(retry - 1) seconds.
+        timeout (tuple): (connect, read) timeout in seconds applied to every request.
+
+    """
+
+    RETRY_STATUSES = (500, 502, 503, 504)
+
+    def __init__(self, pool_sizes = None, default_pool_size = 4, retries = 3, backoff = 0.5, timeout = (3.05, 15)):
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.session = requests.Session()
+
+        # Only retries what never reached the server, anything else goes back through get() and its before_attempt
+        retry = Retry(total = retries, connect = retries, read = 0, status = 0, other = 0, backoff_factor = backoff,
+                      allowed_methods = frozenset(['GET']), raise_on_status = False, respect_retry_after_header = False)
+
+        self.session.mount('http://', HTTPAdapter(pool_connections = 1, pool_maxsize = default_pool_size, max_retries = retry))
+        self.session.mount('https://', HTTPAdapter(pool_connections = 1, pool_maxsize = default_pool_size, max_retries = retry))
+        for host, size in (pool_sizes or {}).items():
+            self.session.mount(host, HTTPAdapter(pool_connections = 1, pool_maxsize = size, max_retries = retry))
+
+
+    def get(self, url: str, headers = None, params = None, timeout = None, before_attempt = None) -> requests.Response:
+        """
+
+        Sends a GET request over the pooled session, retrying read timeouts and 5xx responses.
+
+        @Parameters:
+            url (str): The url to request.
+            headers (dict, optional): Request headers.
+            params (dict, optional): Query parameters.
+            timeout (tuple, optional): Overrides the client's default timeout.
+            before_attempt (function, optional): Called before every attempt, e.g. to wait on a rate limiter.
+
+        @Returns:
+            Response: The response of the request, the last 5xx if every attempt failed.
+
+        """
+        for attempt in range(self.retries + 1):
+            if attempt:
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+            if before_attempt:
+                before_attempt()
+            try:
+                resp = self.session.get(url, headers = headers, params = params, timeout = timeout or self.timeout)
+            except requests.exceptions.ReadTimeout:
+                if attempt == self.retries:
+                    raise
+                continue
+            if resp.status_code not in self.RETRY_STATUSES:
+                break
+        return resp
+
+
+
+def riot_url(region: str, path = '') -> str:
+    """
+
+    @Parameters:
+        region (str): The routing region, e.g. americas.
+        path (str): The path of the endpoint, starting with a /.
+
+    @Returns:
+        str: The url of the endpoint on the Riot API, or on the server riot_api_base points at.
+
+    """
+    return riot_api_base.format(region = region).rstrip('/') + path
+
+
+
+# One pool per Riot routing host sized to the match fetching workers, smaller pools for the static data CDNs
+http_client = HTTPClient(pool_sizes = {
+    **{riot_url(region): 10 for region in ("americas", "asia", "europe", "sea")},
+    "https://ddragon.leagueoflegends.com": 8,
+    "http://ddragon.leagueoflegends.com": 8,
+    "https://raw.communitydragon.org": 2,
+})
+
+
+
+class RawMatchCache:
+    """
+
+    Local store of the raw match and timeline json returned by the Riot API, one gzip compressed file per match ID.
+    Match payloads never change once a game is over, so any payload in here can be reused instead of spending a
+    rate-limited request on it, and data.pkl can be rebuilt from it without touching the network.
+
+    When the files grow past max_bytes, the least recently used payloads are deleted until the cache fits again.
+
+    @Parameters:
+        directory (str): The folder the payloads are stored in.
+        max_bytes (int): The size cap of the cache on disk, None for no cap.
+
+    """
+
+    def __init__(self, directory = 'raw_matches', max_bytes = 2 * 1024 ** 3):
+        self.directory = pathlib.Path(directory)
+        self.max_bytes = max_bytes
+        self._size = None
+        self._lock = threading.Lock()
+
+
+    def path(self, match_id: str, kind = 'match') -> pathlib.Path:
+        """
+
+        @Parameters:
+            match_id (str): The ID of the match.
+            kind (str): 'match' for the match details, 'timeline' for the match timeline.
+
+        @Returns:
+            Path: The file the payload is stored in.
+
+        """
+        suffix = '.json.gz' if kind == 'match' else f'.{kind}.json.gz'
+        return self.directory / f'{match_id}{suffix}'
+
+
+    def get(self, match_id: str, kind = 'match'):
+        """
+
+        Reads a payload from the cache.
+
+        @Parameters:
+            match_id (str): The ID of the match.
+            kind (str): 'match' or 'timeline'.
+
+        @Returns:
+            dict: The payload, or None if it isn't cached.
+
+        """
+        path = self.path(match_id, kind)
+        try:
+            with gzip.open(path, 'rb') as file:
+                payload = json_loads(file.read())
+        except (FileNotFoundError, EOFError, gzip.BadGzipFile, json.JSONDecodeError):
+            return None
+
+        try:
+            os.utime(path) # Mark as recently used for eviction
+        except FileNotFoundError: # Evicted or replaced by another thread since it was read, the payload is still good
+            pass
+        return payload
+
+
+    def put(self, match_id: str, payload: dict, kind = 'match') -> None:
+        """
+
+        Stores a payload in the cache, then evicts the least recently used payloads if the cache is over its size cap.
+
+        @Parameters:
+            match_id (str): The ID of the match.
+            payload (dict): The json returned by the Riot API.
+            kind (str): 'match' or 'timeline'.
+
+        """
+        self.directory.mkdir(parents = True, exist_ok = True)
+        path = self.path(match_id, kind)
+        old_size = path.stat().st_size if path.exists() else 0
+
+        with storage.atomic_write(path, 'wb') as raw, gzip.GzipFile(path.name, mode = 'wb', compresslevel = 6, fileobj = raw) as file:
+            file.write(json.dumps(payload, separators = (',', ':')).encode())
+        size = path.stat().st_size
+
+        with self._lock:
+            if self._size is not None:
+                self._size += size - old_size
+            self._evict()
+
+
+    def ids(self, kind = 'match') -> list[str]:
+        """
+
+        @Parameters:
+            kind (str): 'match' or 'timeline'.
+
+        @Returns:
+            list[str]: The IDs of every match that has a cached payload of that kind.
+
+        """
+        suffix = '.json.gz' if kind == 'match' else f'.{kind}.json.gz'
+        if not self.directory.exists():
+            return []
+        return [path.name[:-len(suffix)] for path in self.directory.iterdir()
+                if path.name.endswith(suffix) and (kind != 'match' or path.name.count('.') == 2)]
+
+
+    def _evict(self) -> None:
+        """
+
+        Deletes the least recently used payloads until the cache is under max_bytes. Must hold self._lock.
+
+        """
+        if self.max_bytes is None:
+            return
+
+        if self._size is None:
+            self._size = sum(path.stat().st_size for path in self.directory.glob('*.json.gz'))
+        if self._size <= self.max_bytes:
+            return
+
+        files = sorted(self.directory.glob('*.json.gz'), key = lambda path: path.stat().st_mtime)
+        for path in files:
+            if self._size <= self.max_bytes:
+                break
+            size = path.stat().st_size
+            path.unlink(missing_ok = True)
+            self._size -= size
+
+
+
+raw_cache = RawMatchCache() # Checked before any match or timeline request goes out
+
+
+
+def handle_rate_limit(resp, limiter = rate_limiter):
     """
 
     Handles the case in which the Rate Limit (100/2mins, 20/1s) is Exceeded, sleeps the program if the limit is exceeded.
 
     @Parameters:
         resp (Response): Response from Request made.
+        limiter (RateLimiter): The shared limiter, blocked for Retry-After so other workers back off as well.
     
     @Returns:
         Return True if the rate limit was exceeded and the program was slept, false otherwise.
@@ -25,42 +396,99 @@ def handle_rate_limit(resp):
     if resp.status_code == 429:
         retry_after = int(resp.headers.get('Retry-After', 10))
         logging.warning(f"Rate limit hit. Retrying after {retry_after} seconds.")
-        time.sleep(retry_after)
+        if limiter:
+            limiter.block(retry_after)
+        with tracing.span('rate_limit_sleep', retry_after = retry_after):
+            time.sleep(retry_after)
         return True
     return False
 
 
 
-def fetch_account_puuid(gameName: str, tagLine: str, api_key: str, region = "americas") -> dict:
+class RiotAPIError(ValueError):
     """
 
-    Fetch a PUUID by Riot ID. 
+    An error response of the Riot API, other than a 429.
 
     @Parameters:
-        gameName & tagLine (strs): A Riot ID is comprised of gameName#tagLine. This is how a Riot ID is fed into this method.
+        status (int): The HTTP status code of the response.
+        message (str): The message Riot sent with it.
+
+    """
+
+    def __init__(self, status: int, message: str):
+        super().__init__(f'Error: {status}, {message}')
+        self.status = status
+
+
+
+# Statuses that mean a single match will never load (e.g. Riot lost or removed it), so it is skipped instead of stopping
+# the run. A bad key (401, 403) fails every request and 5xx are outages, those still stop the run.
+SKIPPED_STATUSES = (400, 404)
+
+
+
+def riot_get(url: str, api_key: str, params = None, client = http_client, limiter = rate_limiter):
+    """
+
+    Sends a GET request to the Riot API. Waits on the shared rate limiter before every attempt, including the 5xx
+    retries of the client, and retries after a 429, so every endpoint shares the same request loop.
+
+    @Parameters:
+        url (str): The url of the Riot API endpoint.
         api_key (str): Riot API key.
-        region (str): The region for which we are looking for the player with the corresponding RiotID.
+        params (dict, optional): Query parameters.
+        client (HTTPClient): The pooled client to send the request with.
+        limiter (RateLimiter): The rate limiter shared by all Riot API calls.
 
-    @Return:
-        str: The Corresponding User's PUUID. Returns -1 if Rate Limit exceeded
+    @Returns:
+        The decoded json of the response. Raises a RiotAPIError for any status other than 200 and 429.
 
     """
 
-    url = f"https://{region}.api.riotgames.com/riot/account/v1/accounts/by-riot-id/{gameName}/{tagLine}"
-    
     headers = {
         'X-Riot-Token': api_key
     }
 
+    wait_for_limiter = lambda: tracing.add('rate_limit_wait', limiter.acquire())
+
     while True:
-        resp = requests.get(url, headers = headers)
-        
+        with tracing.span('network') as attributes:
+            resp = client.get(url, headers = headers, params = params, before_attempt = wait_for_limiter)
+            attributes['status'] = resp.status_code
+
         if resp.status_code == 200:
-            return resp.json()["puuid"]
-        elif handle_rate_limit(resp):
+            with tracing.span('json_decode', bytes = len(resp.content)):
+                return json_loads(resp.content)
+        elif handle_rate_limit(resp, limiter):
             continue
         else:
-            raise ValueError(f'Error: {resp.status_code}, {resp.json()["status"]["message"]}')
+            try:
+                message = resp.json()['status']['message']
+            except (ValueError, KeyError, TypeError): # Not Riot's json error body, e.g. from a proxy
+                message = resp.reason
+            raise RiotAPIError(resp.status_code, message)
+
+
+
+def fetch_account_puuid(gameName: str, tagLine: str, api_key: str, region = "americas") -> dict:
+    """
+
+    Fetch a PUUID by Riot ID. 
+
+    @Parameters:
+        gameName & tagLine (strs): A Riot ID is comprised of gameName#tagLine. This is how a Riot ID is fed into this method.
+        api_key (str): Riot API key.
+        region (str): The region for which we are looking for the player with the corresponding RiotID.
+
+    @Return:
+        str: The Corresponding User's PUUID. Returns -1 if Rate Limit exceeded
+
+    """
+
+    url = riot_url(region, f"/riot/account/v1/accounts/by-riot-id/{gameName}/{tagLine}")
+
+    return riot_get(url, api_key)["puuid"]
 
 
 
@@ -81,12 +509,7 @@ def fetch_match_batch(puuid: str, start: int, count: int, api_key: str, startTim
         list: A list of match IDs. Returns -1 if rate limit exceeded
 
     """
-    url = f"https://{region}.api.riotgames.com/lol/match/v5/matches/by-puuid/{puuid}/ids"
-    
-    headers = {
-        'X-Riot-Token': api_key
-    }
-
+    url = riot_url(region, f"/lol/match/v5/matches/by-puuid/{puuid}/ids")
 
     parameters = {
         "start": start,
@@ -96,15 +519,7 @@ def fetch_match_batch(puuid: str, start: int, count: int, api_key: str, startTim
     if startTime:
         parameters["startTime"] = startTime
 
-    while True:
-        resp = requests.get(url, headers= headers, params= parameters)
-
-        if resp.status_code == 200:
-            return resp.json()
-        elif handle_rate_limit(resp):
-            continue
-        else:
-            raise ValueError(f'Error: {resp.status_code}, {resp.json()["status"]["message"]}')
+    return riot_get(url, api_key, params = parameters)
 
 
 
@@ -146,167 +561,229 @@ def fetch_all_matches(puuid: str, api_key:str, region = "americas", batch_size =
 
 
 
-def matches_to_json(matchlist: list[str], api_key: str, filename = "matches.json", region = "americas") -> None:
+def update_matches(puuid: str, api_key: str, filename = "matches.log", overlap = 3600, region = "americas") -> int:
     """
 
-    Stores matchlist into a json file as a dictionary under key 'matchlist', and the timestamp of the most recent match in 'latest'
+    Fetches the most recent match IDs and appends the new ones to the match log, see match_log.py. The matches are
+    requested from overlap seconds before the latest known match, and every ID already in the log is dropped with a set
+    lookup, so the boundary match, matches created in the same second and clock skew between runs never produce a
+    duplicate or a gap. Only the end of the log is read and written. The latest timestamp is taken from the newest match
+    that loads, matches answered with one of SKIPPED_STATUSES are passed over.
 
     @Parameters:
         api_key (str): Riot API key.
+        filename (str): The match log.
+        puuid (str): The puuid of the User
+        overlap (int): Seconds before the latest known match the request starts at, any window is safe to re-request
         region (str): The region to fetch matches from.
-        filename (str): The .json file for the dictionary to be stored in.
-        matchlist (list[str]): A list of the match IDs to be stored.   
-         
-    @Returns:
-        None, creates a new File   
 
+    @Returns:
+        int, the number of match IDs that weren't in the log, Updates filename
     """
-
-    most_recent = matchlist[0]
-
-    headers = {
-        'X-Riot-Token': api_key
-    }
-
-    url = f"https://{region}.api.riotgames.com/lol/match/v5/matches/{most_recent}"
-    
-    while True:
-        resp = requests.get(url, headers=headers)
-
-        if resp.status_code == 200:
-            latest_match = resp.json()
-            break
-        elif handle_rate_limit(resp):
+    latest_timestamp = match_log.read_latest(filename)
+
+    start_time = max(latest_timestamp - overlap, 0) if latest_timestamp else None
+    fetched = list(dict.fromkeys(fetch_all_matches(puuid=puuid, api_key = api_key, startTime = start_time, region = region)))
+    known = set(match_log.tail(filename, len(fetched))) # IDs of the log inside the window are among its newest
+    new_matches = [match_id for match_id in fetched if match_id not in known] # Newest first
+    if not new_matches:
+        return 0
+
+    # The start of the most recent game that loads, a match the API never returns mustn't stop every later run
+    timestamp = latest_timestamp
+    for match_id in new_matches: # Newest first
+        try:
+            latest_match = fetch_match_details(match_id = match_id, api_key = api_key, region = region) # Usually already cached
+        except RiotAPIError as e:
+            if e.status not in SKIPPED_STATUSES:
+                raise
+            logging.warning(f"Skipping match {match_id} for the latest timestamp: {e}")
             continue
-        else:
-            raise ValueError(f'Error: {resp.status_code}, {resp.json()['status']['message']}')
-        
-    timestamp = latest_match['info']['gameCreation'] // 1000 # Calculate the timestamp of the start of the most recent game
+        timestamp = max(latest_match['info']['gameCreation'] // 1000, latest_timestamp)
+        break
 
-    res_dict = {
-        'latest': timestamp,
-        'matchlist': matchlist
-    } 
+    match_log.append(new_matches[::-1], timestamp, filename)
+    return len(new_matches)
 
-    
-    with open(filename, "w") as json_file:
-        json.dump(res_dict, json_file, indent=4)
 
 
-
-def json_to_matches(filename = "matches.json") -> tuple:
+def fetch_match_details(match_id: str, api_key: str, region = "americas", cache = raw_cache) -> dict:
     """
-
-    Reads the file and converts it to a list of matches and the timestamp of the latest match, plus the index of the last match that has been processed
+    Fetches details of a specific match by match ID. The raw cache is checked first, and anything fetched is stored in it.
 
     @Parameters:
-        filename (str): The .json file the dictionary of the matchlist is stored in.
-         
-    @Returns:
-        tuple, a list of all matches, the timestamp of the latest match, and the index of the last processed match
+        match_id (str): The ID of the match.
+        api_key (str): Riot API key.
+        region (str): The region to fetch match details from.
+        cache (RawMatchCache): The raw payload cache, None to always go to the API.
 
+    Returns:
+        dict: Details of the match.
     """
 
-    with open(filename, 'r') as file:
-        data = json.load(file)
-    
-    if 'latest' not in data or 'matchlist' not in data:
-        raise ValueError("JSON file not properly formatted.")
+    if cache:
+        with tracing.span('cache_read'):
+            match = cache.get(match_id)
+        if match is not None:
+            return match
 
-    return data['latest'], data['matchlist']
+    url = riot_url(region, f"/lol/match/v5/matches/{match_id}")
 
+    match = riot_get(url, api_key)
+    if cache:
+        with tracing.span('cache_write'):
+            cache.put(match_id, match)
+    return match
 
+    
 
-def update_matches(puuid: str, api_key: str, filename = "matches.json") -> None:
+def fetch_matches_concurrently(match_ids: list[str], api_key: str, region = "americas", workers = 10, fetch = None,
+                               skip_statuses = ()):
     """
-
-    Fetches and adds the most recent matches to matches.json, updates the matchlist and latest keys
+    Fetches the details of many matches with a pool of worker threads. All workers share rate_limiter, so the pool keeps
+    as many requests in flight as the 20/1s and 100/2min limits allow instead of waiting on one response at a time.
 
     @Parameters:
+        match_ids (list[str]): The IDs of the matches to fetch.
         api_key (str): Riot API key.
-        filename (str): The .json file for the dictionary to be stored in.
-        puuid (str): The puuid of the User
+        region (str): The region to fetch match details from.
+        workers (int): The number of requests allowed in flight at once.
+        fetch (function): Called with match_id, api_key and region in the workers, fetch_match_details() if None.
+        skip_statuses (tuple): Statuses of a RiotAPIError that only skip the match it was raised for, e.g. SKIPPED_STATUSES.
 
     @Returns:
-        None, Updates filename
+        generator: Yields (match_id, match json) pairs in the same order as match_ids, or what fetch returned instead. A
+        skipped match is logged and yielded as (match_id, None). Any other error fetching a match is raised when its turn
+        comes up, after every match before it has been yielded.
     """
-    latest_timestamp, matchlist = json_to_matches(filename)
 
-    new_matches = fetch_all_matches(puuid=puuid, api_key = api_key, startTime = latest_timestamp)[:-1]
-    temp = len(new_matches)
-    new_matches.extend(matchlist)
+    fetch = fetch or fetch_match_details
+
+    def fetch_or_skip(match_id):
+        try:
+            return fetch(match_id = match_id, api_key = api_key, region = region)
+        except RiotAPIError as e:
+            if e.status not in skip_statuses:
+                raise
+            logging.warning(f"Skipping match {match_id}: {e}")
+            return None
 
-    matches_to_json(matchlist = new_matches, api_key = api_key, filename = "matches.json")
-    return temp
+    with ThreadPoolExecutor(max_workers = workers) as pool:
+        details = pool.map(fetch_or_skip, match_ids)
+        try:
+            for match_id, match_json in zip(match_ids, details):
+                yield match_id, match_json
+        finally:
+            pool.shutdown(wait = True, cancel_futures = True)
 
 
 
-def fetch_match_details(match_id: str, api_key: str, region = "americas") -> dict:
+def fetch_match_timeline(match_id: str, api_key: str, region="americas", cache = raw_cache) -> dict:
+    
     """
-    Fetches details of a specific match by match ID.
+    Fetches the match timeline match by match ID. The raw cache is checked first, and anything fetched is stored in it.
 
-    @Parameters:
+    Parameters:
         match_id (str): The ID of the match.
         api_key (str): Riot API key.
         region (str): The region to fetch match details from.
+        cache (RawMatchCache): The raw payload cache, None to always go to the API.
 
-    Returns:
-        dict: Details of the match.
+    @Returns:
+        dict: Details of the match as a timeline.
     """
 
-    url = f"https://{region}.api.riotgames.com/lol/match/v5/matches/{match_id}"
+    if cache:
+        timeline = cache.get(match_id, kind = 'timeline')
+        if timeline is not None:
+            return timeline
 
-    headers = {
-        'X-Riot-Token': api_key
-    }
+    url = riot_url(region, f"/lol/match/v5/matches/{match_id}/timeline")
 
-    while True:
-        resp = requests.get(url, headers=headers)
+    timeline = riot_get(url, api_key)
+    if cache:
+        cache.put(match_id, timeline, kind = 'timeline')
+    return timeline
 
-        if resp.status_code == 200:
-            return resp.json()
-        elif handle_rate_limit(resp):
-            continue
-        else:
-            raise ValueError(f'Error: {resp.status_code}, {resp.json()['status']['message']}')
 
-    
 
-def fetch_match_timeline(match_id: str, api_key: str, region="americas") -> dict:
-    
+def fetch_timeline_stats(match_id: str, api_key: str, puuid: str, region = "americas"):
     """
-    Fetches the match timeline match by match ID.
+    Fetches the timeline of a match and reduces it to the per-minute stats of the player and their lane opponent, so only
+    the small array is kept, see timeline_store.parse_timeline().
 
-    Parameters:
+    @Parameters:
         match_id (str): The ID of the match.
         api_key (str): Riot API key.
-        region (str): The region to fetch match details from.
+        puuid (str): The player for which we are fetching statistics for
+        region (str): The region to fetch the match and timeline from.
 
-    @Returns:
-        dict: Details of the match as a timeline.
+    Returns:
+        tuple: The result of timeline_store.parse_timeline(), None if the match was skipped.
     """
+    match = fetch_match_details(match_id = match_id, api_key = api_key, region = region) # Usually already cached
+    if match['info'].get('mapId') != 11:
+        return None
 
-    url = f"https://{region}.api.riotgames.com/lol/match/v5/matches/{match_id}/timeline"
+    timeline = fetch_match_timeline(match_id = match_id, api_key = api_key, region = region)
+    with tracing.span('timeline_parse', match_id = match_id):
+        return timeline_store.parse_timeline(match = match, timeline = timeline, puuid = puuid)
 
-    headers = {
-        'X-Riot-Token': api_key
-    }
 
-    while True:
-        resp = requests.get(url, headers=headers)
 
-        if resp.status_code == 200:
-            return resp.json()
-        elif handle_rate_limit(resp):
-            continue
-        else:
-            raise ValueError(f'Error: {resp.status_code}, {resp.json()['status']['message']}')
+def update_timelines(puuid: str, api_key: str, datastore = 'data', directory = 'timelines', batch_size = 100, region = "americas") -> int:
+    """
+    Fetches the timeline of every processed match of the match store that isn't in the timeline store yet, and stores it
+    reduced to per-minute arrays, see timeline_store.py. Timelines cost one more request per match, so update_data() only
+    calls this if asked to. Like update_data(), the timelines are stored in batches and a stopped run resumes where it
+    left off, and a timeline the Riot API answers with one of SKIPPED_STATUSES is logged and recorded as handled without
+    a game, so it doesn't stop every later run.
+
+    @Parameters:
+        puuid (str): The PUUID of the player for which we are looking at our data
+        api_key (str): The Riot API Key
+        datastore (str): The folder of the match store, see match_store.py
+        directory (str): The folder of the timeline store
+        batch_size (int): The number of timelines stored at a time
+        region (str): The region to fetch the timelines from.
+
+    @Return:
+        int, the number of timelines stored
+    """
+    pending = sorted(match_store.read_journal(datastore) - timeline_store.handled_ids(directory))
+    fetch = lambda match_id, api_key, region: fetch_timeline_stats(match_id = match_id, api_key = api_key, puuid = puuid, region = region)
+
+    stored = 0
+    batch_ids, games = [], []
+    try:
+        for match_id, game in fetch_matches_concurrently(match_ids = pending, api_key = api_key, region = region, fetch = fetch,
+                                                         skip_statuses = SKIPPED_STATUSES):
+            batch_ids.append(match_id)
+            if game is not None:
+                games.append(game)
+            if len(batch_ids) >= batch_size:
+                timeline_store.write_segment(games, batch_ids, directory)
+                stored += len(games)
+                batch_ids, games = [], []
+    except Exception as e:
+        print(f"Error encountered: {e}")
+    finally:
+        if batch_ids:
+            timeline_store.write_segment(games, batch_ids, directory)
+            stored += len(games)
+    return stored
 
 
     
-def process_match_details(match: json, puuid: str, filterMap = 11) -> DataFrame:
+# Columns of the match DataFrame, in order, one row per match (or per participant) as produced by parse_match_rows()
+MATCH_COLUMNS = list(match_store.MATCH_SCHEMA)
+
+
+
+def parse_match_row(match: json, puuid: str, filterMap = 11) -> dict:
     """
-    Processes Match Details and Statistics of a player and stores relevant Information into a Dataframe. To See what information is processed, see matchInfo.txt
+    Processes Match Details and Statistics of a player into a single row, keyed by the columns in MATCH_COLUMNS. Rows are
+    cheap to collect in a list and turn into a DataFrame once, see rows_to_frame().
 
     @Parameters:
         match (json): The json of the match, retrieved using fetch_match_details() method
@@ -314,14 +791,34 @@ def process_match_details(match: json, puuid: str, filterMap = 11) -> DataFrame:
         filterMap (int): The type of map for which we are to process. If the mapId doesn't match, then skip
 
     @Return:
-        A DataFrame with all relevant data
+        A dict of column name to value, None if the match was skipped
+    """
+    rows = parse_match_rows(match = match, puuid = puuid, filterMap = filterMap, all_participants = False)
+    return rows[0] if rows else None
+
+
+
+def parse_match_rows(match: json, puuid: str, filterMap = 11, all_participants = True) -> list[dict]:
+    """
+    Processes Match Details and Statistics of every participant of a match into one row each, like parse_match_row().
+    A match costs one request whether one or ten rows are kept, so this gets ten times the rows out of the rate limit.
+    Rows are tagged with the participant's Team and their Relation to the player: 'self', 'ally' or 'enemy'.
+
+    @Parameters:
+        match (json): The json of the match, retrieved using fetch_match_details() method
+        puuid (str): The player the Relation of every participant is relative to
+        filterMap (int): The type of map for which we are to process. If the mapId doesn't match, then skip
+        all_participants (bool): False to only return the row of the player
+
+    @Return:
+        A list of dicts of column name to value, the player's row first. Empty if the match was skipped
     """
     match_info = match['info']
 
     # Check mapID
     mapID = match_info.get('mapId')
     if filterMap and filterMap != mapID: 
-        return None
+        return []
 
     # Fetch the index of the participant
     idx = match['metadata']['participants'].index(puuid) 
@@ -330,8 +827,34 @@ def process_match_details(match: json, puuid: str, filterMap = 11) -> DataFrame:
     patch_nums = str(match_info.get('gameVersion', '')).split('.')
     patch = ".".join(patch_nums[:2])
 
+    participants = match_info['participants']
+    own_team = participants[idx].get('teamId')
+    indices = [idx] + [i for i in range(len(participants)) if i != idx] if all_participants else [idx]
+
+    rows = []
+    for i in indices:
+        row = participant_row(match_info = match_info, player_info = participants[i], patch = patch)
+        row['Match_ID'] = match['metadata'].get('matchId')
+        row['Team'] = participants[i].get('teamId')
+        row['Relation'] = 'self' if i == idx else 'ally' if row['Team'] == own_team else 'enemy'
+        rows.append(row)
+    return rows
+
+
+
+def participant_row(match_info: dict, player_info: dict, patch: str) -> dict:
+    """
+    Processes the Statistics of one participant of a match into a row, see parse_match_rows()
+
+    @Parameters:
+        match_info (dict): The 'info' of the json of the match
+        player_info (dict): The participant's entry of match_info['participants']
+        patch (str): The patch the match was played on
+
+    @Return:
+        A dict of column name to value, without the Match_ID, Team and Relation columns
+    """
     # Fetch Dictionaries of General Categories
-    player_info = match_info['participants'][idx]
     challenges = player_info.get('challenges', {})
     perks = player_info.get('perks', {})
     stat_runes = perks.get('statPerks', {})
@@ -406,106 +929,438 @@ def process_match_details(match: json, puuid: str, filterMap = 11) -> DataFrame:
     secondary_choice2 = secondary_selections[1].get('perk') if len(secondary_selections) > 1 else None
 
 
-    data_dict = {
-        'Champion': [champion],
-        'Role': [role],
-        'Patch': [patch],
-        'Win': [win],
-        'Summoner1': [summoner_1],
-        'Summoner2': [summoner_2],
-        'Turrets_Killed': [turrets_killed],
-        'Total_Minions_Killed': [totalMinionsKilled],
-        'Total_Jungle_Monsters_Killed': [totalJungleKilled],
-        'Total_Damage_DealtToChampions': [totalDamage],
-        'Item0': [item0],
-        'Item1': [item1],
-        'Item2': [item2],
-        'Item3': [item3],
-        'Item4': [item4],
-        'Item5': [item5],
-        'Item6': [item6],
-        'KDA': [kda],
-        'Kill_Participation': [kill_participation],
-        'Damage_Share': [damage_share],
-        'Turret_Plates_Taken': [turret_plates],
-        'Gold_Per_Minute': [gold_pm],
-        'Damage_Per_Minute': [damage_pm],
-        'Vision_Score_Per_Minute': [vision_score_pm],
-        'Lane_Minions_Before_10_Minutes': [cs_after_10],
-        'Jungle_CS_Before_10_Minutes': [jungle_after_10],
-        'Sol_Kills': [solos],
-        'Barons_Killed': [barons],
-        'Dragons_Killed': [dragons],
-        "Void_Grubs_Killed": [horde],
-        'Rift_Heralds_Killed': [heralds],
-        'Defense_Rune': [defense_rune],
-        'Flex_Rune': [flex_rune],
-        'Offense_Rune': [offense_rune],
-        'Primary_Tree': [primary_tree],
-        'Primary_Keystone': [primary_keystone],
-        'Primary_Choice1': [primary_choice1],
-        'Primary_Choice2': [primary_choice2],
-        'Primary_Choice3': [primary_choice3],
-        'Secondary_Tree': [secondary_tree],
-        'Secondary_Choice1': [secondary_choice1],
-        'Secondary_Choice2': [secondary_choice2]
+    return {
+        'Champion': champion,
+        'Role': role,
+        'Patch': patch,
+        'Win': win,
+        'Summoner1': summoner_1,
+        'Summoner2': summoner_2,
+        'Turrets_Killed': turrets_killed,
+        'Total_Minions_Killed': totalMinionsKilled,
+        'Total_Jungle_Monsters_Killed': totalJungleKilled,
+        'Total_Damage_DealtToChampions': totalDamage,
+        'Item0': item0,
+        'Item1': item1,
+        'Item2': item2,
+        'Item3': item3,
+        'Item4': item4,
+        'Item5': item5,
+        'Item6': item6,
+        'KDA': kda,
+        'Kill_Participation': kill_participation,
+        'Damage_Share': damage_share,
+        'Turret_Plates_Taken': turret_plates,
+        'Gold_Per_Minute': gold_pm,
+        'Damage_Per_Minute': damage_pm,
+        'Vision_Score_Per_Minute': vision_score_pm,
+        'Lane_Minions_Before_10_Minutes': cs_after_10,
+        'Jungle_CS_Before_10_Minutes': jungle_after_10,
+        'Sol_Kills': solos,
+        'Barons_Killed': barons,
+        'Dragons_Killed': dragons,
+        "Void_Grubs_Killed": horde,
+        'Rift_Heralds_Killed': heralds,
+        'Defense_Rune': defense_rune,
+        'Flex_Rune': flex_rune,
+        'Offense_Rune': offense_rune,
+        'Primary_Tree': primary_tree,
+        'Primary_Keystone': primary_keystone,
+        'Primary_Choice1': primary_choice1,
+        'Primary_Choice2': primary_choice2,
+        'Primary_Choice3': primary_choice3,
+        'Secondary_Tree': secondary_tree,
+        'Secondary_Choice1': secondary_choice1,
+        'Secondary_Choice2': secondary_choice2
     }
 
-    return pd.DataFrame(data_dict)
 
 
+def process_match_details(match: json, puuid: str, filterMap = 11) -> DataFrame:
+    """
+    Processes Match Details and Statistics of a player and stores relevant Information into a Dataframe. To See what information is processed, see matchInfo.txt
 
-def update_data(puuid: str, api_key: str, datafile = 'data.pkl', matches_file = 'matches.json', new = False) -> None:
+    @Parameters:
+        match (json): The json of the match, retrieved using fetch_match_details() method
+        puuid (str): The player for which we are fetching statistics for
+        filterMap (int): The type of map for which we are to process. If the mapId doesn't match, then skip
+
+    @Return:
+        A DataFrame with all relevant data
     """
+    row = parse_match_row(match = match, puuid = puuid, filterMap = filterMap)
+    if row is None:
+        return None
 
-    Updates the Dataframe of all of the SR matches
+    return pd.DataFrame({column: [value] for column, value in row.items()})
+
+
+
+def rows_to_frame(rows: list[dict]) -> DataFrame:
+    """
+    Builds a DataFrame out of rows from parse_match_row() in one go. Collecting rows and materializing them once keeps
+    ingestion linear in the number of matches, where concatenating a DataFrame per match copies the whole frame every time.
 
     @Parameters:
-        datafile (str): The name of the file for which to load/store the DataFrame object
-        matches_file (str): The name of the JSON file of the matchlist
+        rows (list[dict]): The rows, in the order they should appear in the DataFrame
+
+    @Return:
+        A DataFrame with one row per entry of rows and the columns and compact dtypes of MATCH_COLUMNS
+    """
+    return match_store.compact_frame(pd.DataFrame.from_records(rows, columns = MATCH_COLUMNS))
+
+
+
+# Column -> key of the participant's stats, of its challenges and of its stat runes, read by parse_matches()
+PARTICIPANT_FIELDS = [('Champion', 'championName'), ('Role', 'teamPosition'), ('Win', 'win'), ('Summoner1', 'summoner1Id'),
+                      ('Summoner2', 'summoner2Id'), ('Turrets_Killed', 'turretTakedowns'), ('Total_Minions_Killed', 'totalMinionsKilled'),
+                      ('Total_Damage_DealtToChampions', 'totalDamageDealtToChampions'), ('Item0', 'item0'), ('Item1', 'item1'),
+                      ('Item2', 'item2'), ('Item3', 'item3'), ('Item4', 'item4'), ('Item5', 'item5'), ('Item6', 'item6'),
+                      ('Team', 'teamId')]
+CHALLENGE_FIELDS = [('KDA', 'kda'), ('Kill_Participation', 'killParticipation'), ('Damage_Share', 'teamDamagePercentage'),
+                    ('Turret_Plates_Taken', 'turretPlatesTaken'), ('Gold_Per_Minute', 'goldPerMinute'),
+                    ('Damage_Per_Minute', 'damagePerMinute'), ('Vision_Score_Per_Minute', 'visionScorePerMinute'),
+                    ('Lane_Minions_Before_10_Minutes', 'laneMinionsFirst10Minutes'), ('Jungle_CS_Before_10_Minutes', 'jungleCsBefore10Minutes'),
+                    ('Sol_Kills', 'soloKills')]
+STAT_RUNE_FIELDS = [('Defense_Rune', 'defense'), ('Flex_Rune', 'flex'), ('Offense_Rune', 'offense')]
+OBJECTIVE_FIELDS = [('Barons_Killed', 'baron'), ('Dragons_Killed', 'dragon'), ('Void_Grubs_Killed', 'horde'), ('Rift_Heralds_Killed', 'riftHerald')]
+RUNE_FIELDS = [('Primary_Keystone', 'Primary_Choice1', 'Primary_Choice2', 'Primary_Choice3'), ('Secondary_Choice1', 'Secondary_Choice2')]
+
+
+
+def parse_matches(matches, puuid: str, filterMap = 11, all_participants = False, capacity = 1024) -> DataFrame:
+    """
+    Batch version of parse_match_rows() + rows_to_frame() for many matches at once, e.g. a rebuild from the raw cache.
+    Every value is written straight into a preallocated list per column, which doubles in size when full, instead of
+    building a dict per row, and every column is converted to an array of its dtype once at the end. The result is the same DataFrame rows_to_frame()
+    builds out of the rows parse_match_rows() returns for each match, in order.
+
+    @Parameters:
+        matches (iterable): The json of every match, e.g. from RawMatchCache.get(). None entries are skipped
+        puuid (str): The player for which we are fetching statistics for
+        filterMap (int): The type of map for which we are to process. If the mapId doesn't match, then skip
+        all_participants (bool): Keep a row for each of the ten participants instead of only the player's
+        capacity (int): The number of rows the arrays start with
+
+    @Return:
+        A DataFrame with the columns and compact dtypes of MATCH_COLUMNS
+    """
+    columns = {column: [None] * capacity for column in MATCH_COLUMNS}
+    # Bound once, the lists grow in place
+    participant_fields = [(columns[column], key) for column, key in PARTICIPANT_FIELDS]
+    challenge_fields = [(columns[column], key) for column, key in CHALLENGE_FIELDS]
+    stat_rune_fields = [(columns[column], key) for column, key in STAT_RUNE_FIELDS]
+    objective_fields = [(columns[column], key) for column, key in OBJECTIVE_FIELDS]
+    rune_fields = [(columns['Primary_Tree'], [columns[column] for column in RUNE_FIELDS[0]]),
+                   (columns['Secondary_Tree'], [columns[column] for column in RUNE_FIELDS[1]])]
+    jungle, patches, match_ids, relations = (columns[column] for column in ('Total_Jungle_Monsters_Killed', 'Patch', 'Match_ID', 'Relation'))
+    size = 0
+
+    for match in matches:
+        if match is None:
+            continue
+        match_info = match['info']
+        if filterMap and filterMap != match_info.get('mapId'):
+            continue
+
+        participants = match_info['participants']
+        idx = match['metadata']['participants'].index(puuid)
+        own_team = participants[idx].get('teamId')
+        patch = ".".join(str(match_info.get('gameVersion', '')).split('.')[:2])
+        match_id = match['metadata'].get('matchId')
+        objectives = {}
+        for team in reversed(match_info.get('teams', [])): # The first team with a teamId wins, like participant_row()
+            objectives[team.get('teamId')] = team.get('objectives', {})
+
+        indices = [idx] + [i for i in range(len(participants)) if i != idx] if all_participants else [idx]
+        if size + len(indices) > capacity:
+            grow = max(capacity, size + len(indices) - capacity)
+            for values in columns.values():
+                values.extend([None] * grow)
+            capacity += grow
+
+        for i in indices:
+            player_info = participants[i]
+            challenges = player_info.get('challenges', {})
+            perks = player_info.get('perks', {})
+            stat_runes = perks.get('statPerks', {})
+            styles = perks.get('styles', [{}, {}])
+            team_objectives = objectives.get(player_info.get('teamId'), {})
+
+            for values, key in participant_fields:
+                values[size] = player_info.get(key)
+            for values, key in challenge_fields:
+                values[size] = challenges.get(key)
+            for values, key in stat_rune_fields:
+                values[size] = stat_runes.get(key)
+            for values, key in objective_fields:
+                values[size] = team_objectives.get(key, {}).get('kills')
+            jungle[size] = player_info.get('totalAllyJungleMinionsKilled', 0) + player_info.get('totalEnemyJungleMinionsKilled', 0)
+
+            for (trees, choices), style in zip(rune_fields, (styles[0], styles[1])):
+                trees[size] = style.get('style')
+                selections = style.get('selections', [])
+                for n, values in enumerate(choices):
+                    values[size] = selections[n].get('perk') if len(selections) > n else None
+
+            patches[size] = patch
+            match_ids[size] = match_id
+            relations[size] = 'self' if i == idx else 'ally' if player_info.get('teamId') == own_team else 'enemy'
+            size += 1
+
+    data = {}
+    for column, values in columns.items():
+        if match_store.MATCH_SCHEMA[column] == 'category':
+            data[column] = pd.Categorical(values[:size])
+        else:
+            data[column] = np.array(values[:size], dtype = np.float64) # None becomes NaN, compact_frame() picks the dtype
+    return match_store.compact_frame(pd.DataFrame(data))
+
+
+
+def store_batch(rows: list[dict], match_ids: list[str], datastore = 'data') -> None:
+    """
+
+    Appends the rows parsed from a batch of matches to the match store as one segment, then journals the batch's match
+    IDs so they are never processed again.
+
+    @Parameters:
+        rows (list[dict]): The rows parse_match_rows() returned for the batch, oldest first
+        match_ids (list[str]): The IDs of every match of the batch, including those that didn't produce a row
+        datastore (str): The folder of the match store, see match_store.py
+
+    """
+    if rows:
+        with tracing.span('materialize', rows = len(rows)):
+            frame = rows_to_frame(rows[::-1]) # Newest first, built once per batch instead of once per match
+        with tracing.span('store_write', rows = len(rows)):
+            match_store.write_segment(frame, datastore, match_ids = match_ids)
+    with tracing.span('journal_write', matches = len(match_ids)):
+        match_store.append_journal(match_ids, datastore)
+
+
+
+def update_data(puuid: str, api_key: str, datastore = 'data', matches_file = 'matches.log', new = False, legacy_datafile = 'data.pkl',
+                aggregates_file = 'aggregates.pkl', pages_file = 'pages.bin', trace_dir = 'traces', batch_size = 100,
+                legacy_matches_file = 'matches.json', all_participants = False, timelines = False, timelines_dir = 'timelines') -> None:
+    """
+
+    Updates the Dataframe of all of the SR matches. Every match of the matchlist newer than the last one processed is
+    processed, oldest first, in batches of batch_size: each batch is appended to the store as a new segment and
+    journaled. Only the end of the match log and of the journal is read to find them, unless the journal has gaps (see
+    match_store.set_rescan()) or nothing has been processed yet, in which case both are read in full. The matches
+    already stored are never read or rewritten, and a run that fails or is killed loses at most one batch, which the
+    next run picks up again (from the raw cache, without spending requests on it). A match the Riot API answers with
+    one of SKIPPED_STATUSES is logged and journaled without a row, any other error stops the run.
+    Afterwards, the aggregates and every champion page are rebuilt so the website only has to load them.
+
+    @Parameters:
+        datastore (str): The folder of the match store, see match_store.py
+        matches_file (str): The match log, see match_log.py
         puuid (str): The PUUID of the player for which we are looking at our data
         api_key (str): The Riot API Key
         new (bool): Set this flag to True if making a new DataFrame, False otherwise
+        legacy_datafile (str): A data.pkl from an older version, converted into the store if the store is empty
+        aggregates_file (str): The file of the aggregate accumulators, see aggregates.py
+        pages_file (str): The file of the champion page payloads, see pages.py
+        trace_dir (str): The folder a trace of the time spent in every stage is written to, see tracing.py. None to only
+                         print the summary
+        batch_size (int): The number of matches stored and journaled at a time
+        legacy_matches_file (str): A matches.json from an older version, converted into the match log if there is none
+        all_participants (bool): Store a row for each of the ten participants of every match instead of only the player's,
+                                 see parse_match_rows(). The champion pages still only count the player's rows
+        timelines (bool): Also store the per-minute timeline of every match, one more request per match, see update_timelines()
+        timelines_dir (str): The folder of the timeline store, see timeline_store.py
     
     @Return:
-        None, Updates datafile with the matches
+        None, Updates datastore with the matches
 
 
     """
 
-    # UPDATE MATCHES
-    num_new_matches = update_matches(puuid, api_key)
-    print(num_new_matches)
+    with tracing.trace_run('update', trace_dir) as trace:
 
-    # FETCH MATCH LIST
-    _, matchlist = json_to_matches(matches_file)
-    
-    if num_new_matches == 0 and not new:
-        print("No New Matches")
-        return 
-    
-    if new:
-        data = pd.DataFrame()
-        num_new_matches = len(matchlist)
-    else:
-        data = pd.read_pickle(datafile)
-    
+        # UPDATE MATCHES
+        match_log.migrate_json(legacy_matches_file, matches_file)
+        with tracing.span('matchlist'):
+            num_new_matches = update_matches(puuid, api_key, filename = matches_file)
+        print(num_new_matches)
+
+        if new:
+            match_store.clear_store(datastore)
+        else:
+            match_store.migrate_pickle(legacy_datafile, datastore)
+            if match_store.store_exists(datastore) and not match_store.journal_exists(datastore):
+                # Stored before the journal existed, every match but the new ones is already in the store
+                match_store.append_journal(match_log.read_ids(matches_file)[num_new_matches:][::-1], datastore) # Oldest first
+
+        # EVERY MATCH NOT PROCESSED YET, INCLUDING THE ONES A STOPPED RUN DIDN'T GET TO
+        newer, found = match_log.tail_until(match_store.read_recent(datastore), matches_file) # Newer than the last processed match
+        full_scan = not found or match_store.rescan_needed(datastore)
+        if full_scan: # Nothing processed yet, or the journal has gaps
+            processed = match_store.read_journal(datastore) # Set of every ingested match ID, O(1) lookups
+            newer = [match_id for match_id in match_log.read_ids(matches_file) if match_id not in processed]
+        pending = list(dict.fromkeys(reversed(newer))) # Oldest first
+
+        if not pending:
+            print("No New Matches")
+            if timelines: # Timelines may have been turned on after the stored matches were processed
+                with tracing.span('timelines'):
+                    update_timelines(puuid, api_key, datastore, timelines_dir)
+            return 
 
-    # PARSE THROUGH NEW MATCHES AND UPDATE DATA
-    try:
         # PARSE THROUGH NEW MATCHES AND UPDATE DATA
-        for i in range(num_new_matches - 1, -1, -1):
-            print("New Match, " + matchlist[i])
-            match_json = fetch_match_details(match_id=matchlist[i], api_key=api_key)
-            matchDF = process_match_details(match=match_json, puuid=puuid)
-            if matchDF is not None and not matchDF.empty:
-                data = pd.concat([matchDF, data])
-    except Exception as e:
-        print(f"Error encountered: {e}") 
-        # Server Disconnects/Inconsisitencies with Riot API
+        batch_ids, rows = [], []
+        completed = False
+        try:
+            for match_id, match_json in fetch_matches_concurrently(match_ids=pending, api_key=api_key, skip_statuses=SKIPPED_STATUSES):
+                batch_ids.append(match_id) # Journaled even if skipped, so a match that never loads doesn't block every run
+                if match_json is None:
+                    print("Skipped Match, " + match_id)
+                else:
+                    print("New Match, " + match_id)
+                    with tracing.span('parse', match_id = match_id):
+                        rows += parse_match_rows(match=match_json, puuid=puuid, all_participants=all_participants)
+                    trace.matches += 1
+                if len(batch_ids) >= batch_size:
+                    store_batch(rows, batch_ids, datastore)
+                    batch_ids, rows = [], []
+            completed = True
+        except Exception as e:
+            print(f"Error encountered: {e}") 
+            # Server Disconnects/Inconsisitencies with Riot API
+        finally:
+            if batch_ids:
+                store_batch(rows, batch_ids, datastore) # Everything fetched before the error is kept
+        if full_scan and completed: # Every match of the log is in the journal now
+            match_store.set_rescan(False, datastore)
+
+        if timelines:
+            with tracing.span('timelines'):
+                update_timelines(puuid, api_key, datastore, timelines_dir)
+
+        # BUILD THE AGGREGATES AND EVERY CHAMPION PAGE
+        import pages # Imported here, pages -> aggregates imports this module
+        with tracing.span('pages'):
+            pages.materialize_pages(datastore, aggregates_file, pages_file)
+
+
+
+def available_cpus() -> int:
+    """
+    @Return:
+        int, the number of CPUs this process may run on, fewer than os.cpu_count() under an affinity mask or a container
+        CPU set
+    """
+    if hasattr(os, 'sched_getaffinity'): # Linux only
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+
+def rebuild_shard(match_ids: list[str], puuid: str, cache_dir: str, scratch_dir: str, all_participants = False):
+    """
+
+    Rebuilds one shard of the matchlist from the raw cache into a segment of its own, in a worker process of
+    rebuild_data_from_cache(). Only the path of the segment and the rebuilt IDs are sent back, never the DataFrame.
+
+    @Parameters:
+        match_ids (list[str]): The IDs of the shard, newest first
+        puuid (str): The PUUID of the player for which we are looking at our data
+        cache_dir (str): The folder of the raw cache
+        scratch_dir (str): The folder of the shard's own store, inside the match store so the segment can be renamed into it
+        all_participants (bool): Store a row for each of the ten participants of every match, see parse_match_rows()
+
+    @Return:
+        A tuple of the path of the segment and the list of the IDs found in the cache
+
+    """
+    cache = RawMatchCache(cache_dir, max_bytes = None)
+    rebuilt_ids = []
+
+    def cached_matches():
+        for match_id in match_ids:
+            match_json = cache.get(match_id)
+            if match_json is not None:
+                rebuilt_ids.append(match_id)
+                yield match_json
+
+    df = parse_matches(cached_matches(), puuid = puuid, all_participants = all_participants)
+    path = match_store.write_segment(df, scratch_dir, match_ids = rebuilt_ids)
+    return str(path), rebuilt_ids
+
+
+
+def rebuild_data_from_cache(puuid: str, datastore = 'data', matches_file = 'matches.log', cache = raw_cache,
+                            aggregates_file = 'aggregates.pkl', pages_file = 'pages.bin', legacy_matches_file = 'matches.json',
+                            all_participants = False, workers = None) -> int:
+    """
+
+    Rebuilds the Dataframe of all of the SR matches from the raw cache without making any network calls, e.g. after
+    adding a column to process_match_details(). Matches in the matchlist that aren't cached are skipped and left out of
+    the journal, and the store is marked so the next update_data() checks the whole journal and fetches them again. The
+    match log is compacted.
+
+    The matchlist is split into one contiguous shard per worker. With several workers, every shard is decoded and parsed
+    in its own process by rebuild_shard(), which writes a segment into a scratch folder inside the store. The segments
+    are then renamed into the store, oldest shard first, so the store ends up with one segment per shard in the same
+    order as a serial rebuild, and no DataFrame is pickled between processes.
+
+    @Parameters:
+        puuid (str): The PUUID of the player for which we are looking at our data
+        datastore (str): The folder of the match store, see match_store.py
+        matches_file (str): The match log, see match_log.py
+        cache (RawMatchCache): The raw payload cache to read the matches from
+        aggregates_file (str): The file of the aggregate accumulators, see aggregates.py
+        pages_file (str): The file of the champion page payloads, see pages.py
+        legacy_matches_file (str): A matches.json from an older version, converted into the match log if there is none
+        all_participants (bool): Store a row for each of the ten participants of every match, see parse_match_rows()
+        workers (int): The number of processes to rebuild with, None for one per CPU. Never more than the CPUs this
+                       process may run on, see available_cpus(). 1 rebuilds in this process.
+
+    @Return:
+        int, the number of matches in the matchlist that weren't in the cache
+
+    """
+
+    match_log.migrate_json(legacy_matches_file, matches_file)
+    match_log.compact(matches_file)
+    matchlist = match_log.read_ids(matches_file) # Newest first, same order as update_data() leaves it
+
+    cpus = available_cpus() # More processes than CPUs only adds start-up and scheduling to a CPU bound rebuild
+    workers = max(1, min(workers or cpus, cpus, len(matchlist)))
+    size = -(-len(matchlist) // workers) if matchlist else 0
+    shards = [matchlist[i:i + size] for i in range(0, len(matchlist), size)] if size else [[]]
+
+    scratch = pathlib.Path(datastore) / '.rebuild'
+    shutil.rmtree(scratch, ignore_errors = True)
+    scratch_dirs = [str(scratch / f'{i:04d}') for i in range(len(shards))]
+    jobs = (shards, [puuid] * len(shards), [str(cache.directory)] * len(shards), scratch_dirs, [all_participants] * len(shards))
+
+    try:
+        if len(shards) == 1:
+            results = list(map(rebuild_shard, *jobs))
+        else:
+            with ProcessPoolExecutor(max_workers = len(shards)) as executor:
+                results = list(executor.map(rebuild_shard, *jobs))
+
+        match_store.clear_store(datastore)
+        for path, _ in reversed(results): # Oldest shard first, read_store() returns the newest segment first
+            storage.publish_segment(path, datastore)
     finally:
-        data.to_pickle(datafile)
-        matches_to_json(matchlist=matchlist, api_key=api_key)
+        shutil.rmtree(scratch, ignore_errors = True)
+
+    rebuilt_ids = [match_id for _, shard_ids in results for match_id in shard_ids]
+    match_store.append_journal(rebuilt_ids[::-1], datastore) # Oldest first, in the order of the match log
+
+    missing = len(matchlist) - len(rebuilt_ids)
+    if missing:
+        match_store.set_rescan(True, datastore) # The skipped matches are gaps in the journal
+        logging.warning(f"{missing} matches are missing from the raw cache and were skipped.")
+
+    import pages # Imported here, pages -> aggregates imports this module
+    pages.materialize_pages(datastore, aggregates_file, pages_file)
+    return missing
 
 
 
@@ -536,7 +1391,7 @@ def json_extract_runes(url = "https://raw.communitydragon.org/latest/plugins/rcp
                 extract(item, res, key)
         return res
     
-    item_json = requests.get(url).json()
+    item_json = http_client.get(url).json()
 
     ids = extract(item_json, [], 'id')
     names = extract(item_json, [], 'name')
@@ -576,7 +1431,7 @@ def json_extract_important_items(url = "https://raw.communitydragon.org/latest/p
         return res
 
     # Fetch the json from communitydragon
-    item_json = requests.get(url).json()
+    item_json = http_client.get(url).json()
 
     ids = extract(item_json, [], 'id')
     names = extract(item_json, [], 'name')
@@ -586,6 +1441,78 @@ def json_extract_important_items(url = "https://raw.communitydragon.org/latest/p
 
 
 
+# (kind, patch) -> {id: name}, so each mapping is read from disk or the network at most once per process
+metadata_registry = {}
+
+
+
+def cdragon_url(filename: str, patch = latest_patch) -> str:
+    """
+    Returns the url of a game data json on CommunityDragon for the given patch, e.g. 14.14.1 -> .../14.14/.../perks.json
+    """
+    version = ".".join(str(patch).split('.')[:2])
+    return f"https://raw.communitydragon.org/{version}/plugins/rcp-be-lol-game-data/global/default/v1/{filename}"
+
+
+
+def load_metadata(kind: str, fetch, patch = latest_patch, directory = 'metadata') -> dict:
+    """
+    Returns an ID -> name mapping of game data (runes, items), keyed by patch. Looks in the in-memory registry, then in
+    directory/{kind}-{patch}.json, and only then calls fetch() and stores its result on disk. If fetching fails, the most
+    recent patch cached on disk is used instead, so startup works offline once anything has been cached.
+
+    @Parameters:
+        kind (str): The name of the mapping, e.g. 'runes' or 'items'
+        fetch (function): Called with the patch to download the mapping when it isn't cached
+        patch (str): The patch the mapping belongs to
+        directory (str): The folder the mappings are cached in
+
+    @Return:
+        A dictionary of mappings for {ID: Name}
+    """
+    key = (kind, patch)
+    if key in metadata_registry:
+        return metadata_registry[key]
+
+    path = pathlib.Path(directory) / f'{kind}-{patch}.json'
+    if not path.exists():
+        try:
+            mapping = fetch(patch)
+            path.parent.mkdir(parents = True, exist_ok = True)
+            with storage.atomic_write(path) as file:
+                json.dump(mapping, file)
+        except Exception as e:
+            cached = sorted(pathlib.Path(directory).glob(f'{kind}-*.json'),
+                            key = lambda p: [int(n) if n.isdigit() else 0 for n in p.stem[len(kind) + 1:].split('.')])
+            if not cached:
+                raise
+            logging.warning(f"Couldn't fetch {kind} for patch {patch} ({e}), using {cached[-1].name}")
+            path = cached[-1]
+
+    with open(path, 'r') as file:
+        mapping = {int(id): name for id, name in json.load(file).items()} # json object keys are always strings
+
+    metadata_registry[key] = mapping
+    return mapping
+
+
+
+def get_rune_names(patch = latest_patch, directory = 'metadata') -> dict:
+    """
+    Returns a dictionary of the rune ID to the rune name for the given patch, cached on disk, see load_metadata()
+    """
+    return load_metadata('runes', lambda patch: json_extract_runes(url = cdragon_url('perks.json', patch)), patch, directory)
+
+
+
+def get_important_items(patch = latest_patch, directory = 'metadata') -> dict:
+    """
+    Returns a dictionary of item id to item names of important items for the given patch, cached on disk, see load_metadata()
+    """
+    return load_metadata('items', lambda patch: json_extract_important_items(url = cdragon_url('items.json', patch)), patch, directory)
+
+
+
 def purge_df(df : DataFrame) -> DataFrame:
     """
 
@@ -608,7 +1535,28 @@ def purge_df(df : DataFrame) -> DataFrame:
 
 
 
-def df_to_statdfs(df : DataFrame) -> tuple:
+# Rune tree ID -> name of the tree
+TREE_PAGES = {
+    8000: "Precision",
+    8100: "Domination",
+    8200: "Sorcery",
+    8300: "Inspiration",
+    8400: "Resolve"
+}
+
+
+
+# Columns of the match DataFrame that df_to_statdfs() reads, the rest don't need to be loaded to serve the website
+STAT_COLUMNS = ['Champion', 'Role', 'Win', 'Barons_Killed', 'Void_Grubs_Killed', 'Dragons_Killed', 'Turrets_Killed',
+                'Rift_Heralds_Killed', 'Total_Minions_Killed', 'Total_Jungle_Monsters_Killed', 'Total_Damage_DealtToChampions',
+                'KDA', 'Kill_Participation', 'Damage_Share', 'Turret_Plates_Taken', 'Gold_Per_Minute', 'Damage_Per_Minute',
+                'Vision_Score_Per_Minute', 'Lane_Minions_Before_10_Minutes', 'Jungle_CS_Before_10_Minutes', 'Sol_Kills',
+                'Primary_Tree', 'Primary_Keystone', 'Secondary_Tree', 'Item0', 'Item1', 'Item2', 'Item3', 'Item4', 'Item5', 'Item6',
+                'Relation']
+
+
+
+def df_to_statdfs(df : DataFrame, fused = True) -> tuple:
     
     """
     Takes a dataframe of matches as raw data (unprocessed ids, etc) and turns it into a couple new dataframes, most of them grouping by
@@ -616,6 +1564,7 @@ def df_to_statdfs(df : DataFrame) -> tuple:
 
     @Parameters
         df (DataFrame): The dataframe with the list of matches and their data
+        fused (bool): Compute every table from one pass of sums and counts (see aggregates.fused_sum_count()) instead of one groupby per table
 
     @Returns
         a tuple of DataFrames returned in the following order: 
@@ -628,11 +1577,15 @@ def df_to_statdfs(df : DataFrame) -> tuple:
     
     """
    
+    if fused:
+        import aggregates # Imported here, aggregates imports this module
+        return aggregates.accumulators_to_statdfs(aggregates.fold_rows(aggregates.empty_accumulators(), df))
 
+    df = match_store.own_rows(df) # The statistics are the player's, not the other participants'
  
 
     # Calculate Objective Control Numbers by Champion, Role, and Win
-    objective_df = df.groupby(['Champion', 'Role', 'Win']).agg({
+    objective_df = df.groupby(['Champion', 'Role', 'Win'], observed=True).agg({
         'Barons_Killed': 'mean',
         'Void_Grubs_Killed': 'mean',
         'Dragons_Killed': 'mean',
@@ -645,7 +1598,7 @@ def df_to_statdfs(df : DataFrame) -> tuple:
 
 
     # Calculate the Winrates and Games Played By Role
-    winrate_by_role = df.groupby(['Champion', 'Role']).agg(
+    winrate_by_role = df.groupby(['Champion', 'Role'], observed=True).agg(
         Winrate=('Win', 'mean'),
         Games_Played=('Win', 'count')
     ).reset_index()
@@ -653,7 +1606,7 @@ def df_to_statdfs(df : DataFrame) -> tuple:
     winrate_by_role = winrate_by_role.round(2)
 
     # Calculate Effectiveness by Wins and Losses
-    effectiveness_df = df.groupby(['Champion', 'Role', 'Win']).agg({
+    effectiveness_df = df.groupby(['Champion', 'Role', 'Win'], observed=True).agg({
             'Total_Minions_Killed': 'mean',
             'Total_Jungle_Monsters_Killed': 'mean',
             'Total_Damage_DealtToChampions': 'mean',
@@ -673,21 +1626,16 @@ def df_to_statdfs(df : DataFrame) -> tuple:
     effectiveness_df = effectiveness_df.round(2)
 
     # Fetch Runepage ID Matching Dictionaries and Map
-    runes = json_extract_runes()
-    treepage = {
-        8000: "Precision",
-        8100: "Domination",
-        8200: "Sorcery",
-        8300: "Inspiration",
-        8400: "Resolve"
-    }
+    runes = get_rune_names()
+    treepage = TREE_PAGES
 
-    df['Primary_Tree'] = df['Primary_Tree'].replace(treepage)
-    df['Secondary_Tree'] = df['Secondary_Tree'].replace(treepage)
-    df['Primary_Keystone'] = df['Primary_Keystone'].replace(runes)
+    # Names repeat on every row, keep them as categories instead of one Python string each
+    df['Primary_Tree'] = df['Primary_Tree'].astype(object).replace(treepage).astype('category')
+    df['Secondary_Tree'] = df['Secondary_Tree'].astype(object).replace(treepage).astype('category')
+    df['Primary_Keystone'] = df['Primary_Keystone'].astype(object).replace(runes).astype('category')
 
     # Calculate Runepages by Tree Winrates
-    tree_runes_df = df.groupby(['Champion', 'Role', 'Primary_Tree', 'Secondary_Tree']).agg(
+    tree_runes_df = df.groupby(['Champion', 'Role', 'Primary_Tree', 'Secondary_Tree'], observed=True).agg(
         Winrate=('Win', 'mean'),
         Games_Played=('Win', 'count')
     ).reset_index()
@@ -696,7 +1644,7 @@ def df_to_statdfs(df : DataFrame) -> tuple:
 
 
     # Calculate Runepages by Keystone and Secondary Tree Winrates
-    keystone_runes_df = df.groupby(['Champion', 'Role', 'Primary_Keystone', 'Secondary_Tree']).agg(
+    keystone_runes_df = df.groupby(['Champion', 'Role', 'Primary_Keystone', 'Secondary_Tree'], observed=True).agg(
         Winrate=('Win', 'mean'),
         Games_Played=('Win', 'count')
     ).reset_index()
@@ -712,17 +1660,17 @@ def df_to_statdfs(df : DataFrame) -> tuple:
 
     melted_df = melted_df[melted_df['Item'] != 0] # Get rid of empty items
 
-    item_winrate_df = melted_df.groupby(['Champion', 'Item']).agg(
+    item_winrate_df = melted_df.groupby(['Champion', 'Item'], observed=True).agg(
         Winrate=('Win', 'mean'),
         Games_Played=('Win', 'count')
     ).reset_index()
 
-    mydict = json_extract_important_items()
+    mydict = get_important_items()
 
     items_to_keep = list(mydict.keys())
     item_winrate_df = item_winrate_df[item_winrate_df['Item'].isin(items_to_keep)] # Get rid of unwanted items (components, epic items)
 
-    item_winrate_df['Item'] = item_winrate_df['Item'].replace(mydict) # Replace IDs with Names
+    item_winrate_df['Item'] = item_winrate_df['Item'].astype(object).replace(mydict) # Replace IDs with Names
     item_winrate_df = purge_df(item_winrate_df)
     item_winrate_df = item_winrate_df.round(4)
     item_winrate_df = item_winrate_df.sort_values(by='Games_Played', ascending = False)
@@ -745,7 +1693,7 @@ def download_item_images(dir = './static/images/items') -> None:
     """
     
 
-    item_dict = json_extract_important_items()
+    item_dict = get_important_items()
 
     for id in item_dict:
         name = item_dict[id]
@@ -754,7 +1702,7 @@ def download_item_images(dir = './static/images/items') -> None:
         items_url = f'http://ddragon.leagueoflegends.com/cdn/{latest_patch}/img/item/{id}.png'
         save_path = dir + f'/{name}.png'
         
-        resp = requests.get(items_url)
+        resp = http_client.get(items_url)
         if resp.status_code == 200:
             with open(save_path, 'wb') as file:
                 print(f'{name} downloaded')
@@ -778,7 +1726,7 @@ def download_champion_images(dir = './templates/images/champions') -> None:
 
     
     champions_url = f'http://ddragon.leagueoflegends.com/cdn/{latest_patch}/data/en_US/champion.json'
-    resp = requests.get(champions_url)
+    resp = http_client.get(champions_url)
     data = resp.json()
 
 
@@ -789,7 +1737,7 @@ def download_champion_images(dir = './templates/images/champions') -> None:
         icon_url = f'http://ddragon.leagueoflegends.com/cdn/{latest_patch}/img/champion/{champion}.png'        
         save_path = dir + f'/{champ_name}.png'
         
-        resp = requests.get(icon_url)
+        resp = http_client.get(icon_url)
         if resp.status_code == 200:
             with open(save_path, 'wb') as file:
                 file.write(resp.content)
@@ -0,0 +1,396 @@
+"""
+Persistent sum/count accumulators behind the tables returned by Helper.df_to_statdfs().
+
+Every table the website shows is a mean (or a winrate, the mean of Win) per group, so it can be rebuilt from the sum
+and non-null count of each column per group. Those sums and counts are kept in aggregates.pkl together with the ids
+of the match store segments already folded into them. A new segment is folded in by grouping only its rows, and the
+six tables are then derived from the accumulators in time proportional to the number of groups, not matches.
+"""
+
+import os
+import pickle
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+import Helper as req
+import match_store
+import storage
+
+OBJECTIVE_COLUMNS = ['Barons_Killed', 'Void_Grubs_Killed', 'Dragons_Killed', 'Turrets_Killed', 'Rift_Heralds_Killed']
+
+EFFECTIVENESS_COLUMNS = ['Total_Minions_Killed', 'Total_Jungle_Monsters_Killed', 'Total_Damage_DealtToChampions', 'KDA',
+                         'Kill_Participation', 'Damage_Share', 'Turret_Plates_Taken', 'Gold_Per_Minute', 'Damage_Per_Minute',
+                         'Vision_Score_Per_Minute', 'Lane_Minions_Before_10_Minutes', 'Jungle_CS_Before_10_Minutes', 'Sol_Kills']
+
+ITEM_COLUMNS = ['Item0', 'Item1', 'Item2', 'Item3', 'Item4', 'Item5', 'Item6']
+
+# Accumulator name -> (group keys, columns whose sum and count are kept per group)
+GROUPINGS = {
+    'champion_role_win': (['Champion', 'Role', 'Win'], OBJECTIVE_COLUMNS + EFFECTIVENESS_COLUMNS),
+    'champion_role': (['Champion', 'Role'], ['Win']),
+    'tree_runes': (['Champion', 'Role', 'Primary_Tree', 'Secondary_Tree'], ['Win']),
+    'keystone_runes': (['Champion', 'Role', 'Primary_Keystone', 'Secondary_Tree'], ['Win']),
+    'items': (['Champion', 'Item'], ['Win'])
+}
+
+ACCUMULATOR_VERSION = 1
+
+# Largest number of possible groups counted with one bin each, beyond it only the groups present get a bin
+DENSE_BINS = 1 << 22
+
+
+
+def empty_accumulators() -> dict:
+    """
+    @Return:
+        Accumulators with no matches folded into them
+    """
+    return {'version': ACCUMULATOR_VERSION, 'segments': [], 'tables': {}}
+
+
+
+def as_float(series: pd.Series) -> np.ndarray:
+    """
+    Converts a bool/int/float column, nullable or not, to a float64 array with NaN for missing values.
+    """
+    return series.to_numpy(dtype = 'float64', na_value = np.nan)
+
+
+
+def factorize(series: pd.Series) -> tuple:
+    """
+    @Return:
+        A tuple of the int64 code of every row (-1 where the value is missing) and the sorted distinct values as Python objects
+    """
+    codes, uniques = pd.factorize(series, sort = True)
+    return codes.astype(np.int64), np.asarray(uniques, dtype = object)
+
+
+
+def bin_sums(bins: np.ndarray, size: int, values: dict) -> tuple:
+    """
+    Sums and counts every array in values per bin with np.bincount, one pass per array.
+
+    @Parameters:
+        bins (np.ndarray): The bin of every row, between 0 and size - 1
+        size (int): The number of bins
+        values (dict): Column name -> float64 array with NaN for missing values, aligned with bins
+
+    @Return:
+        A tuple of the number of rows per bin and a dict of column name -> (sum per bin, non-null count per bin)
+    """
+    rows = np.bincount(bins, minlength = size)
+    totals = {}
+    for name, array in values.items():
+        present = ~np.isnan(array)
+        if present.all():
+            totals[name] = (np.bincount(bins, weights = array, minlength = size), rows.astype(np.float64))
+        else:
+            totals[name] = (np.bincount(bins, weights = np.where(present, array, 0), minlength = size),
+                            np.bincount(bins, weights = present, minlength = size))
+    return rows, totals
+
+
+
+def bins_to_frame(rows: np.ndarray, totals: dict, levels: list, keys: list[str], labels = None) -> DataFrame:
+    """
+    Turns per-bin sums and counts into the layout of an accumulator table, keeping only bins that have rows.
+
+    @Parameters:
+        rows (np.ndarray): The number of rows per bin, from bin_sums()
+        totals (dict): Column name -> (sums, counts) per bin, from bin_sums()
+        levels (list): The distinct values of every key, from factorize()
+        keys (list[str]): The names of the keys
+        labels (np.ndarray, optional): The flat group id of every bin, if the bins were compacted
+
+    @Return:
+        A DataFrame indexed by keys with a (value, 'sum'/'count') column for every value, sorted by its index
+    """
+    present = np.flatnonzero(rows)
+    codes = np.unravel_index(present if labels is None else labels[present], [len(level) for level in levels])
+    index = pd.MultiIndex.from_arrays([level[code] for level, code in zip(levels, codes)], names = keys)
+
+    columns = {}
+    for name, (sums, counts) in totals.items():
+        columns[(name, 'sum')] = sums[present]
+        columns[(name, 'count')] = counts[present].astype(np.int64)
+    return pd.DataFrame(columns, index = index).sort_index()
+
+
+
+def grouped_sum_count(keys: list[str], factors: dict, values: dict) -> DataFrame:
+    """
+    Groups rows by already factorized keys and computes the sum and non-null count of every value. Rows with a missing
+    key are dropped, like a plain groupby.
+
+    @Parameters:
+        keys (list[str]): The columns to group by
+        factors (dict): Column name -> factorize() result, for at least every key
+        values (dict): Column name -> float64 array of the columns to sum and count
+
+    @Return:
+        A DataFrame indexed by keys with a (value, 'sum'/'count') column for every value
+    """
+    codes = [factors[key][0] for key in keys]
+    levels = [factors[key][1] for key in keys]
+
+    keep = np.logical_and.reduce([code >= 0 for code in codes])
+    if not keep.all():
+        codes = [code[keep] for code in codes]
+        values = {name: array[keep] for name, array in values.items()}
+    groups = np.ravel_multi_index(codes, [max(len(level), 1) for level in levels])
+
+    size = int(np.prod([max(len(level), 1) for level in levels], dtype = np.int64))
+    if size <= DENSE_BINS:
+        rows, totals = bin_sums(groups, size, values)
+        return bins_to_frame(rows, totals, levels, keys)
+
+    labels, bins = np.unique(groups, return_inverse = True) # Too many possible groups for one bin each, only keep seen ones
+    rows, totals = bin_sums(bins, len(labels), values)
+    return bins_to_frame(rows, totals, levels, keys, labels)
+
+
+
+def item_sum_count(df: DataFrame, champions: tuple, win: np.ndarray) -> DataFrame:
+    """
+    Computes the Win sum and count per (Champion, Item) over every non-empty item slot, one slot at a time, instead of
+    melting the seven item columns into one long frame.
+
+    @Parameters:
+        df (DataFrame): The matches
+        champions (tuple): factorize() of the Champion column
+        win (np.ndarray): The Win column as a float64 array
+
+    @Return:
+        A DataFrame indexed by (Champion, Item) with ('Win', 'sum') and ('Win', 'count') columns
+    """
+    slots = [df[column].to_numpy(dtype = np.int64, na_value = 0) for column in ITEM_COLUMNS]
+    items = np.unique(np.concatenate([pd.unique(slot) for slot in slots]))
+    items = items[items != 0] # Get rid of empty items
+
+    champion_codes, champion_names = champions
+    size = max(len(champion_names), 1) * max(len(items), 1)
+    rows = np.zeros(size + 1, dtype = np.int64)
+    sums, counts = np.zeros(size + 1), np.zeros(size + 1)
+
+    for slot in slots:
+        # Empty slots and unknown champions go to an extra bin that is dropped at the end
+        bins = np.where((slot != 0) & (champion_codes >= 0), champion_codes * len(items) + np.searchsorted(items, slot), size)
+        slot_rows, totals = bin_sums(bins, size + 1, {'Win': win})
+        rows += slot_rows
+        sums += totals['Win'][0]
+        counts += totals['Win'][1]
+
+    return bins_to_frame(rows[:size], {'Win': (sums[:size], counts[:size])}, [champion_names, items.astype(object)], GROUPINGS['items'][0])
+
+
+
+def fused_sum_count(df: DataFrame) -> dict:
+    """
+    Computes the sums and counts of every table in GROUPINGS in one pass over df. Every key column is factorized once and
+    shared between the groupings, and every value column is converted to float once.
+
+    @Parameters:
+        df (DataFrame): Matches with at least the columns in Helper.STAT_COLUMNS
+
+    @Return:
+        A dict of accumulator name -> DataFrame indexed by the grouping's keys with a (value, 'sum'/'count') column for every value
+    """
+    key_columns = {key for keys, _ in GROUPINGS.values() for key in keys if key != 'Item'}
+    value_columns = {value for _, values in GROUPINGS.values() for value in values}
+    factors = {key: factorize(df[key]) for key in key_columns}
+    floats = {value: as_float(df[value]) for value in value_columns}
+
+    tables = {}
+    for name, (keys, values) in GROUPINGS.items():
+        if name == 'items':
+            tables[name] = item_sum_count(df, factors['Champion'], floats['Win'])
+        else:
+            tables[name] = grouped_sum_count(keys, factors, {value: floats[value] for value in values})
+    return tables
+
+
+
+def fold_rows(accumulators: dict, df: DataFrame) -> dict:
+    """
+    Adds the sums and counts of the matches in df to the accumulators, in time proportional to the rows of df plus the
+    number of groups. Only the player's rows are counted, see match_store.own_rows().
+
+    @Parameters:
+        accumulators (dict): Accumulators from load_accumulators() or empty_accumulators()
+        df (DataFrame): New matches, with at least the columns in Helper.STAT_COLUMNS
+
+    @Return:
+        The updated accumulators
+    """
+    tables = accumulators['tables']
+    for name, part in fused_sum_count(match_store.own_rows(df)).items():
+        tables[name] = tables[name].add(part, fill_value = 0) if name in tables else part
+    return accumulators
+
+
+
+def update_accumulators(accumulators: dict, directory = 'data') -> tuple:
+    """
+    Folds every segment of the match store that isn't in the accumulators yet into them. If a segment folded earlier is
+    gone (the store was rebuilt), the accumulators are rebuilt from scratch.
+
+    @Parameters:
+        accumulators (dict): Accumulators from load_accumulators()
+        directory (str): The folder of the match store
+
+    @Return:
+        A tuple of the updated accumulators and whether anything changed
+    """
+    segments = {match_store.segment_id(path): path for path in match_store.list_segments(directory)}
+
+    changed = False
+    if accumulators.get('version') != ACCUMULATOR_VERSION or not set(accumulators['segments']) <= set(segments):
+        accumulators = empty_accumulators()
+        changed = True
+
+    for id, path in segments.items():
+        if id in accumulators['segments']:
+            continue
+        fold_rows(accumulators, match_store.read_segment(path, columns = req.STAT_COLUMNS))
+        accumulators['segments'].append(id)
+        changed = True
+
+    return accumulators, changed
+
+
+
+def load_accumulators(path = 'aggregates.pkl') -> dict:
+    """
+    @Parameters:
+        path (str): The file the accumulators are pickled in
+
+    @Return:
+        The stored accumulators, empty ones if there is no file yet
+    """
+    if not os.path.exists(path):
+        return empty_accumulators()
+    with open(path, 'rb') as file:
+        return pickle.load(file)
+
+
+
+def save_accumulators(accumulators: dict, path = 'aggregates.pkl') -> None:
+    """
+    Pickles the accumulators to path with storage.atomic_write(), so a reader never sees a partial file.
+
+    @Parameters:
+        accumulators (dict): The accumulators to store
+        path (str): The file to store them in
+    """
+    with storage.atomic_write(path, 'wb') as file:
+        pickle.dump(accumulators, file, protocol = pickle.HIGHEST_PROTOCOL)
+
+
+
+def refresh_accumulators(directory = 'data', path = 'aggregates.pkl') -> dict:
+    """
+    Loads the stored accumulators, folds in any new segments of the match store and stores them again if they changed.
+    Run after every update so the website starts without touching the match history.
+
+    @Parameters:
+        directory (str): The folder of the match store
+        path (str): The file the accumulators are pickled in
+
+    @Return:
+        The up to date accumulators
+    """
+    accumulators, changed = update_accumulators(load_accumulators(path), directory)
+    if changed:
+        save_accumulators(accumulators, path)
+    return accumulators
+
+
+
+def means(table: DataFrame, values: list[str]) -> DataFrame:
+    """
+    @Return:
+        The mean of every column in values per group, NaN where a group has no values
+    """
+    sums = table.xs('sum', axis = 1, level = 1)[values]
+    counts = table.xs('count', axis = 1, level = 1)[values]
+    return sums / counts.where(counts > 0)
+
+
+
+def winrates(table: DataFrame, names = None) -> DataFrame:
+    """
+    Turns a Win sum/count table into Winrate and Games_Played. If names is given, it maps every level of the index through
+    it first and merges groups that end up with the same names, like replacing the ids before grouping would.
+
+    @Return:
+        A DataFrame with the group keys as columns plus Winrate and Games_Played
+    """
+    table = table['Win']
+    if names:
+        keys = table.index.names
+        mapped = [table.index.get_level_values(level).map(lambda key: names.get(key, key)) for level in range(table.index.nlevels)]
+        table = table.groupby(mapped).sum()
+        table.index.names = keys
+
+    result = pd.DataFrame({
+        'Winrate': table['sum'] / table['count'].where(table['count'] > 0),
+        'Games_Played': table['count'].astype('int64')
+    })
+    return result.reset_index()
+
+
+
+def accumulators_to_statdfs(accumulators: dict, runes = None, items = None) -> tuple:
+    """
+    Derives the same six tables as Helper.df_to_statdfs() from the accumulators.
+
+    @Parameters
+        accumulators (dict): Accumulators from refresh_accumulators()
+        runes (dict, optional): Rune ID -> name, from Helper.get_rune_names() if None
+        items (dict, optional): Item ID -> name of the items to keep, from Helper.get_important_items() if None
+
+    @Returns
+        a tuple of DataFrames: objective_df, winrate_by_role, effectiveness_df, tree_runes_df, keystone_runes_df, item_winrate_df
+    """
+    tables = accumulators['tables']
+    if not tables:
+        return tuple(pd.DataFrame() for _ in range(6))
+
+    champion_role_win = tables['champion_role_win'].sort_index()
+
+    objective_df = means(champion_role_win, OBJECTIVE_COLUMNS).reset_index()
+    objective_df = req.purge_df(objective_df)
+    objective_df = objective_df.round(2)
+
+    winrate_by_role = winrates(tables['champion_role'].sort_index())
+    winrate_by_role = req.purge_df(winrate_by_role)
+    winrate_by_role = winrate_by_role.round(2)
+
+    effectiveness_df = means(champion_role_win, EFFECTIVENESS_COLUMNS).reset_index()
+    effectiveness_df = req.purge_df(effectiveness_df)
+    effectiveness_df = effectiveness_df.round(2)
+
+    runes = runes if runes is not None else req.get_rune_names()
+    tree_names = dict(req.TREE_PAGES)
+
+    tree_runes_df = winrates(tables['tree_runes'], tree_names)
+    tree_runes_df = req.purge_df(tree_runes_df)
+    tree_runes_df = tree_runes_df.round(2)
+
+    keystone_names = {**runes, **tree_names} # Keystone ids and tree ids don't overlap
+    keystone_runes_df = winrates(tables['keystone_runes'], keystone_names)
+    keystone_runes_df['Score'] = keystone_runes_df['Winrate'] * keystone_runes_df['Games_Played']
+    keystone_runes_df = req.purge_df(keystone_runes_df)
+    keystone_runes_df = keystone_runes_df.round(4)
+    keystone_runes_df = keystone_runes_df.sort_values(by='Winrate', ascending = False)
+
+    items = items if items is not None else req.get_important_items()
+    item_winrate_df = winrates(tables['items'].sort_index())
+    item_winrate_df = item_winrate_df[item_winrate_df['Item'].isin(list(items.keys()))] # Get rid of unwanted items (components, epic items)
+    item_winrate_df['Item'] = item_winrate_df['Item'].replace(items) # Replace IDs with Names
+    item_winrate_df = req.purge_df(item_winrate_df)
+    item_winrate_df = item_winrate_df.round(4)
+    item_winrate_df = item_winrate_df.sort_values(by='Games_Played', ascending = False)
+
+    return objective_df, winrate_by_role, effectiveness_df, tree_runes_df, keystone_runes_df, item_winrate_df
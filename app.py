@@ -1,287 +1,73 @@
-from flask import Flask, jsonify, render_template, request, send_from_directory, url_for
-import pandas as pd
-import Helper as req
+from flask import Flask, abort, jsonify, make_response, render_template, request, send_from_directory, url_for
+from collections import OrderedDict, namedtuple
+import match_store
+import metrics
+import pages
 import os
+import time
+import hashlib
+import logging
+import threading
 
 app = Flask(__name__)
 """
 Global Variables
 """
-data_file = "data.pkl"
+data_store = "data"
+legacy_data_file = "data.pkl"
+aggregates_file = "aggregates.pkl"
+pages_file = "pages.bin"
 
 
-global df 
-df = pd.read_pickle(data_file)
+watch_interval = float(os.environ.get('LOL_WATCH_INTERVAL', 10)) # Seconds between checks for a new dataset, 0 to disable
+admin_token = os.environ.get('LOL_ADMIN_TOKEN') # If set, required in the X-Admin-Token header of /admin/reload
+slow_request_ms = float(os.environ.get('LOL_PROFILE_SLOW_MS', 0)) # Requests slower than this write a stack profile to profiles/, 0 to disable
 
+metrics.init_app(app, profiler=metrics.SlowRequestProfiler(slow_request_ms / 1000) if slow_request_ms > 0 else None)
 
-"""
-Data Retrieval
-"""
-obj_df, wr_df, stats_df, tree_df, keystone_df, item_df = req.df_to_statdfs(df)
-
-def get_champion_data(champion :str, role: str) -> dict:
-    """
-    Retrieves data associated with champion and role
-    """
-    objective_data = obj_df[(obj_df['Champion'] == champion) & (obj_df['Role'] == role)].to_dict(orient='records')
-    winrate_data = wr_df[(wr_df['Champion'] == champion) & (wr_df['Role'] == role)].to_dict(orient='records')
-    effectiveness_data = stats_df[(stats_df['Champion'] == champion) & (stats_df['Role'] == role)].to_dict(orient='records')
-    tree_runes_data = tree_df[(tree_df['Champion'] == champion) & (tree_df['Role'] == role)].to_dict(orient='records')
-    keystone_runes_data = keystone_df[(keystone_df['Champion'] == champion) & (keystone_df['Role'] == role)].to_dict(orient='records')
-    item_winrate_data = item_df[(item_df['Champion'] == champion)].to_dict(orient='records')
-
-    irrelevant_items = {'Stealth Ward', 'Oracle Lens', 'Control Ward', 'Health Potion', 'Elixir of Avarice', 
-                        'Elixir of Force', 'Farsight Alteration', 'Elixir of Iron', 'Elixir of Sorcery', 'Elixir of Wrath',
-                        'Elixir of Skill', "Doran's Blade", "Doran's Ring", "Doran's Shield", "Cull", "Mosstomper Seedling", "Scorchclaw Pup", 
-                        "Gustwalker Hatchling"}
-    
-    filtered_item_winrate_data = [item for item in item_winrate_data if item['Item'] not in irrelevant_items]
+with metrics.timed(metrics.startup_seconds, step='migrate'):
+    match_store.migrate_pickle(legacy_data_file, data_store)
 
-    
-    return {
-        "objective_data": objective_data,
-        "winrate_data": winrate_data,
-        "effectiveness_data": effectiveness_data,
-        "tree_runes_data": tree_runes_data,
-        "keystone_runes_data": keystone_runes_data,
-        "item_winrate_data": filtered_item_winrate_data,
-    }
 
 """
-Graph Label Retrieval
+Dataset Snapshots
 """
+# An immutable view of one version of the dataset. Requests read current_snapshot once and use that object throughout,
+# so swapping in a new snapshot never affects a request that is already running
+Snapshot = namedtuple('Snapshot', ['version', 'pages'])
 
-def get_radar_graph_labels(raw_data: dict) -> dict:
-    """
-    Returns a dict of the labels and values associated with all of the radar graphs to be created. This includes data on objective control and effectiveness
-    """
-
-    objective_data = raw_data['objective_data']
-    effectiveness_data = raw_data['effectiveness_data']
-
-    # If there are only Losses or Only Wins, Can't have the second dataset
-    if len(objective_data) == 1:
-
-        win = 'Wins' if objective_data[0]['Win'] else 'Losses'
-
-        graph_info = {
-        # Autoscales, 0-6
-        'objective_graph': {
-            'labels': [
-                {'text': 'Barons Killed'},
-                {'text': 'Void Grubs Killed'},
-                {'text': 'Dragons Killed'},
-                {'text': 'Turrets Destroyed'},
-                {'text': 'Turret Plates Taken'},
-                {'text': 'Rift Heralds Killed'}
-                
-            ],
-            'datasets':[
-                {
-                    'label': win,
-                    'data': [objective_data[0]['Barons_Killed'], 
-                             objective_data[0]['Void_Grubs_Killed'], 
-                             objective_data[0]['Dragons_Killed'], 
-                             objective_data[0]['Turrets_Killed'],
-                             effectiveness_data[0]['Turret_Plates_Taken'],
-                             objective_data[0]['Rift_Heralds_Killed']]
-                }
-            ]
-        }, 
-        # Autoscale Should Work, Between 0 - 150 ish
-        'resource_graph': {
-            'labels': [
-                {'text': 'Normalized Gold Per Minute in Tens'},
-                {'text': 'Total Minions Killed'},
-                {'text': 'Total Jungle Monsters Killed'},
-                {'text': 'Lane CS Before 10 Minutes'},
-                {'text': 'Jungle CS Before 10 Minutes'}
-
-            ],
-            'datasets':[
-                {
-                    'label': win,
-                    'data': [effectiveness_data[0]['Gold_Per_Minute'] / 10, 
-                             effectiveness_data[0]['Total_Minions_Killed'], 
-                             effectiveness_data[0]['Total_Jungle_Monsters_Killed'], 
-                             effectiveness_data[0]['Lane_Minions_Before_10_Minutes'], 
-                             effectiveness_data[0]['Jungle_CS_Before_10_Minutes']]
-                }
-            ]
-        }, 
-        # Autoscaled, Between 0 - 10 usually
-        'combat_graph': {
-            'labels': [
-                {'text': 'Total Damage Dealt To Champions In Ten Thousands'},
-                {'text': 'KDA'},
-                {'text': 'Damage Per Minute In Hundreds'},
-                {'text': 'Team Damage Share'},
-                {'text': 'Kill Participation'},
-                {'text': 'Vision Score Per Minute'},
-                {'text': 'Solo Kills'}
-            ],
-            'datasets':[
-                
-                {
-                    'label': win,
-                    'data': [effectiveness_data[0]['Total_Damage_DealtToChampions'] / 10000, 
-                             effectiveness_data[0]['KDA'], 
-                             effectiveness_data[0]['Damage_Per_Minute'] / 100,
-                             effectiveness_data[0]['Damage_Share'], 
-                             effectiveness_data[0]['Kill_Participation'], 
-                             effectiveness_data[0]['Vision_Score_Per_Minute'],
-                             effectiveness_data[0]['Sol_Kills']]
-                            
-                }
-            ]
-        }, 
-    }
-    
-    else:
-
-        graph_info = {
-            # Autoscales, 0-6
-            'objective_graph': {
-                'labels': [
-                    {'text': 'Barons Killed'},
-                    {'text': 'Void Grubs Killed'},
-                    {'text': 'Dragons Killed'},
-                    {'text': 'Turrets Destroyed'},
-                    {'text': 'Turret Plates Taken'},
-                    {'text': 'Rift Heralds Killed'}
-                    
-                ],
-                'datasets':[
-                    
-                
-                    { 
-                        'label': 'Wins',
-                        'data': [objective_data[1]['Barons_Killed'], 
-                                objective_data[1]['Void_Grubs_Killed'], 
-                                objective_data[1]['Dragons_Killed'], 
-                                objective_data[1]['Turrets_Killed'], 
-                                effectiveness_data[1]['Turret_Plates_Taken'],
-                                objective_data[1]['Rift_Heralds_Killed']]
-                    },
-                    {
-                        'label': 'Losses',
-                        'data': [objective_data[0]['Barons_Killed'], 
-                                objective_data[0]['Void_Grubs_Killed'], 
-                                objective_data[0]['Dragons_Killed'], 
-                                objective_data[0]['Turrets_Killed'],
-                                effectiveness_data[0]['Turret_Plates_Taken'],
-                                objective_data[0]['Rift_Heralds_Killed']]
-                    }
-                ]
-            }, 
-            # Autoscale Should Work, Between 0 - 150 ish
-            'resource_graph': {
-                'labels': [
-                    {'text': 'Normalized Gold Per Minute in Tens'},
-                    {'text': 'Total Minions Killed'},
-                    {'text': 'Total Jungle Monsters Killed'},
-                    {'text': 'Lane CS Before 10 Minutes'},
-                    {'text': 'Jungle CS Before 10 Minutes'}
-
-                ],
-                'datasets':[
-                    
-                
-                    { 
-                        'label': 'Wins',
-                        'data': [effectiveness_data[1]['Gold_Per_Minute'] / 10, 
-                                effectiveness_data[1]['Total_Minions_Killed'], 
-                                effectiveness_data[1]['Total_Jungle_Monsters_Killed'], 
-                                effectiveness_data[1]['Lane_Minions_Before_10_Minutes'], 
-                                effectiveness_data[1]['Jungle_CS_Before_10_Minutes']]
-                                
-
-                    },
-                    {
-                        'label': 'Losses',
-                        'data': [effectiveness_data[0]['Gold_Per_Minute'] / 10, 
-                                effectiveness_data[0]['Total_Minions_Killed'], 
-                                effectiveness_data[0]['Total_Jungle_Monsters_Killed'], 
-                                effectiveness_data[0]['Lane_Minions_Before_10_Minutes'], 
-                                effectiveness_data[0]['Jungle_CS_Before_10_Minutes']]
-                    }
-                ]
-            }, 
-            # Autoscaled, Between 0 - 10 usually
-            'combat_graph': {
-                'labels': [
-                    {'text': 'Total Damage Dealt To Champions In Ten Thousands'},
-                    {'text': 'KDA'},
-                    {'text': 'Damage Per Minute In Hundreds'},
-                    {'text': 'Team Damage Share'},
-                    {'text': 'Kill Participation'},
-                    {'text': 'Vision Score Per Minute'},
-                    {'text': 'Solo Kills'}
-                ],
-                'datasets':[
-                    
-                
-                    { 
-                        'label': 'Wins',
-                        'data': [effectiveness_data[1]['Total_Damage_DealtToChampions'] / 10000, 
-                                effectiveness_data[1]['KDA'], 
-                                effectiveness_data[1]['Damage_Per_Minute'] / 100,
-                                effectiveness_data[1]['Damage_Share'], 
-                                effectiveness_data[1]['Kill_Participation'], 
-                                effectiveness_data[1]['Vision_Score_Per_Minute'],
-                                effectiveness_data[1]['Sol_Kills']]
-                                
-
-                    },
-                    {
-                        'label': 'Losses',
-                        'data': [effectiveness_data[0]['Total_Damage_DealtToChampions'] / 10000, 
-                                effectiveness_data[0]['KDA'], 
-                                effectiveness_data[0]['Damage_Per_Minute'] / 100,
-                                effectiveness_data[0]['Damage_Share'], 
-                                effectiveness_data[0]['Kill_Participation'], 
-                                effectiveness_data[0]['Vision_Score_Per_Minute'],
-                                effectiveness_data[0]['Sol_Kills']]
-                                
-                    }
-                ]
-            }, 
-        }
+def build_snapshot(materialize = True):
+    """
+    Loads the champion pages of the current version of the match store. Every champion page is built by update_data(),
+    they are only built here if that hasn't happened for this version (or None is returned if materialize is False)
+    """
+    with metrics.timed(metrics.dataset_load_seconds, step='open_pages'):
+        version = match_store.store_version(data_store)
+        page_store = pages.load_pages(pages_file, version)
+    if page_store is None:
+        if not materialize:
+            return None
+        with metrics.timed(metrics.dataset_load_seconds, step='materialize'):
+            version = pages.materialize_pages(data_store, aggregates_file, pages_file)
+        page_store = pages.load_pages(pages_file, version)
+    return Snapshot(version, page_store)
+
+with metrics.timed(metrics.startup_seconds, step='snapshot'):
+    current_snapshot = build_snapshot()
+metrics.record_snapshot(current_snapshot.version, len(current_snapshot.pages))
 
-    return graph_info
 
 """
-Best Runepages Logic and Retrieval
+Data Retrieval
 """
-
-def get_runepage_recs(raw_data: dict) -> dict:
-
-    runepage_data = raw_data['keystone_runes_data']
-    # Find the runepages with the best winrate, best score (games played * winrate), and most games played
-    best_runepages = [max(runepage_data, key=lambda x: x['Winrate']), 
-                     max(runepage_data, key=lambda x: x['Score']), 
-                     max(runepage_data, key=lambda x: x['Games_Played'])]
-    
-    
-    # Sort this into a dictionary to be passed to the frontend
-    runepage_info = {
-        'winrate_keystone': best_runepages[0]['Primary_Keystone'],
-        'winrate_secondary': best_runepages[0]['Secondary_Tree'],
-        'winrate_wr': best_runepages[0]['Winrate'],
-        'winrate_gp': best_runepages[0]['Games_Played'],
-        'score_keystone': best_runepages[1]['Primary_Keystone'],
-        'score_secondary': best_runepages[1]['Secondary_Tree'],
-        'score_wr': best_runepages[1]['Winrate'],
-        'score_gp': best_runepages[1]['Games_Played'],
-        'games_keystone': best_runepages[2]['Primary_Keystone'],
-        'games_secondary': best_runepages[2]['Secondary_Tree'],
-        'games_wr': best_runepages[2]['Winrate'],
-        'games_gp': best_runepages[2]['Games_Played'],
-    }
-
-    return runepage_info
-
-
+def get_champion_data(champion :str, role: str, snapshot = None) -> dict:
+    """
+    Retrieves data associated with champion and role
+    """
+    payload = (snapshot or current_snapshot).pages.get((champion, role))
+    if payload is None:
+        return {**pages.empty_role_data, "item_winrate_data": []}
+    return payload['info']
 
 """
 Image Retrieval
@@ -326,6 +112,7 @@ def search():
     If the data doesn't exist, returns exists as false, which a script will handle and provide a pop-up error message
     """
     data = request.get_json()
+    snapshot = current_snapshot
 
     name_change = {
         'Lee Sin': 'LeeSin',
@@ -340,7 +127,7 @@ def search():
     }
     champion_name = name_change[data['championName']] if data['championName'] in name_change else data['championName']
 
-    info = get_champion_data(champion_name, data['role'])
+    info = get_champion_data(champion_name, data['role'], snapshot)
     exists = any(info.values())
 
     if exists and info['winrate_data']:
@@ -350,6 +137,148 @@ def search():
         return jsonify({'exists': False})
     
 
+"""
+Rendered Response Cache
+"""
+response_cache_size = 256
+response_cache = OrderedDict() # (champion, role, dataset version) -> (body, etag), least recently used first
+response_cache_lock = threading.Lock()
+
+def get_cached_response(key: tuple):
+    """
+    Returns the cached (body, etag) for key and marks it as recently used, None if it isn't cached
+    """
+    with response_cache_lock:
+        entry = response_cache.get(key)
+        if entry is not None:
+            response_cache.move_to_end(key)
+        return entry
+
+def cache_response(key: tuple, body: str) -> tuple:
+    """
+    Caches a rendered page under key with a strong ETag of its content, evicting the least recently used page if full
+    """
+    entry = (body, hashlib.sha1(body.encode()).hexdigest())
+    with response_cache_lock:
+        response_cache[key] = entry
+        response_cache.move_to_end(key)
+        while len(response_cache) > response_cache_size:
+            response_cache.popitem(last=False)
+    return entry
+
+def conditional_response(body: str, etag: str):
+    """
+    Answers with 304 Not Modified if the client already has this version of the page, the page otherwise
+    """
+    if request.if_none_match.contains(etag):
+        response = make_response('', 304)
+    else:
+        response = make_response(body)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache' # Browsers may keep the page but must revalidate it
+    return response
+
+
+def clear_response_cache() -> None:
+    """
+    Drops every cached page, called when a new dataset is loaded
+    """
+    with response_cache_lock:
+        response_cache.clear()
+
+
+"""
+Snapshot Reloading
+"""
+reload_lock = threading.Lock()
+
+def swap_snapshot(snapshot: Snapshot) -> None:
+    """
+    Makes snapshot the one new requests are served from. Replacing the global reference is atomic, requests that
+    already hold the old snapshot finish with it
+    """
+    global current_snapshot
+    current_snapshot = snapshot
+    clear_response_cache()
+    metrics.record_snapshot(snapshot.version, len(snapshot.pages))
+    metrics.dataset_reloads.inc()
+    logging.info(f"Serving dataset version {snapshot.version}")
+
+def reload_snapshot(materialize = True) -> bool:
+    """
+    Builds a snapshot of the current dataset and swaps it in if its version differs from the one being served.
+    Only one reload runs at a time. Returns True if a new snapshot was swapped in
+    """
+    if not reload_lock.acquire(blocking=False):
+        return False
+    try:
+        if match_store.store_version(data_store) == current_snapshot.version:
+            return False
+        snapshot = build_snapshot(materialize=materialize)
+        if snapshot is None or snapshot.version == current_snapshot.version:
+            return False
+        swap_snapshot(snapshot)
+        return True
+    finally:
+        reload_lock.release()
+
+def watch_dataset() -> None:
+    """
+    Polls the match store and swaps in a new snapshot once update_data() has finished writing the pages of a new version
+    """
+    while True:
+        time.sleep(watch_interval)
+        try:
+            reload_snapshot(materialize=False)
+        except Exception as e:
+            logging.warning(f"Reloading the dataset failed: {e}")
+
+def start_watcher() -> None:
+    """
+    Starts the thread that watches for new datasets, if enabled
+    """
+    if watch_interval > 0:
+        threading.Thread(target=watch_dataset, name='dataset-watcher', daemon=True).start()
+
+def after_fork_in_worker() -> None:
+    """
+    Threads and held locks don't survive a fork. When a server forks workers from a process that already imported the
+    app (e.g. gunicorn with preload_app), each worker inherits the snapshot and its memory-mapped pages for free and
+    only needs fresh locks and its own watcher
+    """
+    global response_cache_lock, reload_lock
+    response_cache_lock = threading.Lock()
+    reload_lock = threading.Lock()
+    start_watcher()
+
+start_watcher()
+os.register_at_fork(after_in_child=after_fork_in_worker)
+
+@app.route('/admin/reload', methods=['POST'])
+def admin_reload():
+    """
+    Rebuilds the snapshot from the current dataset in the background and swaps it in when it is ready. Only allowed from
+    this machine, or with the admin token if one is configured
+    """
+    if admin_token:
+        if request.headers.get('X-Admin-Token') != admin_token:
+            abort(403)
+    elif request.remote_addr not in ('127.0.0.1', '::1'):
+        abort(403)
+
+    threading.Thread(target=reload_snapshot, name='dataset-reload', daemon=True).start()
+    return jsonify({'reloading': True, 'version': current_snapshot.version}), 202
+
+@app.route('/metrics')
+def metrics_page():
+    """
+    Request latencies, dataset load times and memory of this process in the Prometheus text format
+    """
+    response = make_response(metrics.render_metrics())
+    response.headers['Content-Type'] = 'text/plain; version=0.0.4; charset=utf-8'
+    return response
+
+
 """
 Template Rendering
 """
@@ -373,6 +302,12 @@ def champion_page():
     
     role = request.args.get('role')
 
+    snapshot = current_snapshot
+    cache_key = (champion, role, snapshot.version)
+    cached = get_cached_response(cache_key)
+    if cached:
+        return conditional_response(*cached)
+
     external_champion = champion
     name_change = {
         'Lee Sin': 'LeeSin',
@@ -391,26 +326,35 @@ def champion_page():
     
     
 
-    raw_info = get_champion_data(champion, role)
+    with metrics.champion_phase_seconds.time(phase='lookup'):
+        payload = snapshot.pages.get((champion, role))
+    if payload is None:
+        abort(404)
 
-    role_map = {
-        'TOP': 'Top',
-        'JUNGLE': 'Jungle',
-        'MIDDLE': 'Middle',
-        'BOTTOM': 'Bottom',
-        'UTILITY': 'Support'
-    }
-    external_role = role_map[role]
+    with metrics.champion_phase_seconds.time(phase='build'):
+        raw_info = payload['info']
+
+        role_map = {
+            'TOP': 'Top',
+            'JUNGLE': 'Jungle',
+            'MIDDLE': 'Middle',
+            'BOTTOM': 'Bottom',
+            'UTILITY': 'Support'
+        }
+        external_role = role_map[role]
 
-    radar_labels = get_radar_graph_labels(raw_data=raw_info)
-    item_table_info = raw_info['item_winrate_data']
+        radar_labels = payload['radar_graph_info']
+        item_table_info = raw_info['item_winrate_data']
 
-    runepage_info = get_runepage_recs(raw_data = raw_info)
+        runepage_info = payload['runepage_info']
     
 
-    return render_template('champion.html', champion=champion, role=role, info=raw_info, radar_graph_info = radar_labels, 
-                           external_role = external_role, item_table_info = item_table_info, runepage_info = runepage_info
-                           , external_champion=external_champion)
+    with metrics.champion_phase_seconds.time(phase='render'):
+        body = render_template('champion.html', champion=champion, role=role, info=raw_info, radar_graph_info = radar_labels, 
+                               external_role = external_role, item_table_info = item_table_info, runepage_info = runepage_info
+                               , external_champion=external_champion)
+
+    return conditional_response(*cache_response(cache_key, body))
 
 
 
@@ -0,0 +1,58 @@
+"""
+Compares Helper.df_to_statdfs() computed with one pandas groupby per table (plus the melt of the seven item columns)
+against the fused path, which factorizes the group keys once and sums every table with np.bincount. Also times the
+fused sums alone, which is what folding a new segment into the aggregates costs, and checks both paths agree.
+
+    python benchmarks/bench_aggregation.py [--sizes 10000 100000 1000000]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import Helper as req
+import aggregates
+from synthetic import make_frame, register_metadata
+
+
+
+def check_same(groupby_tables: tuple, fused_tables: tuple) -> None:
+    for expected, actual in zip(groupby_tables, fused_tables):
+        expected, actual = expected.reset_index(drop = True), actual.reset_index(drop = True)
+        numbers = expected.select_dtypes('number').columns
+        assert list(expected.columns) == list(actual.columns)
+        assert expected.drop(columns = numbers).astype(str).equals(actual.drop(columns = numbers).astype(str))
+        # Means of float32 columns may land on the other side of a rounding boundary
+        assert np.allclose(expected[numbers], actual[numbers], atol = 0.011, equal_nan = True)
+
+
+
+def best_of(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    register_metadata(req)
+
+    print(f"{'rows':>9} {'groupby s':>10} {'fused s':>9} {'speedup':>8} {'fused sums s':>13}")
+    for size in args.sizes:
+        df = make_frame(size)
+        groupby_time, groupby_tables = best_of(lambda: req.df_to_statdfs(df.copy(), fused=False), args.repeat)
+        fused_time, fused_tables = best_of(lambda: req.df_to_statdfs(df), args.repeat)
+        sums_time, _ = best_of(lambda: aggregates.fused_sum_count(df), args.repeat)
+        check_same(groupby_tables, fused_tables)
+        print(f'{size:>9} {groupby_time:>10.3f} {fused_time:>9.3f} {groupby_time / fused_time:>7.1f}x {sums_time:>13.3f}')
@@ -0,0 +1,193 @@
+"""
+Times every analytics function behind the website and every Flask route against synthetic match histories of growing
+size (see synthetic.make_frame()), and checks each time against benchmarks/thresholds.json. A time over its threshold
+is reported as a REGRESSION and the script exits with status 1.
+
+Times are compared as ratios to a fixed calibration workload timed at the start of the same run (see calibrate()),
+so the thresholds carry over to a faster or slower machine. The thresholds are those ratios with headroom over the
+ones measured when they were written. After an intended change in performance, rewrite them with --update-thresholds.
+
+    python benchmarks/bench_analytics.py [--sizes 10000 100000 1000000 10000000] [--update-thresholds]
+
+10M rows take about 10 minutes, most of it in the groupby path, and a little under 6 GB of memory at their peak.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import timeit
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+os.environ.setdefault('LOL_WATCH_INTERVAL', '0') # No watcher thread while timing the app
+
+import Helper as req
+import aggregates
+import match_store
+import pages
+from synthetic import make_frame, register_metadata
+
+THRESHOLDS_FILE = os.path.join(os.path.dirname(__file__), 'thresholds.json')
+STATIC_FOLDER = os.path.join(os.path.dirname(__file__), '..', 'static')
+
+
+
+def measure(func, repeat = 3) -> float:
+    """
+    @Returns:
+        float: The best time of one call to func in seconds. Fast functions are looped so every sample takes 0.2s or more,
+        functions slower than 2s are only run once.
+    """
+    timer = timeit.Timer(func)
+    number, elapsed = timer.autorange()
+    if elapsed > 2:
+        return elapsed / number
+    return min(timer.repeat(repeat = repeat, number = number)) / number
+
+
+
+def calibrate() -> float:
+    """
+    Times a fixed workload made of what the cases spend their time on, a pandas groupby and a Python loop over dicts,
+    independent of the code being benchmarked so a regression in it can't move the unit.
+
+    @Returns:
+        float: The best time of one run of the workload in seconds, the unit the thresholds are expressed in.
+    """
+    rng = np.random.default_rng(0)
+    frame = pd.DataFrame({'key': rng.integers(0, 1000, 200000), 'value': rng.random(200000)})
+    records = frame.head(20000).to_dict(orient='records')
+
+    def workload():
+        frame.groupby('key')['value'].agg(['sum', 'count'])
+        totals = {}
+        for record in records:
+            totals[record['key']] = totals.get(record['key'], 0.0) + record['value']
+
+    return measure(workload, repeat = 20) # Best of many, it sets the unit of every case
+
+
+
+def load_dataset(size: int):
+    """
+    Generates size matches, stores them as the only segment of the store in the current folder and builds the
+    aggregates and champion pages like update_data() does. Only the columns the aggregates read are kept in memory
+    afterwards, the unique Match_IDs alone take over 1 GB at 10M rows.
+
+    @Returns:
+        tuple: The match DataFrame, with the columns of Helper.STAT_COLUMNS, and the accumulators.
+    """
+    df = make_frame(size)
+    match_store.clear_store()
+    match_store.write_segment(df)
+    df = df[req.STAT_COLUMNS]
+    for path in ('aggregates.pkl', 'pages.bin'):
+        if os.path.exists(path):
+            os.remove(path)
+    pages.materialize_pages()
+    return df, aggregates.load_accumulators()
+
+
+
+def cases(df, accumulators, app, client) -> dict:
+    """
+    @Returns:
+        dict: Case name -> function to time, for the dataset currently loaded by app.
+    """
+    tables = req.df_to_statdfs(df)
+    winrates = tables[1]
+    champion, role = winrates.loc[winrates['Games_Played'].idxmax(), ['Champion', 'Role']] # The page with the most games
+    info = app.get_champion_data(champion, role)
+    largest_table = max(tables, key = len)
+
+    url = f'/champion?champion={champion}&role={role}'
+    etag = client.get(url).headers['ETag'].strip('"')
+
+    def render_champion():
+        app.clear_response_cache()
+        return client.get(url)
+
+    return {
+        'df_to_statdfs': lambda: req.df_to_statdfs(df),
+        'df_to_statdfs (groupby)': lambda: req.df_to_statdfs(df.copy(), fused=False), # Replaces the rune ids in place
+        'fused_sum_count': lambda: aggregates.fused_sum_count(df),
+        'accumulators_to_statdfs': lambda: aggregates.accumulators_to_statdfs(accumulators),
+        'purge_df': lambda: req.purge_df(largest_table),
+        'build_page_payloads': lambda: pages.build_page_payloads(*tables),
+        'get_champion_data': lambda: app.get_champion_data(champion, role),
+        'get_radar_graph_labels': lambda: pages.get_radar_graph_labels(raw_data=info),
+        'get_runepage_recs': lambda: pages.get_runepage_recs(raw_data=info),
+        'GET /': lambda: client.get('/'),
+        'GET /api/images': lambda: client.get('/api/images?folder=champions'),
+        'POST /api/search': lambda: client.post('/api/search', json={'championName': champion, 'role': role}),
+        'GET /champion (render)': render_champion,
+        'GET /champion (cached)': lambda: client.get(url),
+        'GET /champion (304)': lambda: client.get(url, headers={'If-None-Match': f'"{etag}"'}),
+    }
+
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--only', nargs='+', default=None, help='names of the cases to run')
+    parser.add_argument('--update-thresholds', action='store_true', help='write the measured ratios times --headroom as thresholds')
+    parser.add_argument('--headroom', type=float, default=3.0)
+    args = parser.parse_args()
+
+    register_metadata(req)
+    thresholds = {}
+    if os.path.exists(THRESHOLDS_FILE):
+        with open(THRESHOLDS_FILE, 'r') as file:
+            thresholds = json.load(file)
+
+    regressions = []
+    app = None
+    with tempfile.TemporaryDirectory() as folder:
+        os.chdir(folder)
+        os.symlink(os.path.abspath(STATIC_FOLDER), 'static') # /api/images lists static/images relative to the working folder
+
+        unit = calibrate()
+        print(f"calibration: {unit * 1000:.3f} ms\n")
+        print(f"{'case':<26} {'rows':>9} {'ms/call':>11} {'ratio':>9} {'threshold':>9}")
+        for size in args.sizes:
+            df, accumulators = load_dataset(size)
+            if app is None:
+                import app # Loads the dataset of the current folder when imported
+            else:
+                app.reload_snapshot()
+            client = app.app.test_client()
+
+            limits = thresholds.setdefault(str(size), {})
+            for name, func in cases(df, accumulators, app, client).items():
+                if args.only and name not in args.only:
+                    continue
+                seconds = measure(func)
+                ratio = seconds / unit
+                limit = limits.get(name)
+
+                status = ''
+                if args.update_thresholds:
+                    limits[name] = round(ratio * args.headroom, 4)
+                elif limit is not None and ratio > limit:
+                    status = 'REGRESSION'
+                    regressions.append(f'{name} at {size} rows: {ratio:.4f} > {limit:.4f} times the calibration '
+                                       f'({seconds * 1000:.3f} ms > {limit * unit * 1000:.3f} ms)')
+
+                limit_text = f'{limit:.4f}' if limit is not None else '-'
+                print(f'{name:<26} {size:>9} {seconds * 1000:>11.3f} {ratio:>9.4f} {limit_text:>9} {status}')
+            del df, accumulators
+
+    if args.update_thresholds:
+        with open(THRESHOLDS_FILE, 'w') as file:
+            json.dump(thresholds, file, indent=4, sort_keys=True)
+        print(f'Thresholds written to {THRESHOLDS_FILE}')
+
+    if regressions:
+        print(f'\n{len(regressions)} REGRESSION(S):')
+        for regression in regressions:
+            print(f'  {regression}')
+        sys.exit(1)
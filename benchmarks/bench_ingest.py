@@ -0,0 +1,62 @@
+"""
+Compares the time to turn parsed matches into the match DataFrame with the old per-match pd.concat loop and the row
+buffer used by update_data(). The row buffer's time per match should stay flat as the number of matches grows, while
+the concat loop's grows with it.
+
+    python benchmarks/bench_ingest.py [--sizes 250 500 1000 2000]
+"""
+import argparse
+import os
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import Helper as req
+from synthetic import make_matches
+
+PUUID = 'bench-puuid'
+
+
+
+def ingest_concat(matches: list) -> pd.DataFrame:
+    data = pd.DataFrame()
+    for _, match in reversed(matches):
+        data = pd.concat([req.process_match_details(match=match, puuid=PUUID), data])
+    return data
+
+
+
+def ingest_rows(matches: list) -> pd.DataFrame:
+    rows = []
+    for _, match in reversed(matches):
+        row = req.parse_match_row(match=match, puuid=PUUID)
+        if row is not None:
+            rows.append(row)
+    return req.rows_to_frame(rows[::-1])
+
+
+
+def best_of(func, matches, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(matches)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[250, 500, 1000, 2000])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'matches':>8} {'concat s':>10} {'concat us/match':>16} {'rows s':>10} {'rows us/match':>14}")
+    for size in args.sizes:
+        matches = make_matches(size, puuid=PUUID)
+        concat_time = best_of(ingest_concat, matches, args.repeat)
+        rows_time = best_of(ingest_rows, matches, args.repeat)
+        print(f'{size:>8} {concat_time:>10.3f} {concat_time / size * 1e6:>16.1f} {rows_time:>10.3f} {rows_time / size * 1e6:>14.1f}')
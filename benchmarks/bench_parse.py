@@ -0,0 +1,77 @@
+"""
+Parsing throughput in matches per second: the per-match parse_match_rows() + rows_to_frame() path against the batch
+parser parse_matches(), from decoded payloads and from gzip compressed json like the raw cache stores them, decoded
+with the json module and with orjson if it is installed. Checks that both parsers build the same DataFrame first.
+
+    python benchmarks/bench_parse.py [--sizes 1000 5000] [--all-participants]
+"""
+import argparse
+import gzip
+import json
+import os
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import Helper as req
+from synthetic import make_matches
+
+PUUID = 'bench-puuid'
+
+
+
+def parse_rows(payloads, all_participants: bool) -> pd.DataFrame:
+    rows = []
+    for match in payloads:
+        rows += req.parse_match_rows(match=match, puuid=PUUID, all_participants=all_participants)
+    return req.rows_to_frame(rows)
+
+
+
+def parse_batch(payloads, all_participants: bool) -> pd.DataFrame:
+    return req.parse_matches(payloads, puuid=PUUID, all_participants=all_participants)
+
+
+
+def best_of(func, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 5000])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--all-participants', action='store_true', help='parse a row per participant instead of per match')
+    args = parser.parse_args()
+
+    decoders = {'json': json.loads}
+    if req.orjson:
+        decoders['orjson'] = req.orjson.loads
+
+    print(f"{'case':<24} {'matches':>8} {'seconds':>9} {'matches/s':>11}")
+    for size in args.sizes:
+        payloads = [match for _, match in make_matches(size, puuid=PUUID)]
+        compressed = [gzip.compress(json.dumps(match, separators=(',', ':')).encode(), compresslevel=6) for match in payloads]
+
+        expected = parse_rows(payloads, args.all_participants)
+        pd.testing.assert_frame_equal(parse_batch(payloads, args.all_participants), expected)
+
+        cases = {
+            'rows (decoded)': lambda: parse_rows(payloads, args.all_participants),
+            'batch (decoded)': lambda: parse_batch(payloads, args.all_participants),
+        }
+        for name, loads in decoders.items():
+            cases[f'rows + gzip {name}'] = lambda loads=loads: parse_rows((loads(gzip.decompress(data)) for data in compressed), args.all_participants)
+            cases[f'batch + gzip {name}'] = lambda loads=loads: parse_batch((loads(gzip.decompress(data)) for data in compressed), args.all_participants)
+
+        for name, func in cases.items():
+            seconds = best_of(func, args.repeat)
+            print(f'{name:<24} {size:>8} {seconds:>9.3f} {size / seconds:>11.0f}')
@@ -0,0 +1,80 @@
+"""
+Rebuild benchmark: fills a raw match cache with synthetic matches, then times Helper.rebuild_data_from_cache() with
+different numbers of worker processes, including building the pages. Checks that every run stores the same matches
+as the rebuild in a single process first, then reports matches per second and the speedup over one process. Worker
+counts above the CPUs available are skipped, the rebuild never starts more processes than that (see
+Helper.available_cpus()), so on a single CPU only the one process rebuild runs.
+
+    python benchmarks/bench_rebuild.py [--matches 20000] [--workers 1 2 4] [--all-participants]
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import Helper as req
+import match_log
+import match_store
+from synthetic import make_matches, register_metadata
+
+PUUID = 'bench-puuid'
+
+
+
+def rebuild(cache, workers: int, all_participants: bool) -> tuple[float, pd.DataFrame]:
+    """
+    Runs one rebuild in the current folder.
+
+    @Returns:
+        tuple: The seconds it took and the rebuilt store, sorted so runs with different segment boundaries compare equal.
+    """
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        req.rebuild_data_from_cache(puuid=PUUID, cache=cache, all_participants=all_participants, workers=workers)
+    elapsed = time.perf_counter() - start
+
+    df = match_store.read_store()
+    df = df.astype({column: str for column in df.columns if df[column].dtype == 'category'})
+    return elapsed, df.sort_values(list(df.columns)).reset_index(drop=True)
+
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--matches', type=int, default=20000)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--all-participants', action='store_true', help='rebuild a row per participant instead of per match')
+    args = parser.parse_args()
+
+    register_metadata(req)
+
+    with tempfile.TemporaryDirectory() as folder:
+        os.chdir(folder)
+        cache = req.RawMatchCache('raw_matches', max_bytes=None)
+        matches = make_matches(args.matches, puuid=PUUID)
+        for match_id, match in matches:
+            cache.put(match_id, match)
+        match_log.create('matches.log', [match_id for match_id, _ in reversed(matches)])
+        del matches
+
+        cpus = req.available_cpus()
+        skipped = [workers for workers in args.workers if workers > cpus]
+        print(f"{cpus} CPUs available")
+        if skipped:
+            print(f"Skipping {', '.join(map(str, skipped))} workers, more than the CPUs available"
+                  + (", there is no scaling to measure on one CPU" if cpus == 1 else ""))
+
+        print(f"{'workers':>8} {'matches':>8} {'seconds':>9} {'matches/s':>10} {'speedup':>8}")
+        baseline_seconds, expected = rebuild(cache, 1, args.all_participants)
+        for workers in args.workers:
+            if workers in skipped:
+                continue
+            seconds, df = (baseline_seconds, expected) if workers == 1 else rebuild(cache, workers, args.all_participants)
+            pd.testing.assert_frame_equal(df, expected)
+            print(f"{workers:>8} {args.matches:>8} {seconds:>9.2f} {args.matches / seconds:>10.0f} {baseline_seconds / seconds:>8.2f}")
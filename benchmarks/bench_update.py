@@ -0,0 +1,101 @@
+"""
+End to end ingestion benchmark: runs Helper.update_data() against the mock Riot API in mock_riot.py, first like
+setup.py on an empty folder, then optionally like update.py after some new matches were played. Reports matches per
+second, the 429s the server sent and the time spent sleeping on the rate limiter and on Retry-After (summed over
+the worker threads).
+
+With the real development key limits, 100 requests every 2 minutes bound the throughput. Pass looser --limits to
+measure everything else, and --client-limits looser than --limits to see how 429s are handled.
+
+    python benchmarks/bench_update.py [--matches 200] [--latency 0.05] [--limits 20:1,100:120] [--incremental 20] [--trace]
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+
+from mock_riot import MockRiotAPI, MockRiotServer, parse_limits
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+
+
+def run(req, match_store, api, new: bool, trace = False) -> dict:
+    """
+    Runs one update_data() in the current folder and measures it. With trace, also prints the time spent in every stage
+    of the run, see tracing.py.
+    """
+    server_before = api.stats()
+    limiter_before = req.rate_limiter.stats()
+    stored_before = len(match_store.read_store(columns = ['Win'])) if match_store.store_exists() else 0
+
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()): # update_data prints every match
+        req.update_data(puuid = api.puuid, api_key = 'bench-key', new = new, trace_dir = None)
+    elapsed = time.perf_counter() - start
+    if trace:
+        print(tracing.last.format_summary(), end = '\n\n')
+
+    server_after = api.stats()
+    limiter_after = req.rate_limiter.stats()
+    stored = len(match_store.read_store(columns = ['Win'])) - (0 if new else stored_before)
+
+    return {
+        'matches': stored,
+        'seconds': elapsed,
+        'matches/s': stored / elapsed if elapsed else 0.0,
+        'requests': server_after['requests'] - server_before['requests'],
+        '429s': server_after['throttled'] - server_before['throttled'],
+        'limiter wait s': limiter_after['waited'] - limiter_before['waited'],
+        'retry-after s': limiter_after['throttled_seconds'] - limiter_before['throttled_seconds'],
+    }
+
+
+
+def report(name: str, result: dict) -> None:
+    print(f"{name:<12} {result['matches']:>8} {result['seconds']:>9.2f} {result['matches/s']:>10.2f} {result['requests']:>9} "
+          f"{result['429s']:>6} {result['limiter wait s']:>15.2f} {result['retry-after s']:>14.2f}")
+
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--matches', type=int, default=200)
+    parser.add_argument('--incremental', type=int, default=20, help='new matches played before the second run, 0 to skip it')
+    parser.add_argument('--limits', default='20:1,100:120', help='limits the server enforces, requests:seconds pairs or "none"')
+    parser.add_argument('--client-limits', default=None, help='limits Helper.rate_limiter enforces, --limits if not given')
+    parser.add_argument('--latency', type=float, default=0.03)
+    parser.add_argument('--jitter', type=float, default=0.02)
+    parser.add_argument('--trace', action='store_true', help='print the time spent in every stage of each run')
+    args = parser.parse_args()
+
+    api = MockRiotAPI(matches=args.matches, limits=parse_limits(args.limits), latency=args.latency, jitter=args.jitter)
+    server = MockRiotServer(api).start()
+
+    # Helper reads both when it's imported
+    os.environ['RIOT_API_BASE'] = server.url
+    client_limits = args.client_limits or args.limits
+    os.environ['RIOT_RATE_LIMITS'] = '1000000:1' if client_limits == 'none' else client_limits
+
+    import Helper as req
+    import match_log
+    import match_store
+    import tracing
+    from synthetic import register_metadata
+    register_metadata(req)
+
+    with tempfile.TemporaryDirectory() as folder:
+        os.chdir(folder)
+        match_log.create('matches.log') # Same as setup.py
+
+        print(f"{'run':<12} {'matches':>8} {'seconds':>9} {'matches/s':>10} {'requests':>9} {'429s':>6} {'limiter wait s':>15} {'retry-after s':>14}")
+        report('setup', run(req, match_store, api, new=True, trace=args.trace))
+
+        if args.incremental:
+            api.add_matches(args.incremental)
+            report('update', run(req, match_store, api, new=False, trace=args.trace))
+
+    server.stop()
@@ -0,0 +1,269 @@
+"""
+Local stand-in for the Riot API endpoints this project calls, serving synthetic payloads from synthetic.py. Like a
+development key, it enforces application rate limits (20:1,100:120 by default) and answers requests over the limit
+with a 429 and Retry-After. It can also delay every response to simulate network latency.
+
+    python benchmarks/mock_riot.py [--port 8080] [--matches 500] [--latency 0.05]
+    RIOT_API_BASE=http://127.0.0.1:8080 python setup.py
+
+Any API key and any Riot ID are accepted, every Riot ID resolves to the same player.
+"""
+import argparse
+import json
+import math
+import random
+import re
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from synthetic import make_match, make_timeline
+
+ACCOUNT_PATH = re.compile(r'^/riot/account/v1/accounts/by-riot-id/([^/]+)/([^/]+)$')
+MATCHLIST_PATH = re.compile(r'^/lol/match/v5/matches/by-puuid/([^/]+)/ids$')
+MATCH_PATH = re.compile(r'^/lol/match/v5/matches/([^/]+?)(/timeline)?$')
+
+
+
+class WindowLimiter:
+    """
+    Server side of Riot's application rate limit: sliding windows of (requests, seconds) that must all hold. Rejected
+    requests don't count towards the limit.
+    """
+
+    def __init__(self, limits):
+        self.limits = list(limits)
+        self._sent = [deque() for _ in self.limits]
+        self._lock = threading.Lock()
+
+
+    def try_acquire(self) -> tuple:
+        """
+        @Returns:
+            tuple: Whether the request is allowed, the seconds to wait before retrying if not, and the X-App-Rate-Limit-Count header.
+        """
+        with self._lock:
+            now = time.monotonic()
+            retry_after = 0.0
+            for (limit, period), sent in zip(self.limits, self._sent):
+                while sent and sent[0] <= now - period:
+                    sent.popleft()
+                if len(sent) >= limit:
+                    retry_after = max(retry_after, sent[0] + period - now)
+
+            if retry_after <= 0:
+                for sent in self._sent:
+                    sent.append(now)
+            counts = ",".join(f'{len(sent)}:{period:g}' for (_, period), sent in zip(self.limits, self._sent))
+            return retry_after <= 0, retry_after, counts
+
+
+
+class MockRiotAPI:
+    """
+    The synthetic player, its match history and the request counters behind the server.
+
+    @Parameters:
+        matches (int): The number of matches in the player's history.
+        puuid (str): The PUUID every Riot ID resolves to.
+        limits (list[tuple]): The (requests, seconds) windows to enforce, empty for no limit.
+        latency (float): Seconds every response is delayed by.
+        jitter (float): Up to this many extra seconds, chosen at random, are added to the latency.
+        seed (int): Seed of the synthetic payloads.
+    """
+
+    def __init__(self, matches = 500, puuid = 'bench-puuid', limits = ((20, 1), (100, 120)), latency = 0.0, jitter = 0.0, seed = 0):
+        self.puuid = puuid
+        self.limits = list(limits)
+        self.limiter = WindowLimiter(self.limits)
+        self.latency = latency
+        self.jitter = jitter
+        self.rng = random.Random(seed)
+        self.match_ids = [] # Newest first, like the matchlist endpoint
+        self.matches = {}
+        self.counts = {'requests': 0, 'throttled': 0}
+        self._lock = threading.Lock()
+        self.add_matches(matches)
+
+
+    def add_matches(self, count: int) -> list[str]:
+        """
+        Plays count new matches, newer than every match so far.
+
+        @Returns:
+            list[str]: The IDs of the new matches, newest first.
+        """
+        with self._lock:
+            start = len(self.match_ids)
+            new_ids = []
+            for number in range(start + 1, start + count + 1):
+                match_id = f'NA1_{5000000000 + number}'
+                self.matches[match_id] = make_match(match_id, self.puuid, self.rng, game_creation = 1720000000000 + number * 1800000)
+                new_ids.append(match_id)
+            self.match_ids = new_ids[::-1] + self.match_ids
+            return new_ids[::-1]
+
+
+    def matchlist(self, query: dict) -> tuple:
+        start = int(query.get('start', 0))
+        count = int(query.get('count', 20))
+        if count > 100 or count < 0 or start < 0:
+            return 400, {'status': {'message': 'Bad request - count must be between 0 and 100', 'status_code': 400}}
+
+        start_time = int(query.get('startTime', 0))
+        end_time = int(query.get('endTime', 2 ** 62))
+        ids = [match_id for match_id in self.match_ids
+               if start_time <= self.matches[match_id]['info']['gameCreation'] // 1000 <= end_time]
+        return 200, ids[start:start + count]
+
+
+    def respond(self, path: str, query: dict, headers) -> tuple:
+        """
+        Routes one request.
+
+        @Returns:
+            tuple: The status code, the json body and a dict of extra response headers.
+        """
+        if self.latency or self.jitter:
+            time.sleep(self.latency + self.rng.uniform(0, self.jitter))
+
+        with self._lock:
+            self.counts['requests'] += 1
+
+        if not headers.get('X-Riot-Token'):
+            return 401, {'status': {'message': 'Unauthorized', 'status_code': 401}}, {}
+
+        limit_headers = {}
+        if self.limits:
+            allowed, retry_after, counts = self.limiter.try_acquire()
+            limit_headers = {'X-App-Rate-Limit': ",".join(f'{limit}:{period:g}' for limit, period in self.limits),
+                             'X-App-Rate-Limit-Count': counts}
+            if not allowed:
+                with self._lock:
+                    self.counts['throttled'] += 1
+                return 429, {'status': {'message': 'Rate limit exceeded', 'status_code': 429}}, {
+                    **limit_headers, 'Retry-After': str(max(1, math.ceil(retry_after))), 'X-Rate-Limit-Type': 'application'}
+
+        if ACCOUNT_PATH.match(path):
+            game_name, tag_line = ACCOUNT_PATH.match(path).groups()
+            return 200, {'puuid': self.puuid, 'gameName': game_name, 'tagLine': tag_line}, limit_headers
+
+        if MATCHLIST_PATH.match(path):
+            if MATCHLIST_PATH.match(path).group(1) != self.puuid:
+                return 200, [], limit_headers
+            status, body = self.matchlist(query)
+            return status, body, limit_headers
+
+        if MATCH_PATH.match(path):
+            match_id, timeline = MATCH_PATH.match(path).groups()
+            match = self.matches.get(match_id)
+            if match is None:
+                return 404, {'status': {'message': 'Data not found - match file not found', 'status_code': 404}}, limit_headers
+            return 200, make_timeline(match) if timeline else match, limit_headers
+
+        return 404, {'status': {'message': 'Data not found', 'status_code': 404}}, limit_headers
+
+
+    def stats(self) -> dict:
+        """
+        @Returns:
+            dict: The number of requests received and how many of them got a 429.
+        """
+        with self._lock:
+            return dict(self.counts)
+
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1' # Keep-alive, like the real API
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        status, body, headers = self.server.api.respond(url.path, query, self.headers)
+
+        payload = json.dumps(body, separators = (',', ':')).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json;charset=utf-8')
+        self.send_header('Content-Length', str(len(payload)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+    def log_message(self, format, *args):
+        pass
+
+
+
+class MockRiotServer:
+    """
+    Runs a MockRiotAPI on a ThreadingHTTPServer in a background thread.
+
+    @Parameters:
+        api (MockRiotAPI): The API to serve.
+        host (str): The interface to listen on.
+        port (int): The port to listen on, 0 picks a free one.
+    """
+
+    def __init__(self, api: MockRiotAPI, host = '127.0.0.1', port = 0):
+        self.api = api
+        self.httpd = ThreadingHTTPServer((host, port), RequestHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.api = api
+        self._thread = None
+
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+
+    def start(self) -> 'MockRiotServer':
+        self._thread = threading.Thread(target = self.httpd.serve_forever, daemon = True)
+        self._thread.start()
+        return self
+
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+
+def parse_limits(limits: str) -> list[tuple]:
+    """
+    @Returns:
+        list[tuple]: The (requests, seconds) pairs of limits written like "20:1,100:120", empty for "none".
+    """
+    if limits == 'none':
+        return []
+    return [(int(count), float(period)) for count, period in (limit.split(':') for limit in limits.split(','))]
+
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--matches', type=int, default=500)
+    parser.add_argument('--puuid', default='bench-puuid')
+    parser.add_argument('--limits', default='20:1,100:120', help='requests:seconds pairs, or "none"')
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--jitter', type=float, default=0.0)
+    args = parser.parse_args()
+
+    api = MockRiotAPI(matches=args.matches, puuid=args.puuid, limits=parse_limits(args.limits), latency=args.latency, jitter=args.jitter)
+    server = MockRiotServer(api, args.host, args.port)
+    print(f'Serving {args.matches} matches for {args.puuid} on {server.url}, limits {args.limits}')
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+        print(api.stats())
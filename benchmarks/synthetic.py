@@ -0,0 +1,381 @@
+"""
+Synthetic Riot API payloads shaped like the real match-v5 responses, used by the benchmarks so they can run without an
+API key or network access.
+"""
+import os
+import random
+
+import numpy as np
+import pandas as pd
+
+CHAMPIONS = sorted(name[:-4] for name in os.listdir(os.path.join(os.path.dirname(__file__), '..', 'static', 'images', 'champions'))
+                   if name.endswith('.png'))
+ROLES = ['TOP', 'JUNGLE', 'MIDDLE', 'BOTTOM', 'UTILITY']
+
+# Completed items and tier two boots (ids from items.json), plus wards and trinkets in the last slot
+ITEMS = [3006, 3009, 3020, 3047, 3111, 3158, 3031, 3036, 3071, 3074, 3078, 3089, 3100, 3115, 3135, 3142, 3153, 3157,
+         3161, 3165, 3181, 3742, 3748, 4005, 4645, 6333, 6610, 6653, 6655, 6672, 6675, 6692, 6694, 6697, 6698]
+TRINKETS = [3340, 3363, 3364]
+
+# Rune tree id -> keystones, minor rune choices of that tree
+RUNE_TREES = {
+    8000: ([8005, 8008, 8021, 8010], [9101, 9111, 8009, 9104, 9105, 9103, 8014, 8017, 8299]),
+    8100: ([8112, 8128, 9923], [8126, 8139, 8143, 8136, 8120, 8138, 8135, 8105, 8106]),
+    8200: ([8214, 8229, 8230], [8224, 8226, 8275, 8210, 8234, 8233, 8237, 8232, 8236]),
+    8300: ([8351, 8360, 8369], [8306, 8304, 8321, 8313, 8352, 8345, 8347, 8410, 8316]),
+    8400: ([8437, 8439, 8465], [8446, 8463, 8401, 8429, 8444, 8473, 8451, 8453, 8242]),
+}
+STAT_RUNES = [5001, 5005, 5007, 5008, 5010, 5011, 5013]
+
+
+
+def make_participant(puuid: str, team_id: int, role: str, win: bool, rng: random.Random) -> dict:
+    """
+    Builds one entry of info.participants with the fields that process_match_details() reads.
+    """
+    primary_tree, secondary_tree = rng.sample(sorted(RUNE_TREES), 2)
+    keystones, primary_minors = RUNE_TREES[primary_tree]
+    secondary_minors = RUNE_TREES[secondary_tree][1]
+    items = rng.sample(ITEMS, rng.randint(3, 6))
+    items += [0] * (6 - len(items)) + [rng.choice(TRINKETS)]
+
+    return {
+        'puuid': puuid,
+        'championName': rng.choice(CHAMPIONS),
+        'teamPosition': role,
+        'teamId': team_id,
+        'win': win,
+        'summoner1Id': 4,
+        'summoner2Id': rng.choice([3, 6, 7, 11, 12, 14]),
+        'turretTakedowns': rng.randint(0, 6),
+        'totalMinionsKilled': rng.randint(10, 300),
+        'totalAllyJungleMinionsKilled': rng.randint(0, 150),
+        'totalEnemyJungleMinionsKilled': rng.randint(0, 30),
+        'totalDamageDealtToChampions': rng.randint(3000, 60000),
+        **{f'item{i}': item for i, item in enumerate(items)},
+        'challenges': {
+            'kda': round(rng.uniform(0.3, 12), 4),
+            'killParticipation': round(rng.uniform(0.1, 0.9), 4),
+            'teamDamagePercentage': round(rng.uniform(0.05, 0.45), 4),
+            'turretPlatesTaken': rng.randint(0, 8),
+            'goldPerMinute': round(rng.uniform(250, 600), 3),
+            'damagePerMinute': round(rng.uniform(200, 1500), 3),
+            'visionScorePerMinute': round(rng.uniform(0.2, 3.5), 4),
+            'laneMinionsFirst10Minutes': rng.randint(0, 95),
+            'jungleCsBefore10Minutes': rng.randint(0, 70),
+            'soloKills': rng.randint(0, 5),
+        },
+        'perks': {
+            'statPerks': {'defense': rng.choice(STAT_RUNES), 'flex': rng.choice(STAT_RUNES), 'offense': rng.choice(STAT_RUNES)},
+            'styles': [
+                {'description': 'primaryStyle', 'style': primary_tree,
+                 'selections': [{'perk': rng.choice(keystones)}] + [{'perk': perk} for perk in rng.sample(primary_minors, 3)]},
+                {'description': 'subStyle', 'style': secondary_tree,
+                 'selections': [{'perk': perk} for perk in rng.sample(secondary_minors, 2)]},
+            ],
+        },
+    }
+
+
+
+def make_match(match_id: str, puuid: str, rng = None, game_creation = 1720000000000, map_id = 11) -> dict:
+    """
+    Builds a match-v5 match payload with ten participants, one of which is puuid.
+
+    @Parameters:
+        match_id (str): The ID of the match.
+        puuid (str): The player that takes part in the match.
+        rng (random.Random): Source of randomness, seed it for reproducible payloads.
+        game_creation (int): Timestamp of the start of the game in milliseconds.
+        map_id (int): The map the game was played on, 11 is Summoner's Rift.
+
+    @Returns:
+        dict: The match payload.
+    """
+    rng = rng or random.Random()
+    puuids = [f'{match_id}-player-{i}' for i in range(10)]
+    puuids[rng.randrange(10)] = puuid
+    blue_win = rng.random() < 0.5
+
+    participants = [make_participant(player, 100 if i < 5 else 200, ROLES[i % 5], blue_win == (i < 5), rng)
+                    for i, player in enumerate(puuids)]
+    teams = [
+        {
+            'teamId': team_id,
+            'win': blue_win == (team_id == 100),
+            'objectives': {objective: {'first': False, 'kills': rng.randint(0, high)}
+                           for objective, high in (('baron', 2), ('dragon', 5), ('horde', 6), ('riftHerald', 1),
+                                                   ('tower', 11), ('inhibitor', 3), ('champion', 50))},
+        }
+        for team_id in (100, 200)
+    ]
+
+    return {
+        'metadata': {'dataVersion': '2', 'matchId': match_id, 'participants': puuids},
+        'info': {
+            'gameCreation': game_creation,
+            'gameDuration': rng.randint(900, 2400),
+            'gameVersion': '14.14.604.8571',
+            'mapId': map_id,
+            'queueId': 420,
+            'participants': participants,
+            'teams': teams,
+        },
+    }
+
+
+
+def make_timeline(match: dict, rng = None) -> dict:
+    """
+    Builds a match-v5 timeline payload for a match from make_match(), one frame per minute of the game with cumulative
+    gold, xp, cs and level for all ten participants.
+
+    @Parameters:
+        match (dict): The match payload.
+        rng (random.Random): Source of randomness, seeded from the match ID if None.
+
+    @Returns:
+        dict: The timeline payload.
+    """
+    rng = rng or random.Random(match['metadata']['matchId'])
+    info = match['info']
+    minutes = info['gameDuration'] // 60 + 1
+
+    totals = [{'totalGold': 500, 'xp': 0, 'minionsKilled': 0, 'jungleMinionsKilled': 0} for _ in range(10)]
+    frames = []
+    for minute in range(minutes + 1):
+        participant_frames = {}
+        for i, total in enumerate(totals):
+            if minute > 0:
+                total['totalGold'] += rng.randint(250, 550)
+                total['xp'] += rng.randint(250, 550)
+                if info['participants'][i]['teamPosition'] == 'JUNGLE':
+                    total['jungleMinionsKilled'] += rng.randint(3, 7)
+                else:
+                    total['minionsKilled'] += rng.randint(3, 10) if minute > 1 else 0
+            participant_frames[str(i + 1)] = {
+                'participantId': i + 1,
+                'currentGold': rng.randint(0, 1500),
+                'level': min(18, 1 + int((total['xp'] / 180) ** 0.5)),
+                'position': {'x': rng.randint(0, 14820), 'y': rng.randint(0, 14881)},
+                **total,
+            }
+        events = [{'type': 'GAME_END', 'timestamp': info['gameDuration'] * 1000}] if minute == minutes else []
+        frames.append({'timestamp': min(minute * 60000, info['gameDuration'] * 1000), 'participantFrames': participant_frames,
+                       'events': events})
+
+    return {
+        'metadata': dict(match['metadata']),
+        'info': {
+            'frameInterval': 60000,
+            'frames': frames,
+            'gameId': int(match['metadata']['matchId'].split('_')[1]),
+            'participants': [{'participantId': i + 1, 'puuid': puuid} for i, puuid in enumerate(match['metadata']['participants'])],
+        },
+    }
+
+
+
+def make_matches(count: int, puuid = 'bench-puuid', seed = 0) -> list[tuple]:
+    """
+    @Returns:
+        list[tuple]: count (match_id, payload) pairs, newest first like a Riot matchlist.
+    """
+    rng = random.Random(seed)
+    ids = [f'NA1_{5000000000 + i}' for i in range(count, 0, -1)]
+    return [(match_id, make_match(match_id, puuid, rng, game_creation = 1720000000000 + int(match_id[4:]) * 1000))
+            for match_id in ids]
+
+
+
+def register_metadata(req) -> None:
+    """
+    Puts names for the synthetic rune and item ids into Helper's metadata registry, so code that looks up rune or item
+    names runs offline.
+
+    @Parameters:
+        req (module): The imported Helper module.
+    """
+    runes = {rune: f'Rune {rune}' for keystones, minors in RUNE_TREES.values() for rune in keystones + minors + STAT_RUNES}
+    runes.update({tree: f'Tree {tree}' for tree in RUNE_TREES})
+    req.metadata_registry[('runes', req.latest_patch)] = runes
+    req.metadata_registry[('items', req.latest_patch)] = {item: f'Item {item}' for item in ITEMS}
+
+
+
+PATCHES = ['14.10', '14.11', '14.12', '14.13', '14.14']
+SUMMONER_SPELLS = [3, 6, 7, 12, 14] # Exhaust, Ghost, Heal, Teleport, Ignite, Flash (4) and Smite (11) are added by role
+SUPPORT_ITEMS = [3869, 3870, 3871, 3876, 3877]
+
+# Per role: cs per minute, mean damage per minute, vision score per minute, lane minions before 10 minutes
+ROLE_PROFILES = np.array([
+    [7.0, 650, 0.8, 65],   # TOP
+    [1.0, 550, 1.1, 0],    # JUNGLE
+    [7.5, 800, 0.9, 70],   # MIDDLE
+    [8.0, 850, 0.8, 68],   # BOTTOM
+    [1.2, 350, 2.6, 5],    # UTILITY
+])
+
+
+
+def champion_profiles(rng: np.random.Generator) -> dict:
+    """
+    Draws what makes every champion distinct: how often it is picked, which roles it's played in, its winrate in each
+    role, its usual items and its usual runes.
+    """
+    count = len(CHAMPIONS)
+    trees = np.array(sorted(RUNE_TREES))
+
+    popularity = 1 / np.arange(1, count + 1) ** 0.8 # A few champions are picked far more than the rest
+    popularity = rng.permutation(popularity / popularity.sum())
+
+    roles = np.full((count, len(ROLES)), 0.01)
+    roles[np.arange(count), rng.integers(0, len(ROLES), count)] += 0.8
+    roles[np.arange(count), rng.integers(0, len(ROLES), count)] += 0.15
+    roles /= roles.sum(axis = 1, keepdims = True)
+
+    return {
+        'popularity': popularity,
+        'role_cdf': roles.cumsum(axis = 1),
+        'winrate': 0.5 + rng.normal(0, 0.03, (count, len(ROLES))),
+        'items': np.array([rng.choice(ITEMS, 10, replace = False) for _ in range(count)]), # Most built first
+        'primary_tree': trees[rng.integers(0, len(trees), count)],
+        'keystone': rng.integers(0, 3, count),
+    }
+
+
+
+def frame_chunk(rows: int, profiles: dict, rng: np.random.Generator) -> dict:
+    """
+    Generates rows matches as a dict of column name -> numpy array, with the codes of the category columns.
+    """
+    trees = np.array(sorted(RUNE_TREES))
+    champion = rng.choice(len(CHAMPIONS), rows, p = profiles['popularity'])
+    role = (rng.random(rows)[:, None] > profiles['role_cdf'][champion]).sum(axis = 1).clip(0, len(ROLES) - 1)
+    win = rng.random(rows) < profiles['winrate'][champion, role]
+    minutes = rng.normal(30, 6, rows).clip(15, 50)
+    profile = ROLE_PROFILES[role]
+    jungle, support = role == 1, role == 4
+
+    # Items: 2 to 6 distinct picks from the champion's usual items, favouring the first ones, then a trinket
+    slots = (2 + (minutes - 15) / 35 * 4 + rng.normal(0, 0.7, rows)).round().clip(2, 6).astype(np.int64)
+    weights = np.log(np.linspace(3, 1, 10, dtype = np.float32))
+    order = np.argsort(-(weights + rng.gumbel(size = (rows, 10)).astype(np.float32)), axis = 1)[:, :6]
+    items = np.take_along_axis(profiles['items'][champion], order, axis = 1)
+    items[support, 0] = rng.choice(SUPPORT_ITEMS, support.sum())
+    items[np.arange(6) >= slots[:, None]] = 0
+    trinket = np.where(support, 3364, np.where(rng.random(rows) < 0.85, 3340, 3363))
+
+    # Runes: mostly the champion's usual keystone, minor runes one per row of their tree
+    primary = np.where(rng.random(rows) < 0.75, profiles['primary_tree'][champion], trees[rng.integers(0, len(trees), rows)])
+    secondary = trees[(np.searchsorted(trees, primary) + rng.integers(1, len(trees), rows)) % len(trees)]
+    keystone_choice = np.where(rng.random(rows) < 0.7, profiles['keystone'][champion], rng.integers(0, 3, rows))
+    keystones = np.full((len(trees), 4), 0)
+    minors = np.zeros((len(trees), 9), dtype = np.int64)
+    for i, tree in enumerate(trees):
+        tree_keystones, tree_minors = RUNE_TREES[tree]
+        keystones[i, :len(tree_keystones)] = tree_keystones
+        minors[i] = tree_minors
+    primary_index, secondary_index = np.searchsorted(trees, primary), np.searchsorted(trees, secondary)
+    choices = [minors[primary_index, 3 * row + rng.integers(0, 3, rows)] for row in range(3)]
+    secondary_rows = rng.permuted(np.tile([0, 1, 2], (rows, 1)), axis = 1)[:, :2]
+    secondary_choices = [minors[secondary_index, 3 * secondary_rows[:, i] + rng.integers(0, 3, rows)] for i in range(2)]
+
+    # Team objectives, the winning team usually takes more of them
+    objective = lambda mean, high: rng.poisson(np.where(win, mean * 1.5, mean * 0.6)).clip(0, high)
+
+    return {
+        'Champion': champion,
+        'Role': role,
+        'Patch': rng.choice(len(PATCHES), rows, p = [0.1, 0.15, 0.2, 0.25, 0.3]),
+        'Win': win,
+        'Summoner1': np.full(rows, 4),
+        'Summoner2': np.where(jungle, 11, rng.choice(SUMMONER_SPELLS, rows)),
+        'Turrets_Killed': objective(5, 11),
+        'Total_Minions_Killed': rng.normal(profile[:, 0] * minutes, 15).clip(0),
+        'Total_Jungle_Monsters_Killed': np.where(jungle, rng.normal(5.5 * minutes, 20), rng.poisson(3, rows)).clip(0),
+        'Total_Damage_DealtToChampions': rng.normal(profile[:, 1], profile[:, 1] * 0.3).clip(50) * minutes,
+        **{f'Item{i}': items[:, i] for i in range(6)},
+        'Item6': trinket,
+        'KDA': rng.lognormal(np.where(win, 1.2, 0.5), 0.6),
+        'Kill_Participation': rng.beta(5, 4, rows),
+        'Damage_Share': np.where(support, rng.beta(2, 18, rows), rng.beta(5, 17, rows)),
+        'Turret_Plates_Taken': np.where(jungle | support, rng.poisson(0.5, rows), rng.poisson(2, rows)),
+        'Gold_Per_Minute': rng.normal(np.where(support, 280, 410), 50),
+        'Damage_Per_Minute': rng.normal(profile[:, 1], profile[:, 1] * 0.3).clip(50),
+        'Vision_Score_Per_Minute': rng.normal(profile[:, 2], 0.25).clip(0.05),
+        'Lane_Minions_Before_10_Minutes': rng.normal(profile[:, 3], 8).clip(0),
+        'Jungle_CS_Before_10_Minutes': np.where(jungle, rng.normal(48, 8, rows), rng.poisson(0.5, rows)).clip(0),
+        'Sol_Kills': rng.poisson(np.where(jungle | support, 0.3, 1.0)),
+        'Barons_Killed': objective(0.6, 3),
+        'Dragons_Killed': objective(2, 5),
+        'Void_Grubs_Killed': objective(3, 6),
+        'Rift_Heralds_Killed': objective(0.6, 1),
+        'Defense_Rune': rng.choice([5011, 5001, 5013], rows),
+        'Flex_Rune': rng.choice([5008, 5010, 5001], rows),
+        'Offense_Rune': rng.choice([5005, 5008, 5007], rows),
+        'Primary_Tree': primary,
+        'Primary_Keystone': keystones[primary_index, keystone_choice.clip(0, np.array([len(RUNE_TREES[tree][0]) for tree in trees])[primary_index] - 1)],
+        'Primary_Choice1': choices[0],
+        'Primary_Choice2': choices[1],
+        'Primary_Choice3': choices[2],
+        'Secondary_Tree': secondary,
+        'Secondary_Choice1': secondary_choices[0],
+        'Secondary_Choice2': secondary_choices[1],
+        'Team': np.where(rng.random(rows) < 0.5, 100, 200),
+    }
+
+
+
+def storage_array(values: np.ndarray, dtype: str) -> np.ndarray:
+    """
+    Converts a generated column to its dtype in match_store.MATCH_SCHEMA, category codes to int32.
+    """
+    if dtype == 'category':
+        return values.astype(np.int32)
+    if dtype.startswith('int') and values.dtype.kind == 'f':
+        return values.round().astype(dtype)
+    return values.astype(dtype)
+
+
+
+def make_frame(rows: int, seed = 0, chunk_size = 1000000, relation = 'self') -> pd.DataFrame:
+    """
+    Generates a match DataFrame with the columns and dtypes of Helper.rows_to_frame() (see match_store.MATCH_SCHEMA),
+    with realistic champion popularity, roles, items and runes. Rows are generated with numpy in chunks of chunk_size,
+    about 3 seconds per million rows. Every chunk is converted to the compact dtypes as soon as it is generated, so
+    memory stays close to the size of the result. Every row is its own match, with a unique Match_ID.
+
+    @Parameters:
+        rows (int): The number of matches.
+        seed (int): Seed of the generator, the same seed gives the same frame.
+        chunk_size (int): The number of rows generated at once.
+        relation (str): The Relation of every row, 'self' for the player's own rows.
+
+    @Returns:
+        DataFrame: The matches.
+    """
+    import match_store # The benchmarks put the repository root on sys.path
+
+    rng = np.random.default_rng(seed)
+    profiles = champion_profiles(rng)
+    categories = {'Champion': CHAMPIONS, 'Role': ROLES, 'Patch': PATCHES, 'Relation': [relation],
+                  'Match_ID': [f'NA1_{5000000000 + i}' for i in range(rows)]} # Same width, already sorted
+
+    chunks = []
+    for start in range(0, rows, chunk_size):
+        chunk = frame_chunk(min(chunk_size, rows - start), profiles, rng)
+        size = len(chunk['Champion'])
+        chunk['Match_ID'] = np.arange(start, start + size)
+        chunk['Relation'] = np.zeros(size, dtype = np.int64)
+        chunks.append({column: storage_array(chunk.pop(column), dtype) for column, dtype in match_store.MATCH_SCHEMA.items()})
+
+    data = {}
+    for column, dtype in match_store.MATCH_SCHEMA.items():
+        values = np.concatenate([chunk.pop(column) for chunk in chunks]) if chunks else np.zeros(0, dtype = np.int32)
+        if dtype == 'category':
+            categorical = pd.Categorical.from_codes(values, categories = categories[column])
+            data[column] = categorical if column == 'Match_ID' else categorical.reorder_categories(sorted(categories[column])) # Sorted, like the store's categories
+        else:
+            data[column] = values
+    return pd.DataFrame(data)
@@ -0,0 +1,14 @@
+"""
+Settings to serve the website with several worker processes through gunicorn (pip install gunicorn):
+
+    gunicorn app:app
+
+The app is imported once in the master process before the workers are forked (preload_app), so the dataset snapshot
+is loaded a single time and every worker starts instantly with it. The champion pages are a memory-mapped file, read
+only, so all workers share the same pages in memory instead of each holding a copy.
+"""
+import os
+
+bind = os.environ.get('LOL_BIND', '127.0.0.1:8000')
+workers = int(os.environ.get('LOL_WORKERS', 4))
+preload_app = True
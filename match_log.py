@@ -0,0 +1,197 @@
+"""
+Append-only log of every match ID of the player, replacing the matchlist of matches.json.
+
+matches.json had to be parsed and rewritten in full on every update. The log is a text file with one match ID per
+line, oldest first, after a fixed width header holding the creation timestamp of the latest match:
+
+    MATCHLOG 1 latest=00000000001721430000
+    NA1_5012345678
+    NA1_5012349876
+    ...
+
+New matches are appended to the end and the header is overwritten in place, and the most recent IDs are read
+backwards from the end of the file, so an update only reads and writes as much as it adds, and finds the matches it
+hasn't processed yet with tail_until(). IDs are only appended once
+update_matches() has checked they are new. compact() rewrites the log without duplicates, e.g. after a run was stopped
+between appending IDs and updating the header.
+"""
+
+import os
+import json
+import storage
+
+HEADER_FORMAT = 'MATCHLOG 1 latest={:020d}\n'
+HEADER_SIZE = len(HEADER_FORMAT.format(0))
+BLOCK_SIZE = 4096 # Bytes read at a time by tail()
+
+
+
+def create(path = 'matches.log', match_ids = (), latest = 0) -> None:
+    """
+    Writes a new log, replacing any existing one.
+
+    @Parameters:
+        path (str): The file of the log
+        match_ids (list[str]): The IDs to start the log with, oldest first
+        latest (int): The creation timestamp of the latest match, in seconds
+
+    """
+    with storage.atomic_write(path, fsync = True) as file:
+        file.write(HEADER_FORMAT.format(latest))
+        file.write(''.join(f'{match_id}\n' for match_id in match_ids))
+
+
+
+def read_latest(path = 'matches.log') -> int:
+    """
+    @Return:
+        The creation timestamp of the latest match in the log, read from the header only
+    """
+    with open(path, 'r') as file:
+        header = file.read(HEADER_SIZE)
+    if not header.startswith('MATCHLOG 1 latest='):
+        raise ValueError(f"{path} is not a match log.")
+    return int(header[len('MATCHLOG 1 latest='):].strip())
+
+
+
+def read_ids(path = 'matches.log') -> list[str]:
+    """
+    Reads every ID of the log.
+
+    @Parameters:
+        path (str): The file of the log
+
+    @Return:
+        A list of the match IDs, newest first like the old matchlist
+    """
+    with open(path, 'r') as file:
+        file.seek(HEADER_SIZE)
+        lines = file.read().split('\n')
+    return lines[-2::-1] # The last element is empty, or a line cut short by a crash
+
+
+
+def tail(path = 'matches.log', count = 100) -> list[str]:
+    """
+    Reads the most recent IDs of the log, reading backwards from the end of the file in blocks.
+
+    @Parameters:
+        path (str): The file of the log
+        count (int): The number of IDs to read
+
+    @Return:
+        A list of up to count match IDs, newest first
+    """
+    with open(path, 'rb') as file:
+        position = file.seek(0, os.SEEK_END)
+        data = b''
+        while position > HEADER_SIZE and data.count(b'\n') <= count:
+            step = min(BLOCK_SIZE, position - HEADER_SIZE)
+            position -= step
+            file.seek(position)
+            data = file.read(step) + data
+
+    lines = data.decode().split('\n')[:-1] # Drops the part after the last newline
+    if position > HEADER_SIZE:
+        lines = lines[1:] # The first line read may be missing its start
+    return lines[:-count - 1:-1] if count else []
+
+
+
+def tail_until(stop_ids, path = 'matches.log', count = 100) -> tuple[list[str], bool]:
+    """
+    Reads the log backwards from the end until one of stop_ids, e.g. the most recently processed matches, reading
+    twice as many IDs each time it isn't found yet.
+
+    @Parameters:
+        stop_ids (set[str]): The IDs to stop at
+        path (str): The file of the log
+        count (int): The number of IDs to read first
+
+    @Return:
+        A tuple of the IDs newer than the first stop ID found, newest first, and whether one was found. If none is,
+        every ID of the log.
+    """
+    while True:
+        match_ids = tail(path, count)
+        for i, match_id in enumerate(match_ids):
+            if match_id in stop_ids:
+                return match_ids[:i], True
+        if len(match_ids) < count:
+            return match_ids, False
+        count *= 2
+
+
+
+def append(match_ids: list[str], latest: int, path = 'matches.log') -> None:
+    """
+    Appends match IDs to the end of the log and then sets the latest timestamp in the header. Only the new IDs and the
+    header are written.
+
+    @Parameters:
+        match_ids (list[str]): The IDs to add, oldest first
+        latest (int): The creation timestamp of the latest match, in seconds
+        path (str): The file of the log
+
+    """
+    with open(path, 'r+b') as file:
+        end = file.seek(0, os.SEEK_END)
+        if end > HEADER_SIZE:
+            file.seek(end - 1)
+            if file.read(1) != b'\n': # A crash cut the last line short, drop it
+                file.seek(max(end - BLOCK_SIZE, HEADER_SIZE))
+                block = file.read(end - file.tell())
+                file.truncate(end - len(block) + block.rfind(b'\n') + 1 if b'\n' in block else HEADER_SIZE)
+        file.seek(0, os.SEEK_END)
+        file.write(''.join(f'{match_id}\n' for match_id in match_ids).encode())
+        file.flush()
+        os.fsync(file.fileno())
+
+        file.seek(0) # IDs first, so a crash in between only makes the next update re-request a few IDs
+        file.write(HEADER_FORMAT.format(latest).encode())
+        file.flush()
+        os.fsync(file.fileno())
+
+
+
+def compact(path = 'matches.log') -> int:
+    """
+    Rewrites the log without duplicate IDs, keeping the oldest position of each.
+
+    @Parameters:
+        path (str): The file of the log
+
+    @Return:
+        The number of duplicates removed
+    """
+    match_ids = read_ids(path)[::-1]
+    unique = list(dict.fromkeys(match_ids))
+    if len(unique) < len(match_ids):
+        create(path, unique, read_latest(path))
+    return len(match_ids) - len(unique)
+
+
+
+def migrate_json(json_file = 'matches.json', path = 'matches.log') -> bool:
+    """
+    Converts the matches.json written by an older version into a log. Does nothing if the log already exists or there
+    is no matches.json.
+
+    @Parameters:
+        json_file (str): The matches.json with the 'latest' timestamp and the 'matchlist', newest first
+        path (str): The file of the log
+
+    @Return:
+        True if matches.json was converted
+    """
+    if os.path.exists(path) or not os.path.exists(json_file):
+        return False
+
+    with open(json_file, 'r') as file:
+        data = json.load(file)
+    if 'latest' not in data or 'matchlist' not in data:
+        raise ValueError("JSON file not properly formatted.")
+
+    create(path, list(dict.fromkeys(reversed(data['matchlist']))), data['latest'])
+    return True
@@ -0,0 +1,535 @@
+"""
+Columnar, typed on-disk store of the match DataFrame, replacing data.pkl.
+
+The store is a folder of append-only segments. Every run of update_data() writes its new matches as one new segment
+instead of rewriting the whole history, and a segment is never modified once written. Inside a segment, every column
+is its own .npy file with the dtype given in MATCH_SCHEMA, so a reader can load just the columns it needs, optionally
+memory-mapped.
+
+    data/
+        segments/
+            000001/
+                meta.json                   (number of rows, unique id)
+                Champion.codes.npy          (category columns: int16 codes, int32 past 32767 categories, + their categories)
+                Champion.categories.json
+                KDA.npy                     (numeric and bool columns)
+                Barons_Killed.mask.npy      (only present if the column has missing values)
+                ...
+            000002/
+                ...
+        journal.log                         (IDs of every processed match, one per line)
+        rescan                              (only present if the journal has gaps, see set_rescan())
+
+The journal records which matches of the matchlist have been processed, including the ones that didn't produce a row
+(e.g. ARAMs). update_data() processes matches in small batches, in the order of the match log, and appends their IDs to
+the journal right after their segment is written, so a run that fails or is killed resumes from the first match it
+hadn't stored. As the journal follows the match log, the next run only reads the end of both, see read_recent().
+"""
+
+import os
+import json
+import uuid
+import hashlib
+import shutil
+import pathlib
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+from pandas.api.types import union_categoricals
+import storage
+
+# Column name -> storage dtype of the match DataFrame
+MATCH_SCHEMA = {
+    'Champion': 'category',
+    'Role': 'category',
+    'Patch': 'category',
+    'Win': 'bool',
+    'Summoner1': 'int16',
+    'Summoner2': 'int16',
+    'Turrets_Killed': 'int8',
+    'Total_Minions_Killed': 'int16',
+    'Total_Jungle_Monsters_Killed': 'int16',
+    'Total_Damage_DealtToChampions': 'int32',
+    'Item0': 'int32',
+    'Item1': 'int32',
+    'Item2': 'int32',
+    'Item3': 'int32',
+    'Item4': 'int32',
+    'Item5': 'int32',
+    'Item6': 'int32',
+    'KDA': 'float32',
+    'Kill_Participation': 'float32',
+    'Damage_Share': 'float32',
+    'Turret_Plates_Taken': 'int8',
+    'Gold_Per_Minute': 'float32',
+    'Damage_Per_Minute': 'float32',
+    'Vision_Score_Per_Minute': 'float32',
+    'Lane_Minions_Before_10_Minutes': 'int16',
+    'Jungle_CS_Before_10_Minutes': 'float32',
+    'Sol_Kills': 'int8',
+    'Barons_Killed': 'int8',
+    'Dragons_Killed': 'int8',
+    'Void_Grubs_Killed': 'int8',
+    'Rift_Heralds_Killed': 'int8',
+    'Defense_Rune': 'int16',
+    'Flex_Rune': 'int16',
+    'Offense_Rune': 'int16',
+    'Primary_Tree': 'int16',
+    'Primary_Keystone': 'int16',
+    'Primary_Choice1': 'int16',
+    'Primary_Choice2': 'int16',
+    'Primary_Choice3': 'int16',
+    'Secondary_Tree': 'int16',
+    'Secondary_Choice1': 'int16',
+    'Secondary_Choice2': 'int16',
+    'Match_ID': 'category',
+    'Team': 'int16',
+    'Relation': 'category' # 'self' for the player's rows, 'ally' or 'enemy' for the other participants, see Helper.parse_match_rows()
+}
+
+# Nullable pandas dtypes used when a stored integer/bool column has missing values
+NULLABLE_DTYPES = {
+    'bool': 'boolean',
+    'int8': 'Int8',
+    'int16': 'Int16',
+    'int32': 'Int32'
+}
+
+
+
+def list_segments(directory = 'data') -> list[pathlib.Path]:
+    """
+    @Return:
+        The paths of every segment of the store, oldest first, see storage.list_segments()
+    """
+    return storage.list_segments(directory)
+
+
+
+def store_exists(directory = 'data') -> bool:
+    """
+    @Return:
+        True if the store has at least one segment
+    """
+    return len(list_segments(directory)) > 0
+
+
+
+def segment_id(path: pathlib.Path) -> str:
+    """
+    Returns the unique id of a segment. Segment folder names are reused after the store is cleared, the id never is.
+
+    @Parameters:
+        path (Path): The folder of the segment
+
+    @Return:
+        The id written into the segment's meta.json
+    """
+    with open(pathlib.Path(path) / 'meta.json', 'r') as file:
+        return json.load(file).get('id', pathlib.Path(path).name)
+
+
+
+def version_of(segment_ids: list[str]) -> str:
+    """
+    @Return:
+        A short id of the dataset made of the given segments
+    """
+    return hashlib.sha1(",".join(segment_ids).encode()).hexdigest()[:16]
+
+
+
+def store_version(directory = 'data') -> str:
+    """
+    Identifies the current contents of the store, changes whenever a segment is added or the store is rebuilt.
+
+    @Parameters:
+        directory (str): The folder of the store
+
+    @Return:
+        The version of the store
+    """
+    return version_of([segment_id(path) for path in list_segments(directory)])
+
+
+
+def compact_frame(df: DataFrame) -> DataFrame:
+    """
+    Converts the match columns of df to their dtype in MATCH_SCHEMA: repeated strings become categories, counts the
+    smallest integer type that holds them and metrics float32. Integer/bool columns with missing values use pandas'
+    nullable dtypes, missing match columns are added empty and any other column is kept as is.
+
+    @Parameters:
+        df (DataFrame): Matches with default dtypes, e.g. from Helper.rows_to_frame() or an old data.pkl
+
+    @Return:
+        A new DataFrame with the compact dtypes, several times smaller than df
+    """
+    data = {}
+    for column, dtype in MATCH_SCHEMA.items():
+        values = df[column] if column in df else pd.Series([None] * len(df), index = df.index, dtype = object)
+
+        if dtype == 'category':
+            data[column] = values if isinstance(values.dtype, pd.CategoricalDtype) else values.astype('category')
+        elif dtype == 'float32':
+            data[column] = pd.to_numeric(values, errors = 'coerce').astype(np.float32)
+        elif values.isna().any():
+            data[column] = values.astype(NULLABLE_DTYPES[dtype])
+        else:
+            data[column] = values.astype(dtype)
+
+    for column in df.columns:
+        if column not in data:
+            data[column] = df[column]
+
+    return pd.DataFrame(data, index = df.index)
+
+
+
+def own_rows(df: DataFrame) -> DataFrame:
+    """
+    Keeps the player's rows of df, dropping the other participants stored by Helper.update_data(all_participants = True).
+    Rows written before the Relation column existed are all the player's.
+
+    @Parameters:
+        df (DataFrame): Matches, with or without the Relation column
+
+    @Return:
+        df itself if every row is the player's, the player's rows otherwise
+    """
+    if 'Relation' not in df:
+        return df
+    relation = df['Relation']
+    mine = (relation.isna() | (relation == 'self')).to_numpy()
+    return df if mine.all() else df[mine]
+
+
+
+def memory_report(df: DataFrame) -> DataFrame:
+    """
+    Breaks down the memory used by df per column, including the Python strings of object columns.
+
+    @Parameters:
+        df (DataFrame): Any DataFrame, usually from read_store()
+
+    @Return:
+        A DataFrame indexed by column with its Dtype, Bytes and Bytes_Per_Row, largest first, followed by a Total row
+    """
+    usage = df.memory_usage(index = False, deep = True)
+    report = pd.DataFrame({
+        'Dtype': [str(df[column].dtype) for column in usage.index],
+        'Bytes': usage.to_numpy()
+    }, index = usage.index).sort_values(by = 'Bytes', ascending = False)
+    report.loc['Total'] = ['', int(report['Bytes'].sum())]
+    report['Bytes_Per_Row'] = (report['Bytes'] / max(len(df), 1)).round(1)
+    return report
+
+
+
+def category_codes(values: pd.Categorical) -> np.ndarray:
+    """
+    @Return:
+        The codes of values as int16, or as int32 if there are too many categories for int16 (e.g. the mostly unique
+        Match_ID), so they never wrap around
+    """
+    dtype = np.int16 if len(values.categories) <= np.iinfo(np.int16).max else np.int32
+    return values.codes.astype(dtype)
+
+
+
+def write_segment(df: DataFrame, directory = 'data', match_ids = None) -> pathlib.Path:
+    """
+    Appends the rows of df to the store as a new segment, converting every column with compact_frame(). The segment
+    is written to a temporary folder and renamed into place, so readers never see a partially written segment.
+
+    @Parameters:
+        df (DataFrame): Rows to append, with the columns of MATCH_SCHEMA
+        directory (str): The folder of the store
+        match_ids (list[str], optional): The IDs of the matches processed into df, kept in meta.json so the journal can
+                                         be completed if the run stops before appending them to it
+
+    @Return:
+        The path of the new segment
+    """
+    temp_path = storage.new_segment(directory)
+
+    df = compact_frame(df)
+    for column, dtype in MATCH_SCHEMA.items():
+        values = df[column]
+
+        if dtype == 'category':
+            np.save(temp_path / f'{column}.codes.npy', category_codes(values.array))
+            with open(temp_path / f'{column}.categories.json', 'w') as file:
+                json.dump([str(category) for category in values.cat.categories], file)
+            continue
+
+        mask = values.isna().to_numpy()
+        if mask.any() and dtype != 'float32':
+            np.save(temp_path / f'{column}.mask.npy', mask)
+        array = values.to_numpy(dtype = np.dtype(dtype), na_value = np.nan if dtype == 'float32' else 0)
+        np.save(temp_path / f'{column}.npy', array)
+
+    with open(temp_path / 'meta.json', 'w') as file:
+        meta = {'rows': len(df), 'id': uuid.uuid4().hex}
+        if match_ids is not None:
+            meta['match_ids'] = list(match_ids)
+        json.dump(meta, file)
+
+    return storage.publish_segment(temp_path, directory)
+
+
+
+def read_segment(path: pathlib.Path, columns = None, mmap = False) -> DataFrame:
+    """
+    Reads one segment into a DataFrame.
+
+    @Parameters:
+        path (Path): The folder of the segment
+        columns (list[str], optional): The columns to load, all of MATCH_SCHEMA if None
+        mmap (bool): Memory-map the column files instead of reading them into memory
+
+    @Return:
+        A DataFrame of the segment with typed columns. Integer/bool columns with missing values use pandas' nullable dtypes.
+    """
+    path = pathlib.Path(path)
+    columns = columns or list(MATCH_SCHEMA)
+    mmap_mode = 'r' if mmap else None
+
+    with open(path / 'meta.json', 'r') as file:
+        rows = json.load(file)['rows']
+
+    data = {}
+    for column in columns:
+        dtype = MATCH_SCHEMA[column]
+
+        if dtype == 'category':
+            codes_path = path / f'{column}.codes.npy'
+            if not codes_path.exists():
+                data[column] = pd.Categorical([None] * rows)
+                continue
+            with open(path / f'{column}.categories.json', 'r') as file:
+                categories = json.load(file)
+            data[column] = pd.Categorical.from_codes(np.load(codes_path), categories = categories)
+            continue
+
+        values_path = path / f'{column}.npy'
+        if not values_path.exists(): # Column added to the schema after this segment was written
+            data[column] = pd.array([None] * rows, dtype = NULLABLE_DTYPES.get(dtype, dtype))
+            continue
+
+        array = np.load(values_path, mmap_mode = mmap_mode)
+        mask_path = path / f'{column}.mask.npy'
+        if mask_path.exists():
+            data[column] = pd.array(np.asarray(array), dtype = NULLABLE_DTYPES[dtype])
+            data[column][np.load(mask_path)] = None
+        else:
+            data[column] = array
+
+    return pd.DataFrame(data, copy = False)
+
+
+
+def read_store(directory = 'data', columns = None, mmap = False) -> DataFrame:
+    """
+    Reads the whole store into one DataFrame, newest matches first like the old data.pkl.
+
+    @Parameters:
+        directory (str): The folder of the store
+        columns (list[str], optional): The columns to load, all of MATCH_SCHEMA if None. Only these files are read.
+        mmap (bool): Memory-map the column files instead of reading them into memory
+
+    @Return:
+        A DataFrame of every match in the store
+    """
+    columns = columns or list(MATCH_SCHEMA)
+    frames = [read_segment(path, columns, mmap) for path in reversed(list_segments(directory))]
+
+    if not frames:
+        return read_empty(columns)
+    if len(frames) == 1:
+        return frames[0]
+
+    data = {}
+    for column in columns:
+        parts = [frame[column] for frame in frames]
+        if MATCH_SCHEMA[column] == 'category':
+            data[column] = union_categoricals([part.array for part in parts])
+        else:
+            data[column] = pd.concat(parts, ignore_index = True)
+
+    return pd.DataFrame(data)
+
+
+
+def read_empty(columns = None) -> DataFrame:
+    """
+    @Return:
+        An empty DataFrame with the columns and dtypes of the store
+    """
+    columns = columns or list(MATCH_SCHEMA)
+    return pd.DataFrame({column: pd.Series(dtype = MATCH_SCHEMA[column]) for column in columns})
+
+
+
+def clear_store(directory = 'data') -> None:
+    """
+    Deletes every segment of the store and its journal.
+
+    @Parameters:
+        directory (str): The folder of the store
+    """
+    shutil.rmtree(pathlib.Path(directory) / 'segments', ignore_errors = True)
+    journal_path(directory).unlink(missing_ok = True)
+    set_rescan(False, directory)
+
+
+
+def journal_path(directory = 'data') -> pathlib.Path:
+    """
+    @Return:
+        The path of the journal of processed match IDs
+    """
+    return pathlib.Path(directory) / 'journal.log'
+
+
+
+def journal_exists(directory = 'data') -> bool:
+    """
+    @Return:
+        True if matches have been journaled in this store. Stores written before the journal existed have none.
+    """
+    return journal_path(directory).exists()
+
+
+
+def append_journal(match_ids: list[str], directory = 'data') -> None:
+    """
+    Appends match IDs to the journal and flushes them to disk.
+
+    @Parameters:
+        match_ids (list[str]): The IDs of the matches that have been processed
+        directory (str): The folder of the store
+    """
+    path = journal_path(directory)
+    path.parent.mkdir(parents = True, exist_ok = True)
+    with open(path, 'a') as file:
+        file.write(''.join(f'{match_id}\n' for match_id in match_ids))
+        file.flush()
+        os.fsync(file.fileno())
+
+
+
+def read_journal(directory = 'data') -> set[str]:
+    """
+    Reads the IDs of every processed match. IDs kept in a segment's meta.json count too, in case the run stopped
+    between writing the segment and appending to the journal.
+
+    @Parameters:
+        directory (str): The folder of the store
+
+    @Return:
+        The set of processed match IDs
+    """
+    processed = set()
+    path = journal_path(directory)
+    if path.exists():
+        with open(path, 'r') as file:
+            processed.update(file.read().split('\n')[:-1]) # A line cut short by a crash has no newline yet
+
+    for segment in list_segments(directory):
+        with open(segment / 'meta.json', 'r') as file:
+            processed.update(json.load(file).get('match_ids', []))
+    return processed
+
+
+
+def read_recent(directory = 'data', size = 4096) -> set[str]:
+    """
+    Reads the IDs of the most recently processed matches: the end of the journal, and the IDs kept in the newest
+    segment's meta.json. Matches are journaled in the order of the match log, so this is enough to find where the last
+    run stopped without reading the whole journal.
+
+    @Parameters:
+        directory (str): The folder of the store
+        size (int): The number of bytes read from the end of the journal
+
+    @Return:
+        The set of the most recently processed match IDs, empty if nothing has been processed
+    """
+    recent = set()
+    path = journal_path(directory)
+    if path.exists():
+        with open(path, 'rb') as file:
+            end = file.seek(0, os.SEEK_END)
+            file.seek(max(end - size, 0))
+            lines = file.read().decode().split('\n')[:-1] # A line cut short by a crash has no newline yet
+        recent.update(lines[1:] if end > size else lines) # The first line read may be missing its start
+
+    segments = list_segments(directory)
+    if segments:
+        with open(segments[-1] / 'meta.json', 'r') as file:
+            recent.update(json.load(file).get('match_ids', []))
+    return recent
+
+
+
+def rescan_path(directory = 'data') -> pathlib.Path:
+    """
+    @Return:
+        The path of the file marking that the journal has gaps, see set_rescan()
+    """
+    return pathlib.Path(directory) / 'rescan'
+
+
+
+def rescan_needed(directory = 'data') -> bool:
+    """
+    @Return:
+        True if the whole journal has to be checked against the match log, see set_rescan()
+    """
+    return rescan_path(directory).exists()
+
+
+
+def set_rescan(needed: bool, directory = 'data') -> None:
+    """
+    Marks or unmarks the store as needing its whole journal checked against the match log. Needed when matches older
+    than the last processed one are missing from the journal, e.g. after rebuild_data_from_cache() skipped matches that
+    weren't cached, as read_recent() only finds where the last run stopped.
+
+    @Parameters:
+        needed (bool): True to mark the store, False once every match of the match log has been processed
+        directory (str): The folder of the store
+    """
+    path = rescan_path(directory)
+    if needed:
+        path.parent.mkdir(parents = True, exist_ok = True)
+        path.touch()
+    else:
+        path.unlink(missing_ok = True)
+
+
+
+def migrate_pickle(datafile = 'data.pkl', directory = 'data') -> bool:
+    """
+    Converts a data.pkl written by an older version into the first segment of the store. Does nothing if the store
+    already has data or there is no pickle.
+
+    @Parameters:
+        datafile (str): The pickled DataFrame of matches
+        directory (str): The folder of the store
+
+    @Return:
+        True if the pickle was converted
+    """
+    if store_exists(directory) or not os.path.exists(datafile):
+        return False
+
+    write_segment(pd.read_pickle(datafile), directory)
+    return True
+
+
+
+if __name__ == '__main__':
+    # Prints how much memory the stored matches take once loaded
+    print(memory_report(read_store()).to_string())
@@ -0,0 +1,313 @@
+"""
+Request and dataset metrics of the website, exposed in the Prometheus text format at /metrics, plus an opt-in sampling
+profiler that writes the stacks of slow requests to a file any flamegraph tool can read.
+
+Metrics live in the memory of the process that records them. With several gunicorn workers every worker has its own,
+and a scrape of /metrics reports the worker that answered it. Startup timings are recorded before the workers fork,
+so every worker reports them.
+"""
+
+import os
+import sys
+import time
+import threading
+from collections import Counter as StackCounter
+from contextlib import contextmanager
+
+from flask import g, request
+
+try:
+    import resource
+except ImportError: # Windows
+    resource = None
+
+# Upper bounds in seconds of the latency histogram buckets, from well under a millisecond to the slowest page builds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+"""
+Metric Types
+"""
+registry = [] # Every metric, in the order they are rendered
+
+def format_labels(labels: tuple) -> str:
+    """
+    Formats ((name, value), ...) as {name="value",...}, escaping values like the text format requires
+    """
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + '}'
+
+class Metric:
+    """
+    A named metric with one value (or histogram) per combination of label values
+    """
+    kind = 'untyped'
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self.values = {}
+        self.lock = threading.Lock()
+        registry.append(self)
+
+    def header(self) -> list:
+        return [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+
+    def render(self) -> list:
+        with self.lock:
+            samples = [f'{self.name}{format_labels(labels)} {value:g}' for labels, value in self.values.items()]
+        return self.header() + samples
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount = 1, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def set(self, value: float, **labels) -> None:
+        with self.lock:
+            self.values[tuple(sorted(labels.items()))] = value
+
+class Histogram(Metric):
+    """
+    Counts observations into cumulative buckets, with their sum and count, so quantiles can be estimated at query time
+    """
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str, buckets = LATENCY_BUCKETS):
+        super().__init__(name, help)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            counts, total = self.values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            counts[-1] += 1 # +Inf
+            self.values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        """
+        Observes the seconds spent in the with block
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self) -> list:
+        lines = self.header()
+        with self.lock:
+            for labels, (counts, total) in self.values.items():
+                for bound, count in zip(self.buckets, counts):
+                    lines.append(f'{self.name}_bucket{format_labels(labels + (("le", f"{bound:g}"),))} {count}')
+                lines.append(f'{self.name}_bucket{format_labels(labels + (("le", "+Inf"),))} {counts[-1]}')
+                lines.append(f'{self.name}_sum{format_labels(labels)} {total:g}')
+                lines.append(f'{self.name}_count{format_labels(labels)} {counts[-1]}')
+        return lines
+
+"""
+Website Metrics
+"""
+request_seconds = Histogram('lol_request_duration_seconds', 'Time to answer a request, by route and method.')
+requests_total = Counter('lol_requests_total', 'Requests answered, by route, method and status code.')
+champion_phase_seconds = Histogram('lol_champion_page_phase_seconds',
+                                   'Time spent in each phase of /champion: data lookup, payload build and template render.')
+startup_seconds = Gauge('lol_startup_seconds', 'Time each step of loading the app took when it started.')
+dataset_load_seconds = Gauge('lol_dataset_load_seconds', 'Time each step of loading the dataset snapshot being served took.')
+dataset_pages = Gauge('lol_dataset_pages', 'Champion pages in the dataset snapshot being served.')
+dataset_info = Gauge('lol_dataset_info', 'Version of the dataset snapshot being served.')
+dataset_reloads = Counter('lol_dataset_reloads_total', 'New dataset snapshots swapped in since the process started.')
+slow_request_profiles = Counter('lol_slow_request_profiles_total', 'Stack profiles written for slow requests, by route.')
+dataset_reloads.inc(0) # Unlabeled series are reported from the start
+
+@contextmanager
+def timed(gauge: Gauge, **labels):
+    """
+    Sets gauge to the seconds spent in the with block
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        gauge.set(time.perf_counter() - start, **labels)
+
+def record_snapshot(version: str, page_count: int) -> None:
+    """
+    Records which dataset is being served
+    """
+    with dataset_info.lock:
+        dataset_info.values.clear()
+    dataset_info.set(1, version=version)
+    dataset_pages.set(page_count)
+
+def process_memory() -> list:
+    """
+    Resident memory of this process now and at its peak, in the names the Prometheus client libraries use
+    """
+    lines = []
+    try:
+        with open('/proc/self/statm', 'r') as file:
+            resident_pages = int(file.read().split()[1])
+        lines += ['# HELP process_resident_memory_bytes Resident memory size in bytes.',
+                  '# TYPE process_resident_memory_bytes gauge',
+                  f'process_resident_memory_bytes {resident_pages * os.sysconf("SC_PAGE_SIZE")}']
+    except (OSError, ValueError): # Not Linux
+        pass
+
+    if resource:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        peak *= 1 if sys.platform == 'darwin' else 1024 # Bytes on macOS, kilobytes elsewhere
+        lines += ['# HELP process_max_resident_memory_bytes Peak resident memory size in bytes.',
+                  '# TYPE process_max_resident_memory_bytes gauge',
+                  f'process_max_resident_memory_bytes {peak}']
+    return lines
+
+def render_metrics() -> str:
+    """
+    Every metric in the Prometheus text exposition format
+    """
+    lines = []
+    for metric in registry:
+        lines += metric.render()
+    lines += process_memory()
+    return '\n'.join(lines) + '\n'
+
+"""
+Slow Request Profiler
+"""
+def collapse_stack(frame) -> str:
+    """
+    Formats a stack as root;...;leaf, one function (file:line) per frame, the collapsed format flamegraph tools read
+    """
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+class SlowRequestProfiler:
+    """
+    Samples the stack of every request in progress from a background thread. Requests slower than threshold seconds
+    have their samples written to directory as a .folded file, one "stack count" line per distinct stack, ready for
+    flamegraph.pl or speedscope. Sampling costs a little on every request, so it is only enabled on demand
+    """
+
+    def __init__(self, threshold: float, interval = 0.005, directory = 'profiles'):
+        self.threshold = threshold
+        self.interval = interval
+        self.directory = directory
+        self.active = {} # Thread ident -> StackCounter of the request running on that thread
+        self.lock = threading.Lock()
+        self.thread = None
+        os.register_at_fork(after_in_child=self.after_fork)
+
+    def after_fork(self) -> None:
+        """
+        Threads don't survive a fork, a forked worker starts its own sampler on its first request
+        """
+        self.active = {}
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def ensure_sampler(self) -> None:
+        """
+        Starts the sampling thread if it isn't running
+        """
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.sample, name='slow-request-profiler', daemon=True)
+            self.thread.start()
+
+    def sample(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            with self.lock:
+                for ident, stacks in self.active.items():
+                    frame = frames.get(ident)
+                    if frame is not None:
+                        stacks[collapse_stack(frame)] += 1
+
+    def start(self) -> None:
+        """
+        Starts sampling the request running on the calling thread
+        """
+        self.ensure_sampler()
+        with self.lock:
+            self.active[threading.get_ident()] = StackCounter()
+
+    def stop(self, seconds: float, route: str):
+        """
+        Stops sampling the calling thread's request and writes its stacks if it took longer than the threshold.
+        Returns the path of the written file, None if the request was fast enough
+        """
+        with self.lock:
+            stacks = self.active.pop(threading.get_ident(), None)
+        if not stacks or seconds < self.threshold:
+            return None
+
+        os.makedirs(self.directory, exist_ok=True)
+        name = route.strip('/').replace('/', '_').replace('<', '').replace('>', '') or 'index'
+        now = time.time()
+        stamp = f'{time.strftime("%Y%m%d-%H%M%S", time.localtime(now))}.{int(now * 1000) % 1000:03d}'
+        path = os.path.join(self.directory, f'{stamp}-{os.getpid()}-{name}-{int(seconds * 1000)}ms.folded')
+        with open(path, 'w') as file:
+            for stack, count in stacks.most_common():
+                file.write(f'{stack} {count}\n')
+        slow_request_profiles.inc(route=route)
+        return path
+
+"""
+Flask Integration
+"""
+def route_of_request() -> str:
+    """
+    The route pattern of the current request, so /champion?champion=Ahri and /champion?champion=Zed share a series
+    """
+    return request.url_rule.rule if request.url_rule else 'unmatched'
+
+def init_app(app, profiler = None) -> None:
+    """
+    Times every request of app by route, and profiles the slow ones with profiler if one is given
+    """
+    @app.before_request
+    def start_request_timer():
+        g.request_start = time.perf_counter()
+        if profiler:
+            profiler.start()
+
+    @app.teardown_request
+    def stop_request_timer(error = None):
+        start = g.pop('request_start', None)
+        if start is None:
+            return
+        seconds = time.perf_counter() - start
+        route = route_of_request()
+        request_seconds.observe(seconds, route=route, method=request.method)
+        if profiler:
+            profiler.stop(seconds, route)
+
+    @app.after_request
+    def count_response(response):
+        requests_total.inc(route=route_of_request(), method=request.method, status=response.status_code)
+        return response
+
+def reset_locks_after_fork() -> None:
+    """
+    A lock held by another thread at fork time stays locked forever in the child, so every metric gets a fresh one
+    """
+    for metric in registry:
+        metric.lock = threading.Lock()
+
+os.register_at_fork(after_in_child=reset_locks_after_fork)
@@ -0,0 +1,407 @@
+"""
+Builds the payload of every champion page (the data passed to champion.html) from the stat tables. The payloads only
+change when the match data does, so they are built once at the end of an update and written to pages.bin, which the
+website memory-maps.
+"""
+
+import os
+import json
+import mmap
+import struct
+from collections.abc import Mapping
+import match_store
+import storage
+
+"""
+Champion Data Index
+"""
+irrelevant_items = {'Stealth Ward', 'Oracle Lens', 'Control Ward', 'Health Potion', 'Elixir of Avarice', 
+                    'Elixir of Force', 'Farsight Alteration', 'Elixir of Iron', 'Elixir of Sorcery', 'Elixir of Wrath',
+                    'Elixir of Skill', "Doran's Blade", "Doran's Ring", "Doran's Shield", "Cull", "Mosstomper Seedling", "Scorchclaw Pup", 
+                    "Gustwalker Hatchling"}
+
+def build_champion_index(obj_df, wr_df, stats_df, tree_df, keystone_df, item_df) -> tuple:
+    """
+    Groups every table once into records keyed by (Champion, Role), and the item table by Champion, so that a lookup
+    is a dict hit instead of a scan over every table. Each table is converted to records in one call and the records
+    are grouped here, as converting every group on its own costs more than the grouping
+    """
+    role_tables = {
+        "objective_data": obj_df,
+        "winrate_data": wr_df,
+        "effectiveness_data": stats_df,
+        "tree_runes_data": tree_df,
+        "keystone_runes_data": keystone_df,
+    }
+
+    role_index = {}
+    for name, table in role_tables.items():
+        for record in table.to_dict(orient='records'):
+            key = (record['Champion'], record['Role'])
+            bundle = role_index.get(key)
+            if bundle is None:
+                bundle = role_index[key] = {table_name: [] for table_name in role_tables}
+            bundle[name].append(record)
+
+    item_index = {}
+    for item in item_df.to_dict(orient='records'):
+        items = item_index.setdefault(item['Champion'], [])
+        if item['Item'] not in irrelevant_items:
+            items.append(item)
+
+    return role_index, item_index
+
+empty_role_data = {
+    "objective_data": [],
+    "winrate_data": [],
+    "effectiveness_data": [],
+    "tree_runes_data": [],
+    "keystone_runes_data": [],
+}
+
+"""
+Graph Label Retrieval
+"""
+
+def get_radar_graph_labels(raw_data: dict) -> dict:
+    """
+    Returns a dict of the labels and values associated with all of the radar graphs to be created. This includes data on objective control and effectiveness
+    """
+
+    objective_data = raw_data['objective_data']
+    effectiveness_data = raw_data['effectiveness_data']
+
+    # If there are only Losses or Only Wins, Can't have the second dataset
+    if len(objective_data) == 1:
+
+        win = 'Wins' if objective_data[0]['Win'] else 'Losses'
+
+        graph_info = {
+        # Autoscales, 0-6
+        'objective_graph': {
+            'labels': [
+                {'text': 'Barons Killed'},
+                {'text': 'Void Grubs Killed'},
+                {'text': 'Dragons Killed'},
+                {'text': 'Turrets Destroyed'},
+                {'text': 'Turret Plates Taken'},
+                {'text': 'Rift Heralds Killed'}
+                
+            ],
+            'datasets':[
+                {
+                    'label': win,
+                    'data': [objective_data[0]['Barons_Killed'], 
+                             objective_data[0]['Void_Grubs_Killed'], 
+                             objective_data[0]['Dragons_Killed'], 
+                             objective_data[0]['Turrets_Killed'],
+                             effectiveness_data[0]['Turret_Plates_Taken'],
+                             objective_data[0]['Rift_Heralds_Killed']]
+                }
+            ]
+        }, 
+        # Autoscale Should Work, Between 0 - 150 ish
+        'resource_graph': {
+            'labels': [
+                {'text': 'Normalized Gold Per Minute in Tens'},
+                {'text': 'Total Minions Killed'},
+                {'text': 'Total Jungle Monsters Killed'},
+                {'text': 'Lane CS Before 10 Minutes'},
+                {'text': 'Jungle CS Before 10 Minutes'}
+
+            ],
+            'datasets':[
+                {
+                    'label': win,
+                    'data': [effectiveness_data[0]['Gold_Per_Minute'] / 10, 
+                             effectiveness_data[0]['Total_Minions_Killed'], 
+                             effectiveness_data[0]['Total_Jungle_Monsters_Killed'], 
+                             effectiveness_data[0]['Lane_Minions_Before_10_Minutes'], 
+                             effectiveness_data[0]['Jungle_CS_Before_10_Minutes']]
+                }
+            ]
+        }, 
+        # Autoscaled, Between 0 - 10 usually
+        'combat_graph': {
+            'labels': [
+                {'text': 'Total Damage Dealt To Champions In Ten Thousands'},
+                {'text': 'KDA'},
+                {'text': 'Damage Per Minute In Hundreds'},
+                {'text': 'Team Damage Share'},
+                {'text': 'Kill Participation'},
+                {'text': 'Vision Score Per Minute'},
+                {'text': 'Solo Kills'}
+            ],
+            'datasets':[
+                
+                {
+                    'label': win,
+                    'data': [effectiveness_data[0]['Total_Damage_DealtToChampions'] / 10000, 
+                             effectiveness_data[0]['KDA'], 
+                             effectiveness_data[0]['Damage_Per_Minute'] / 100,
+                             effectiveness_data[0]['Damage_Share'], 
+                             effectiveness_data[0]['Kill_Participation'], 
+                             effectiveness_data[0]['Vision_Score_Per_Minute'],
+                             effectiveness_data[0]['Sol_Kills']]
+                            
+                }
+            ]
+        }, 
+    }
+    
+    else:
+
+        graph_info = {
+            # Autoscales, 0-6
+            'objective_graph': {
+                'labels': [
+                    {'text': 'Barons Killed'},
+                    {'text': 'Void Grubs Killed'},
+                    {'text': 'Dragons Killed'},
+                    {'text': 'Turrets Destroyed'},
+                    {'text': 'Turret Plates Taken'},
+                    {'text': 'Rift Heralds Killed'}
+                    
+                ],
+                'datasets':[
+                    
+                
+                    { 
+                        'label': 'Wins',
+                        'data': [objective_data[1]['Barons_Killed'], 
+                                objective_data[1]['Void_Grubs_Killed'], 
+                                objective_data[1]['Dragons_Killed'], 
+                                objective_data[1]['Turrets_Killed'], 
+                                effectiveness_data[1]['Turret_Plates_Taken'],
+                                objective_data[1]['Rift_Heralds_Killed']]
+                    },
+                    {
+                        'label': 'Losses',
+                        'data': [objective_data[0]['Barons_Killed'], 
+                                objective_data[0]['Void_Grubs_Killed'], 
+                                objective_data[0]['Dragons_Killed'], 
+                                objective_data[0]['Turrets_Killed'],
+                                effectiveness_data[0]['Turret_Plates_Taken'],
+                                objective_data[0]['Rift_Heralds_Killed']]
+                    }
+                ]
+            }, 
+            # Autoscale Should Work, Between 0 - 150 ish
+            'resource_graph': {
+                'labels': [
+                    {'text': 'Normalized Gold Per Minute in Tens'},
+                    {'text': 'Total Minions Killed'},
+                    {'text': 'Total Jungle Monsters Killed'},
+                    {'text': 'Lane CS Before 10 Minutes'},
+                    {'text': 'Jungle CS Before 10 Minutes'}
+
+                ],
+                'datasets':[
+                    
+                
+                    { 
+                        'label': 'Wins',
+                        'data': [effectiveness_data[1]['Gold_Per_Minute'] / 10, 
+                                effectiveness_data[1]['Total_Minions_Killed'], 
+                                effectiveness_data[1]['Total_Jungle_Monsters_Killed'], 
+                                effectiveness_data[1]['Lane_Minions_Before_10_Minutes'], 
+                                effectiveness_data[1]['Jungle_CS_Before_10_Minutes']]
+                                
+
+                    },
+                    {
+                        'label': 'Losses',
+                        'data': [effectiveness_data[0]['Gold_Per_Minute'] / 10, 
+                                effectiveness_data[0]['Total_Minions_Killed'], 
+                                effectiveness_data[0]['Total_Jungle_Monsters_Killed'], 
+                                effectiveness_data[0]['Lane_Minions_Before_10_Minutes'], 
+                                effectiveness_data[0]['Jungle_CS_Before_10_Minutes']]
+                    }
+                ]
+            }, 
+            # Autoscaled, Between 0 - 10 usually
+            'combat_graph': {
+                'labels': [
+                    {'text': 'Total Damage Dealt To Champions In Ten Thousands'},
+                    {'text': 'KDA'},
+                    {'text': 'Damage Per Minute In Hundreds'},
+                    {'text': 'Team Damage Share'},
+                    {'text': 'Kill Participation'},
+                    {'text': 'Vision Score Per Minute'},
+                    {'text': 'Solo Kills'}
+                ],
+                'datasets':[
+                    
+                
+                    { 
+                        'label': 'Wins',
+                        'data': [effectiveness_data[1]['Total_Damage_DealtToChampions'] / 10000, 
+                                effectiveness_data[1]['KDA'], 
+                                effectiveness_data[1]['Damage_Per_Minute'] / 100,
+                                effectiveness_data[1]['Damage_Share'], 
+                                effectiveness_data[1]['Kill_Participation'], 
+                                effectiveness_data[1]['Vision_Score_Per_Minute'],
+                                effectiveness_data[1]['Sol_Kills']]
+                                
+
+                    },
+                    {
+                        'label': 'Losses',
+                        'data': [effectiveness_data[0]['Total_Damage_DealtToChampions'] / 10000, 
+                                effectiveness_data[0]['KDA'], 
+                                effectiveness_data[0]['Damage_Per_Minute'] / 100,
+                                effectiveness_data[0]['Damage_Share'], 
+                                effectiveness_data[0]['Kill_Participation'], 
+                                effectiveness_data[0]['Vision_Score_Per_Minute'],
+                                effectiveness_data[0]['Sol_Kills']]
+                                
+                    }
+                ]
+            }, 
+        }
+
+    return graph_info
+
+"""
+Best Runepages Logic and Retrieval
+"""
+
+def get_runepage_recs(raw_data: dict) -> dict:
+
+    runepage_data = raw_data['keystone_runes_data']
+    # Find the runepages with the best winrate, best score (games played * winrate), and most games played
+    best_runepages = [max(runepage_data, key=lambda x: x['Winrate']), 
+                     max(runepage_data, key=lambda x: x['Score']), 
+                     max(runepage_data, key=lambda x: x['Games_Played'])]
+    
+    
+    # Sort this into a dictionary to be passed to the frontend
+    runepage_info = {
+        'winrate_keystone': best_runepages[0]['Primary_Keystone'],
+        'winrate_secondary': best_runepages[0]['Secondary_Tree'],
+        'winrate_wr': best_runepages[0]['Winrate'],
+        'winrate_gp': best_runepages[0]['Games_Played'],
+        'score_keystone': best_runepages[1]['Primary_Keystone'],
+        'score_secondary': best_runepages[1]['Secondary_Tree'],
+        'score_wr': best_runepages[1]['Winrate'],
+        'score_gp': best_runepages[1]['Games_Played'],
+        'games_keystone': best_runepages[2]['Primary_Keystone'],
+        'games_secondary': best_runepages[2]['Secondary_Tree'],
+        'games_wr': best_runepages[2]['Winrate'],
+        'games_gp': best_runepages[2]['Games_Played'],
+    }
+
+    return runepage_info
+
+
+
+"""
+Materialization
+"""
+
+def build_page_payloads(obj_df, wr_df, stats_df, tree_df, keystone_df, item_df) -> dict:
+    """
+    Builds the payload of every (Champion, Role) that has games: the champion data, the radar graphs and the runepage
+    recommendations. Pairs whose data can't fill a page (e.g. no runepage data) are left out, like the search treats them.
+    """
+    role_index, item_index = build_champion_index(obj_df, wr_df, stats_df, tree_df, keystone_df, item_df)
+
+    payloads = {}
+    for (champion, role), bundle in role_index.items():
+        if not bundle['winrate_data']:
+            continue
+        info = {**bundle, "item_winrate_data": item_index.get(champion, [])}
+        try:
+            payloads[(champion, role)] = {
+                "info": info,
+                "radar_graph_info": get_radar_graph_labels(raw_data=info),
+                "runepage_info": get_runepage_recs(raw_data=info),
+            }
+        except (IndexError, KeyError, ValueError):
+            continue
+
+    return payloads
+
+MAGIC = b'LOLPAGES1\n'
+
+def write_pages(payloads: dict, version: str, path = 'pages.bin') -> None:
+    """
+    Writes the payloads to a single file that readers memory-map instead of loading: a magic line, the 8 byte length of a
+    json header holding the dataset version and the (offset, length) of every page, then the json of every page back to
+    back. Written with storage.atomic_write() so a reader never sees a partial file
+    """
+    index = {}
+    bodies = []
+    offset = 0
+    for (champion, role), payload in payloads.items():
+        body = json.dumps(payload, separators=(',', ':')).encode()
+        index[f"{champion}|{role}"] = [offset, len(body)]
+        bodies.append(body)
+        offset += len(body)
+
+    header = json.dumps({"version": version, "index": index}, separators=(',', ':')).encode()
+    with storage.atomic_write(path, 'wb') as file:
+        file.write(MAGIC)
+        file.write(struct.pack('<Q', len(header)))
+        file.write(header)
+        for body in bodies:
+            file.write(body)
+
+class PageStore(Mapping):
+    """
+    Read-only mapping of (Champion, Role) -> page payload backed by a memory-mapped file from write_pages(). Pages are
+    decoded when they are looked up, and the file's bytes live in the OS page cache, so every worker process that opens
+    the same file shares one copy of it instead of holding its own. A file replaced by a newer version stays readable
+    by the stores still mapping it
+    """
+
+    def __init__(self, path: str):
+        with open(path, 'rb') as file:
+            self.buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.buffer[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a page file")
+
+        header_length, = struct.unpack_from('<Q', self.buffer, len(MAGIC))
+        header_start = len(MAGIC) + 8
+        header = json.loads(self.buffer[header_start:header_start + header_length])
+        self.version = header['version']
+        self.body_start = header_start + header_length
+        self.index = {tuple(key.split('|', 1)): (offset, length) for key, (offset, length) in header['index'].items()}
+
+    def __getitem__(self, key: tuple) -> dict:
+        offset, length = self.index[key]
+        start = self.body_start + offset
+        return json.loads(self.buffer[start:start + length])
+
+    def __contains__(self, key) -> bool:
+        return key in self.index
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+def load_pages(path = 'pages.bin', version = None):
+    """
+    Opens the pages written by write_pages() as a PageStore keyed by (Champion, Role). Returns None if there is no file
+    or it was built from a different version of the dataset than version
+    """
+    if not os.path.exists(path):
+        return None
+    store = PageStore(path)
+    if version is not None and store.version != version:
+        return None
+    return store
+
+def materialize_pages(directory = 'data', aggregates_file = 'aggregates.pkl', path = 'pages.bin') -> str:
+    """
+    Folds any new matches into the aggregates, then builds and writes the payload of every champion page. Run at the end
+    of every update, so the website only has to load the result. Returns the version of the dataset the pages belong to
+    """
+    import aggregates # Imported here, so the website only loads aggregates and Helper when it has to build the pages
+    accumulators = aggregates.refresh_accumulators(directory, aggregates_file)
+    payloads = build_page_payloads(*aggregates.accumulators_to_statdfs(accumulators))
+    version = match_store.version_of(accumulators['segments'])
+    write_pages(payloads, version, path)
+    return version
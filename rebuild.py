@@ -0,0 +1,15 @@
+import Helper as req
+import json
+
+matches_file = "matches.log"
+data_store = "data"
+
+if __name__ == "__main__": # The worker processes import this file again where they are spawned (Windows, macOS)
+    with open("info.json", "r") as json_file:
+        data = json.load(json_file)
+
+    puuid = data.get("puuid")
+
+    #REBUILD THE DATAFRAME FROM THE RAW MATCH CACHE, NO API KEY NEEDED, ONE WORKER PROCESS PER CPU
+    missing = req.rebuild_data_from_cache(puuid=puuid, datastore=data_store, matches_file=matches_file, workers=None)
+    print(f"Rebuilt {data_store}, {missing} matches missing from the cache")
@@ -1,9 +1,14 @@
 import Helper as req
+import match_log
 import json
 import os
+import shutil
 
-matches_file = "matches.json"
-data_file = "data.pkl"
+matches_file = "matches.log"
+legacy_matches_file = "matches.json"
+data_store = "data"
+legacy_data_file = "data.pkl"
+aggregates_file = "aggregates.pkl"
 results_file = "results.json"
 info_file = "info.json"
 region = "americas" # CHANGE IF NEEDED
@@ -19,22 +24,22 @@ puuid = req.fetch_account_puuid(gameName=gameName, tagLine= tagline, api_key=api
 
 with open(info_file, 'w') as json_file:
     info = {
-        riot_id: riot_id,
-        puuid: puuid
+        'riot_id': riot_id,
+        'puuid': puuid
     }
     json.dump(info, json_file, indent = 4)
 
-# Setup matches.json to be properly formatted
-with open("matches.json", "w") as json_file:
-    matches = {
-        "latest": 0,
-        "matchlist": []
-    }
-    json.dump(matches, json_file, indent=4)
+# Setup an empty match log, see match_log.py
+match_log.create(matches_file)
 
 # Delete previous data if it exists
-if os.path.exists(data_file):
-    os.remove(data_file)
+if os.path.exists(data_store):
+    shutil.rmtree(data_store)
+if os.path.exists(legacy_data_file):
+    os.remove(legacy_data_file)
+if os.path.exists(legacy_matches_file):
+    os.remove(legacy_matches_file)
 
 # Fetch matches, get data, get everything started
-req.update_data(puuid = puuid, api_key=api_key, datafile = data_file, matches_file = matches_file, new = True)
+req.update_data(puuid = puuid, api_key=api_key, datastore = data_store, matches_file = matches_file, new = True,
+                aggregates_file = aggregates_file)
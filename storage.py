@@ -0,0 +1,118 @@
+"""
+Crash-safe file writes shared by the stores.
+
+Every file and folder is written under a temporary name next to its final place, then renamed into place in one step,
+so a reader, or the next run after a crash, sees either the old version or the new one, never half of one. A rename
+is only atomic within one filesystem, which keeping the temporary name in the same folder guarantees.
+
+Segmented stores (match_store.py, timeline_store.py) are folders of numbered, append-only segments:
+
+    <store>/
+        segments/
+            000001/
+            000002/
+            ...
+"""
+
+import os
+import shutil
+import pathlib
+import threading
+from contextlib import contextmanager
+
+
+
+def temp_name(path) -> str:
+    """
+    @Return:
+        A temporary name for path, unique to the calling process and thread
+    """
+    return f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+
+
+
+@contextmanager
+def atomic_write(path, mode = 'w', fsync = False):
+    """
+    Opens a temporary file next to path and yields it. When the with block ends, the file is renamed over path. If the
+    block raises, the temporary file is deleted and path is left as it was.
+
+    @Parameters:
+        path (str): The file to write
+        mode (str): 'w' or 'wb'
+        fsync (bool): Flush the file to disk before the rename, so the new version survives a power loss
+
+    """
+    temp_path = temp_name(path)
+    try:
+        with open(temp_path, mode) as file:
+            yield file
+            if fsync:
+                file.flush()
+                os.fsync(file.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+
+def list_segments(directory) -> list[pathlib.Path]:
+    """
+    Lists the segments of a segmented store, oldest first.
+
+    @Parameters:
+        directory (str): The folder of the store
+
+    @Return:
+        A list of the paths of every segment
+    """
+    segments = pathlib.Path(directory) / 'segments'
+    if not segments.exists():
+        return []
+    return sorted(path for path in segments.iterdir() if path.is_dir() and path.name.isdigit())
+
+
+
+def new_segment(directory) -> pathlib.Path:
+    """
+    Creates an empty temporary folder for a segment in the store, to fill and then hand to publish_segment(). Readers
+    skip it, as its name isn't a number.
+
+    @Parameters:
+        directory (str): The folder of the store
+
+    @Return:
+        The path of the temporary folder
+    """
+    segments = pathlib.Path(directory) / 'segments'
+    segments.mkdir(parents = True, exist_ok = True)
+    temp_path = segments / f'.{os.getpid()}.{threading.get_ident()}.tmp' # Inside segments/, renamed within one folder
+    if temp_path.exists(): # Left behind by a crashed write of a process with the same id
+        shutil.rmtree(temp_path)
+    temp_path.mkdir()
+    return temp_path
+
+
+
+def publish_segment(path, directory) -> pathlib.Path:
+    """
+    Renames a finished segment folder into the store as its newest segment. The folder can come from new_segment() or
+    from another store on the same filesystem, e.g. one written by a worker process.
+
+    @Parameters:
+        path (Path): The folder of the segment
+        directory (str): The folder of the store
+
+    @Return:
+        The path of the segment in the store
+    """
+    segments = pathlib.Path(directory) / 'segments'
+    segments.mkdir(parents = True, exist_ok = True)
+
+    existing = list_segments(directory)
+    number = int(existing[-1].name) + 1 if existing else 1
+    final_path = segments / f'{number:06d}'
+    os.rename(path, final_path)
+    return final_path
@@ -0,0 +1,131 @@
+"""
+Tests of the on-disk format of the match log, see match_log.py.
+
+    python -m unittest discover tests
+"""
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import match_log
+
+IDS = [f'NA1_{5000000000 + i}' for i in range(1, 6)] # Oldest first
+
+
+
+class MatchLogTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.folder.name, 'matches.log')
+
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+
+    def test_create_and_read(self):
+        match_log.create(self.path, IDS, latest = 1721430000)
+
+        self.assertEqual(match_log.read_ids(self.path), IDS[::-1])
+        self.assertEqual(match_log.read_latest(self.path), 1721430000)
+        with open(self.path, 'r') as file:
+            self.assertEqual(file.readline(), 'MATCHLOG 1 latest=00000000001721430000\n')
+
+
+    def test_tail_matches_read_ids(self):
+        ids = [f'NA1_{5000000000 + i}' for i in range(1000)] # Several BLOCK_SIZE blocks
+        match_log.create(self.path, ids, latest = 1)
+
+        newest_first = match_log.read_ids(self.path)
+        for count in (0, 1, 5, 272, 273, 999, 1000, 5000):
+            self.assertEqual(match_log.tail(self.path, count), newest_first[:count])
+
+
+    def test_tail_until(self):
+        ids = [f'NA1_{5000000000 + i}' for i in range(1000)]
+        match_log.create(self.path, ids, latest = 1)
+
+        self.assertEqual(match_log.tail_until({ids[-1]}, self.path), ([], True))
+        self.assertEqual(match_log.tail_until({ids[990], ids[500]}, self.path, count = 4), (ids[:990:-1], True))
+        self.assertEqual(match_log.tail_until({ids[3]}, self.path, count = 1), (ids[:3:-1], True)) # Read past count
+        self.assertEqual(match_log.tail_until({'NA1_1'}, self.path), (ids[::-1], False))
+        self.assertEqual(match_log.tail_until(set(), self.path), (ids[::-1], False))
+
+
+    def test_append(self):
+        match_log.create(self.path, IDS[:3], latest = 100)
+        match_log.append(IDS[3:], latest = 200, path = self.path)
+
+        self.assertEqual(match_log.read_ids(self.path), IDS[::-1])
+        self.assertEqual(match_log.read_latest(self.path), 200)
+
+
+    def test_append_after_torn_line(self):
+        match_log.create(self.path, IDS[:3], latest = 100)
+        with open(self.path, 'a') as file:
+            file.write(IDS[3][:7]) # A crash in the middle of writing IDS[3]
+
+        self.assertEqual(match_log.read_ids(self.path), IDS[2::-1]) # The torn line is never read
+        self.assertEqual(match_log.tail(self.path, 10), IDS[2::-1])
+
+        match_log.append(IDS[3:], latest = 200, path = self.path)
+        self.assertEqual(match_log.read_ids(self.path), IDS[::-1])
+        self.assertEqual(match_log.read_latest(self.path), 200)
+
+
+    def test_append_after_torn_first_line(self):
+        match_log.create(self.path, [], latest = 0)
+        with open(self.path, 'a') as file:
+            file.write(IDS[0][:5])
+
+        match_log.append(IDS[:2], latest = 100, path = self.path)
+        self.assertEqual(match_log.read_ids(self.path), IDS[1::-1])
+
+
+    def test_compact(self):
+        match_log.create(self.path, IDS[:3] + [IDS[1], IDS[3], IDS[0]], latest = 300)
+
+        self.assertEqual(match_log.compact(self.path), 2)
+        self.assertEqual(match_log.read_ids(self.path), IDS[3::-1]) # Oldest position of each ID kept
+        self.assertEqual(match_log.read_latest(self.path), 300)
+        self.assertEqual(match_log.compact(self.path), 0)
+
+
+    def test_migrate_json(self):
+        json_file = os.path.join(self.folder.name, 'matches.json')
+        with open(json_file, 'w') as file:
+            json.dump({'latest': 1721430000, 'matchlist': IDS[::-1] + [IDS[0]]}, file) # Newest first, with a duplicate
+
+        self.assertTrue(match_log.migrate_json(json_file, self.path))
+        self.assertEqual(match_log.read_ids(self.path), IDS[::-1])
+        self.assertEqual(match_log.read_latest(self.path), 1721430000)
+
+        self.assertFalse(match_log.migrate_json(json_file, self.path)) # The log already exists
+        self.assertFalse(match_log.migrate_json(os.path.join(self.folder.name, 'missing.json'), self.path + '2'))
+
+
+    def test_migrate_json_rejects_other_files(self):
+        json_file = os.path.join(self.folder.name, 'matches.json')
+        with open(json_file, 'w') as file:
+            json.dump({'matches': IDS}, file)
+
+        with self.assertRaises(ValueError):
+            match_log.migrate_json(json_file, self.path)
+        self.assertFalse(os.path.exists(self.path))
+
+
+    def test_read_latest_rejects_other_files(self):
+        with open(self.path, 'w') as file:
+            file.write('{"latest": 0, "matchlist": []}')
+
+        with self.assertRaises(ValueError):
+            match_log.read_latest(self.path)
+
+
+
+if __name__ == '__main__':
+    unittest.main()
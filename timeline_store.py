@@ -0,0 +1,242 @@
+"""
+On-disk store of match timelines, reduced to fixed width per-minute NumPy arrays.
+
+A timeline payload is a deeply nested list of per-minute frames for all ten participants, megabytes of Python dicts
+once decoded. Every timeline is reduced to one float32 block as soon as it is fetched, holding the gold, xp, cs and
+level of the player and of their lane opponent at every minute, and the payload is dropped:
+
+    stats[game, stat, side, minute]     stat in STATS, side 0 = player and 1 = lane opponent, minute < MINUTES
+
+Minutes after the end of the game, and every minute of the opponent if nobody on the other team played the same
+position, are NaN. Like the match store, the store is a folder of append-only segments, one .npy file per array, so
+the arrays can be memory-mapped and queried across thousands of games without Python loops:
+
+    timelines/
+        segments/
+            000001/
+                meta.json                   (number of games, unique id, every match ID handled by the segment)
+                stats.npy                   (games x STATS x 2 x MINUTES float32)
+                win.npy
+                Champion.codes.npy          (int16 codes + their categories)
+                Champion.categories.json
+                Role.codes.npy
+                Role.categories.json
+                Opponent.codes.npy
+                Opponent.categories.json
+            000002/
+                ...
+"""
+
+import json
+import uuid
+import shutil
+import pathlib
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+import storage
+
+MINUTES = 40 # Minutes kept per game, later frames are dropped
+STATS = ('gold', 'xp', 'cs', 'level')
+LABELS = ('Champion', 'Role', 'Opponent') # Category arrays stored alongside stats
+
+
+
+def parse_timeline(match: dict, timeline: dict, puuid: str, filterMap = 11):
+    """
+    Reduces a timeline to the per-minute stats of the player and their lane opponent.
+
+    @Parameters:
+        match (dict): The json of the match, for the champions, positions and teams of the participants
+        timeline (dict): The json of the match's timeline
+        puuid (str): The player for which we are fetching statistics for
+        filterMap (int): The type of map for which we are to process. If the mapId doesn't match, then skip
+
+    @Return:
+        A tuple of the labels (champion, role, opponent champion), the win and the (STATS, 2, MINUTES) float32 block, None if
+        the match was skipped
+    """
+    match_info = match['info']
+    if filterMap and filterMap != match_info.get('mapId'):
+        return None
+
+    participants = match_info['participants']
+    idx = match['metadata']['participants'].index(puuid)
+    player = participants[idx]
+    role = player.get('teamPosition')
+    opponent = next((other for other in participants if role and other.get('teamPosition') == role
+                     and other.get('teamId') != player.get('teamId')), None)
+
+    frame_ids = {entry['puuid']: str(entry['participantId']) for entry in timeline['info'].get('participants', [])}
+    sides = [frame_ids.get(player.get('puuid', puuid), str(idx + 1))]
+    if opponent is not None:
+        sides.append(frame_ids.get(opponent.get('puuid'), str(participants.index(opponent) + 1)))
+
+    block = np.full((len(STATS), 2, MINUTES), np.nan, dtype = np.float32)
+    for minute, frame in enumerate(timeline['info']['frames'][:MINUTES]):
+        participant_frames = frame['participantFrames']
+        for side, frame_id in enumerate(sides):
+            stats = participant_frames.get(frame_id)
+            if stats is None:
+                continue
+            block[:, side, minute] = (stats.get('totalGold', np.nan), stats.get('xp', np.nan),
+                                      stats.get('minionsKilled', 0) + stats.get('jungleMinionsKilled', 0), stats.get('level', np.nan))
+
+    labels = (player.get('championName'), role, opponent.get('championName') if opponent else None)
+    return labels, bool(player.get('win')), block
+
+
+
+def list_segments(directory = 'timelines') -> list[pathlib.Path]:
+    """
+    @Return:
+        The paths of every segment of the store, oldest first, see storage.list_segments()
+    """
+    return storage.list_segments(directory)
+
+
+
+def handled_ids(directory = 'timelines') -> set[str]:
+    """
+    @Return:
+        The IDs of every match a segment was written for, including the matches that were skipped
+    """
+    handled = set()
+    for segment in list_segments(directory):
+        with open(segment / 'meta.json', 'r') as file:
+            handled.update(json.load(file)['match_ids'])
+    return handled
+
+
+
+def write_segment(games: list[tuple], match_ids: list[str], directory = 'timelines') -> pathlib.Path:
+    """
+    Appends games to the store as a new segment, published with storage.publish_segment().
+
+    @Parameters:
+        games (list[tuple]): Results of parse_timeline()
+        match_ids (list[str]): The IDs of every match handled, including those parse_timeline() skipped
+        directory (str): The folder of the store
+
+    @Return:
+        The path of the new segment
+    """
+    temp_path = storage.new_segment(directory)
+
+    stats = np.stack([block for _, _, block in games]) if games else np.empty((0, len(STATS), 2, MINUTES), dtype = np.float32)
+    np.save(temp_path / 'stats.npy', stats)
+    np.save(temp_path / 'win.npy', np.array([win for _, win, _ in games], dtype = bool))
+    for i, label in enumerate(LABELS):
+        values = pd.Categorical([labels[i] for labels, _, _ in games])
+        np.save(temp_path / f'{label}.codes.npy', values.codes.astype(np.int16))
+        with open(temp_path / f'{label}.categories.json', 'w') as file:
+            json.dump([str(category) for category in values.categories], file)
+
+    with open(temp_path / 'meta.json', 'w') as file:
+        json.dump({'rows': len(games), 'id': uuid.uuid4().hex, 'match_ids': list(match_ids)}, file)
+
+    return storage.publish_segment(temp_path, directory)
+
+
+
+def read_segment(path: pathlib.Path, mmap = True) -> dict:
+    """
+    Reads one segment.
+
+    @Parameters:
+        path (Path): The folder of the segment
+        mmap (bool): Memory-map the stats instead of reading them into memory
+
+    @Return:
+        A dict with the stats and win arrays and a Categorical for every label
+    """
+    path = pathlib.Path(path)
+    data = {
+        'stats': np.load(path / 'stats.npy', mmap_mode = 'r' if mmap else None),
+        'win': np.load(path / 'win.npy'),
+    }
+    for label in LABELS:
+        with open(path / f'{label}.categories.json', 'r') as file:
+            categories = json.load(file)
+        data[label] = pd.Categorical.from_codes(np.load(path / f'{label}.codes.npy'), categories = categories)
+    return data
+
+
+
+def read_store(directory = 'timelines', mmap = True) -> dict:
+    """
+    Reads every segment of the store into one set of arrays. A store with a single segment stays memory-mapped.
+
+    @Parameters:
+        directory (str): The folder of the store
+        mmap (bool): Memory-map the stats of the segments
+
+    @Return:
+        A dict with the stats (games x STATS x 2 x MINUTES) and win arrays and a Categorical for every label
+    """
+    parts = [read_segment(path, mmap) for path in list_segments(directory)]
+    if not parts:
+        return {'stats': np.empty((0, len(STATS), 2, MINUTES), dtype = np.float32), 'win': np.empty(0, dtype = bool),
+                **{label: pd.Categorical([]) for label in LABELS}}
+    if len(parts) == 1:
+        return parts[0]
+
+    data = {key: np.concatenate([part[key] for part in parts]) for key in ('stats', 'win')}
+    for label in LABELS:
+        data[label] = pd.api.types.union_categoricals([part[label] for part in parts])
+    return data
+
+
+
+def clear_store(directory = 'timelines') -> None:
+    """
+    Deletes every segment of the store.
+    """
+    shutil.rmtree(pathlib.Path(directory) / 'segments', ignore_errors = True)
+
+
+
+def diff_at(data: dict, stat = 'gold', minutes = (10, 15)) -> DataFrame:
+    """
+    Averages the difference between the player and their lane opponent in stat at the given minutes, per (Champion, Role),
+    with one bincount per minute over every game at once.
+
+    @Parameters:
+        data (dict): Timelines from read_store()
+        stat (str): One of STATS
+        minutes (tuple[int]): The minutes to compare at, each under MINUTES
+
+    @Return:
+        A DataFrame with the Champion, Role, the number of Games with an opponent and a <Stat>_Diff_<minute> column for every
+        minute, averaged over the games that lasted that long
+    """
+    champions, roles = data['Champion'], data['Role']
+    size = len(champions.categories) * len(roles.categories)
+    valid = (champions.codes >= 0) & (roles.codes >= 0)
+    bins = champions.codes.astype(np.int64) * len(roles.categories) + roles.codes
+    bins = bins[valid]
+
+    stats = data['stats'][valid, STATS.index(stat)] # games x 2 x MINUTES
+    has_opponent = ~np.isnan(stats[:, 1, 0])
+
+    table = {'Games': np.bincount(bins[has_opponent], minlength = size)}
+    for minute in minutes:
+        diff = stats[:, 0, minute] - stats[:, 1, minute]
+        played = ~np.isnan(diff)
+        sums = np.bincount(bins[played], weights = diff[played].astype(np.float64), minlength = size)
+        counts = np.bincount(bins[played], minlength = size)
+        with np.errstate(invalid = 'ignore', divide = 'ignore'):
+            table[f'{stat.capitalize()}_Diff_{minute}'] = sums / counts
+
+    index = pd.MultiIndex.from_product([champions.categories, roles.categories], names = ['Champion', 'Role'])
+    df = pd.DataFrame(table, index = index)
+    return df[df['Games'] > 0].reset_index()
+
+
+
+def gold_diff_at(directory = 'timelines', minutes = (10, 15)) -> DataFrame:
+    """
+    @Return:
+        The average gold difference with the lane opponent at minutes per (Champion, Role), see diff_at()
+    """
+    return diff_at(read_store(directory), 'gold', minutes)
@@ -0,0 +1,198 @@
+"""
+Spans around every stage of an ingestion run (network, rate limit waits and sleeps, json decoding, parsing, building
+the DataFrame, writing the store...), written as json lines to a trace file and summarized at the end of the run.
+
+A run is started with trace_run(). While it is active, span() and add() record into it from any thread, including the
+match fetching workers. Outside a run they do nothing, so the instrumented functions cost nothing when called on their
+own.
+
+Every line of the trace file is one span:
+
+    {"stage": "network", "start": 0.1532, "seconds": 0.0841, "thread": "ThreadPoolExecutor-0_3", "status": 200}
+
+start is in seconds since the run began. Spans from worker threads overlap, so the totals of a stage can add up to more
+than the wall time of the run.
+"""
+
+import os
+import json
+import time
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+
+
+class Trace:
+    """
+
+    The spans of one run, kept per stage for the summary and appended to a json lines file if a path is given.
+
+    @Parameters:
+        name (str): The name of the run, e.g. 'update'.
+        path (str, optional): The json lines file to write every span to.
+
+    """
+
+    def __init__(self, name: str, path = None):
+        self.name = name
+        self.path = path
+        self.started = time.perf_counter()
+        self.finished = None
+        self.matches = 0
+        self.durations = defaultdict(list)
+        self._lock = threading.Lock()
+        self._file = None
+        if path:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok = True)
+            self._file = open(path, 'w')
+
+
+    def record(self, stage: str, start: float, seconds: float, attributes = None) -> None:
+        """
+
+        Adds one span.
+
+        @Parameters:
+            stage (str): The stage the time was spent in.
+            start (float): time.perf_counter() at the start of the span.
+            seconds (float): The length of the span.
+            attributes (dict, optional): Extra fields written to the trace file.
+
+        """
+        with self._lock:
+            self.durations[stage].append(seconds)
+            if self._file:
+                line = {'stage': stage, 'start': round(start - self.started, 6), 'seconds': round(seconds, 6),
+                        'thread': threading.current_thread().name, **(attributes or {})}
+                self._file.write(json.dumps(line, default = str) + '\n')
+
+
+    def close(self) -> None:
+        with self._lock:
+            self.finished = time.perf_counter()
+            if self._file:
+                self._file.close()
+                self._file = None
+
+
+    def summary(self) -> list[dict]:
+        """
+
+        @Returns:
+            list[dict]: Per stage, the number of spans, their total seconds and their p50, p95 and max, largest total first.
+
+        """
+        rows = []
+        with self._lock:
+            for stage, durations in self.durations.items():
+                ordered = sorted(durations)
+                rows.append({'stage': stage, 'count': len(ordered), 'total': sum(ordered), 'p50': percentile(ordered, 50),
+                             'p95': percentile(ordered, 95), 'max': ordered[-1]})
+        return sorted(rows, key = lambda row: row['total'], reverse = True)
+
+
+    def format_summary(self) -> str:
+        """
+
+        @Returns:
+            str: The summary as a table, followed by the wall time and matches per second of the run.
+
+        """
+        wall = (self.finished or time.perf_counter()) - self.started
+        lines = [f"{'stage':<18} {'count':>7} {'total s':>9} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9}"]
+        for row in self.summary():
+            lines.append(f"{row['stage']:<18} {row['count']:>7} {row['total']:>9.3f} {row['p50'] * 1000:>9.2f} "
+                         f"{row['p95'] * 1000:>9.2f} {row['max'] * 1000:>9.2f}")
+        rate = self.matches / wall if wall > 0 else 0.0
+        lines.append(f"{self.name}: {self.matches} matches in {wall:.2f}s, {rate:.2f} matches/s")
+        if self.path:
+            lines.append(f"Trace written to {self.path}")
+        return "\n".join(lines)
+
+
+
+def percentile(ordered: list[float], percent: float) -> float:
+    """
+
+    @Returns:
+        float: The nearest-rank percentile of an already sorted, non-empty list.
+
+    """
+    rank = max(1, -(-len(ordered) * percent // 100))
+    return ordered[int(rank) - 1]
+
+
+
+active = None # The Trace of the run in progress, shared by every thread
+last = None # The Trace of the last finished run
+
+
+
+@contextmanager
+def span(stage: str, **attributes):
+    """
+
+    Records the time spent in the with block as a span of stage, if a run is being traced. Yields the attributes dict,
+    so fields only known at the end (e.g. the status of a response) can be added to it.
+
+    @Parameters:
+        stage (str): The stage the time is spent in.
+        attributes: Extra fields written to the trace file.
+
+    """
+    trace = active
+    if trace is None:
+        yield attributes
+        return
+
+    start = time.perf_counter()
+    try:
+        yield attributes
+    finally:
+        trace.record(stage, start, time.perf_counter() - start, attributes)
+
+
+
+def add(stage: str, seconds: float, **attributes) -> None:
+    """
+
+    Records a span measured elsewhere, e.g. the wait returned by RateLimiter.acquire(), ending now.
+
+    @Parameters:
+        stage (str): The stage the time was spent in.
+        seconds (float): The length of the span.
+        attributes: Extra fields written to the trace file.
+
+    """
+    trace = active
+    if trace is not None:
+        trace.record(stage, time.perf_counter() - seconds, seconds, attributes)
+
+
+
+@contextmanager
+def trace_run(name: str, directory = 'traces'):
+    """
+
+    Traces everything recorded inside the with block as one run, then prints its summary.
+
+    @Parameters:
+        name (str): The name of the run, also used in the name of the trace file.
+        directory (str, optional): The folder the trace file is written to, None to only keep the summary.
+
+    @Returns:
+        Trace: The trace of the run, set its matches to report matches per second.
+
+    """
+    global active, last
+    path = os.path.join(directory, f"{name}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.jsonl") if directory else None
+    trace = Trace(name, path)
+    previous, active = active, trace
+    try:
+        yield trace
+    finally:
+        active = previous
+        trace.close()
+        last = trace
+        print(trace.format_summary())
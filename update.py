@@ -1,7 +1,7 @@
 import Helper as req
 import json
 
-matches_file = "matches.json"
+matches_file = "matches.log"
 
 with open("info.json", "r") as json_file:
     data = json.load(json_file)